@@ -1,8 +1,9 @@
+import asyncio
 import logging
 import os
 import uuid
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator, Optional
+from typing import AsyncGenerator, AsyncIterator, Optional
 
 from temporalio import workflow
 
@@ -10,15 +11,19 @@ from biosim_server.omex_sim.biosim1.models import BiosimSimulatorSpec, SourceOme
 
 with workflow.unsafe.imports_passed_through():
     from datetime import datetime, UTC
-from pathlib import Path
 
 import dotenv
 import uvicorn
 from fastapi import FastAPI, File, UploadFile, Query, APIRouter, Depends, HTTPException
+from temporalio.client import WorkflowExecutionStatus, WorkflowFailureError
+from temporalio.service import RPCError, RPCStatusCode
 from starlette.middleware.cors import CORSMiddleware
 
+from biosim_server.config import get_settings
 from biosim_server.dependencies import get_biosim_service, get_file_service, get_temporal_client, \
     init_standalone, shutdown_standalone
+from biosim_server.io.file_service import calculate_stream_hash, file_exists
+from biosim_server.omex_verify.omex_archive import OmexArchiveError, known_observables, read_omex_archive_index
 from biosim_server.log_config import setup_logging
 from biosim_server.omex_verify.workflows.omex_verify_workflow import OmexVerifyWorkflow, OmexVerifyWorkflowInput, \
     OmexVerifyWorkflowOutput, OmexVerifyWorkflowStatus
@@ -46,6 +51,7 @@ else:
 MONGO_URI = os.getenv("MONGO_URI")
 GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 APP_TITLE = "bsvs-server"
+OMEX_S3_PREFIX = "verify/omex"
 APP_ORIGINS = [
     'http://127.0.0.1:8000',
     'http://127.0.0.1:4200',
@@ -135,16 +141,37 @@ async def verify(
         observables: Optional[list[str]] = Query(default=None,
                                                  description="List of observables to include in the return data.")
 ) -> OmexVerifyWorkflowOutput:
-    # ---- save omex file to a temporary file and then upload to cloud storage ---- #
-    save_dest = Path(os.path.join(os.getcwd(), "temp"))
-    save_dest.mkdir(parents=True, exist_ok=True)
-    local_temp_path: Path = await save_uploaded_file(uploaded_file, save_dest)
-
+    # ---- store omex file in cloud storage under its content hash, unless already there ---- #
     file_service = get_file_service()
     assert file_service is not None
-    s3_path: str = await file_service.upload_file(local_temp_path, local_temp_path.name)
-    local_temp_path.unlink()
-    logger.info(f"Uploaded file to S3 at {s3_path}")
+    settings = get_settings()
+    content_hash = await calculate_stream_hash(
+        read_uploaded_file(uploaded_file, max_size=settings.max_upload_size, chunk_size=settings.upload_chunk_size))
+
+    # ---- reject archives which can not be verified before storing them or starting any simulation ---- #
+    try:
+        omex_index = await asyncio.to_thread(read_omex_archive_index, uploaded_file.file)
+    except OmexArchiveError as e:
+        raise HTTPException(status_code=400, detail=f"invalid OMEX/COMBINE archive: {e}")
+    if observables:
+        selected_observables = known_observables(omex_index, observables)
+        if len(selected_observables) == 0:
+            raise HTTPException(status_code=400,
+                                detail=f"none of the observables {observables} is reported by the archive")
+        if len(selected_observables) < len(observables):
+            logger.info(f"observables not reported by the archive are ignored: "
+                        f"{[o for o in observables if o not in selected_observables]}")
+        observables = selected_observables
+
+    s3_path = omex_s3_path(content_hash)
+    if await file_exists(file_service, s3_path):
+        logger.info(f"File already in S3 at {s3_path}, skipping upload")
+    else:
+        await uploaded_file.seek(0)
+        chunks = read_uploaded_file(uploaded_file, max_size=settings.max_upload_size,
+                                    chunk_size=settings.upload_chunk_size)
+        full_s3_path: str = await file_service.upload_stream(chunks, s3_path)
+        logger.info(f"Uploaded file to S3 at {full_s3_path}")
 
     # ---- create workflow input ---- #
     simulator_specs: list[BiosimSimulatorSpec] = []
@@ -154,11 +181,11 @@ async def verify(
             simulator_specs.append(BiosimSimulatorSpec(simulator=name, version=version))
         else:
             simulator_specs.append(BiosimSimulatorSpec(simulator=simulator, version=None))
-    source_omex = SourceOmex(omex_s3_file=s3_path, name="name")
+    source_omex = SourceOmex(omex_s3_file=s3_path, name="name", content_hash=content_hash)
     workflow_id = f"{workflow_id_prefix}{uuid.uuid4()}"
     omex_verify_workflow_input = OmexVerifyWorkflowInput(
         workflow_id=workflow_id,
-        source_omex=SourceOmex(omex_s3_file=s3_path, name="name"),
+        source_omex=source_omex,
         user_description=user_description,
         requested_simulators=simulator_specs,
         include_outputs=include_outputs,
@@ -214,14 +241,53 @@ async def get_output(workflow_id: str) -> OmexVerifyWorkflowOutput:
         raise HTTPException(status_code=404, detail=msg)
 
 
-async def save_uploaded_file(uploaded_file2: UploadFile, save_dest: Path) -> Path:
-    """Write `fastapi.UploadFile` instance passed by api gateway user to `save_dest`."""
-    filename = uploaded_file2.filename or (uuid.uuid4().hex + ".omex")
-    file_path = save_dest / filename
-    with open(file_path, 'wb') as file:
-        contents = await uploaded_file2.read()
-        file.write(contents)
-    return file_path
+@app.post(
+    "/cancel/{workflow_id}",
+    response_model=OmexVerifyWorkflowOutput,
+    operation_id='cancel',
+    tags=["Verification"],
+    dependencies=[Depends(get_biosim_service), Depends(get_file_service)],
+    summary='Cancel a verification run and the simulations it started.')
+async def cancel(workflow_id: str) -> OmexVerifyWorkflowOutput:
+    logger.info(f"in post /cancel/{workflow_id}")
+
+    temporal_client = get_temporal_client()
+    assert temporal_client is not None
+    workflow_handle = temporal_client.get_workflow_handle(workflow_id=workflow_id)
+    try:
+        description = await workflow_handle.describe()
+        if description.status == WorkflowExecutionStatus.RUNNING:
+            # the workflow cancels its child workflows, which in turn stop polling and cancel their activities.
+            # cancel() only requests that, wait for the workflow to close so that its output is the final one
+            await workflow_handle.cancel()
+            try:
+                await workflow_handle.result()
+            except WorkflowFailureError as e:
+                logger.info(f"verification job {workflow_id} closed: {e.cause}")
+        workflow_output: OmexVerifyWorkflowOutput = await workflow_handle.query("get_output",
+                                                                                result_type=OmexVerifyWorkflowOutput)
+        return workflow_output
+    except RPCError as e:
+        if e.status == RPCStatusCode.NOT_FOUND:
+            raise HTTPException(status_code=404, detail=f"verification job with id {workflow_id} not found")
+        msg = f"error cancelling verification job with id: {workflow_id}: {e}"
+        logger.error(msg, exc_info=e)
+        raise HTTPException(status_code=500, detail=msg)
+
+
+def omex_s3_path(content_hash: str) -> str:
+    """ archives are content addressed, so resubmitting the same archive reuses the stored copy """
+    return f"{OMEX_S3_PREFIX}/{content_hash}.omex"
+
+
+async def read_uploaded_file(uploaded_file2: UploadFile, max_size: int, chunk_size: int) -> AsyncIterator[bytes]:
+    """Read `fastapi.UploadFile` instance passed by api gateway user in chunks, rejecting files above `max_size`."""
+    total_size = 0
+    while chunk := await uploaded_file2.read(chunk_size):
+        total_size += len(chunk)
+        if total_size > max_size:
+            raise HTTPException(status_code=413, detail=f"uploaded file exceeds the maximum size of {max_size} bytes")
+        yield chunk
 
 
 if __name__ == "__main__":
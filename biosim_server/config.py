@@ -27,11 +27,47 @@ class Settings(BaseSettings):
     storage_tensorstore_driver: TS_DRIVER = "zarr3"
     storage_tensorstore_kvstore_driver: KV_DRIVER = "gcs"
 
-    storage_local_cache_dir: str = ""
+    storage_local_cache_dir: str = ""  # read-through cache of downloaded objects, disabled if empty
+    storage_local_cache_max_size: int = 2 * 1024 * 1024 * 1024
 
     storage_access_key_id: str = ""
     storage_secret: str = ""
     storage_gcs_credentials_file: str = ""
+    storage_max_pool_connections: int = 20
+    storage_connect_timeout: float = 5.0
+    storage_read_timeout: float = 60.0
+    # objects at least this large are uploaded as multipart uploads; downloads larger than one part are
+    # fetched with parallel ranged GETs
+    storage_multipart_threshold: int = 64 * 1024 * 1024
+    storage_multipart_part_size: int = 16 * 1024 * 1024
+    storage_multipart_max_concurrency: int = 4
+    storage_max_concurrent_uploads: int = 4  # result arrays of one run stored at the same time
+    storage_presigned_url_expiry: int = 3600  # seconds
+    # stored result arrays kept in memory by generate_statistics, which reads them again as simulators finish
+    storage_array_cache_max_size: int = 512 * 1024 * 1024
+
+    # largest OMEX archive accepted by /verify
+    max_upload_size: int = 512 * 1024 * 1024
+    upload_chunk_size: int = 1024 * 1024
+
+    api_base_url: str = "https://api.biosimulations.org"
+    simdata_api_base_url: str = "https://simdata.api.biosimulations.org"
+    simulators_api_base_url: str = "https://api.biosimulators.org"
+    biosim_http_max_connections: int = 100
+    biosim_http_max_connections_per_host: int = 20
+    biosim_http_keepalive_timeout: float = 30.0
+    biosim_http_dns_cache_ttl: int = 300
+    biosim_http_connect_timeout: float = 10.0
+    biosim_http_read_timeout: float = 60.0
+    biosim_http_max_concurrent_datasets: int = 4  # datasets of one run fetched at the same time
+    # HDF5 metadata of finished simulation runs, kept in memory (and persisted in storage if enabled)
+    biosim_metadata_cache_max_entries: int = 1000
+    biosim_metadata_cache_ttl: float = 24 * 3600.0
+    biosim_metadata_cache_persist: bool = True
+
+    # Temporal payloads at least this large are zlib compressed (workflow inputs/outputs, query results, history)
+    temporal_payload_compression_threshold: int = 4 * 1024
+    temporal_payload_compression_level: int = 6
 
 
 @lru_cache
@@ -0,0 +1,124 @@
+import dataclasses
+import json
+import zlib
+from typing import Any, Optional, Sequence, Type
+
+import numpy as np
+from numpy.typing import NDArray
+from pydantic import TypeAdapter
+from temporalio.api.common.v1 import Payload
+from temporalio.converter import BinaryNullPayloadConverter, BinaryPlainPayloadConverter, \
+    BinaryProtoPayloadConverter, CompositePayloadConverter, DataConverter, EncodingPayloadConverter, \
+    JSONProtoPayloadConverter, PayloadCodec
+
+from biosim_server.config import get_settings
+from biosim_server.omex_sim.biosim1.models import PAYLOAD_CONTEXT
+
+
+class NumpyPayloadConverter(EncodingPayloadConverter):
+    """ numpy arrays as raw little-endian buffers, with dtype and shape in the payload metadata """
+
+    @property
+    def encoding(self) -> str:
+        return "binary/numpy"
+
+    def to_payload(self, value: Any) -> Optional[Payload]:
+        if not isinstance(value, np.ndarray) or value.dtype.kind not in "biuf":
+            return None
+        array = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+        return Payload(metadata={"encoding": self.encoding.encode(),
+                                 "dtype": array.dtype.str.encode(),
+                                 "shape": json.dumps(list(array.shape)).encode()},
+                       data=array.tobytes())
+
+    def from_payload(self, payload: Payload, type_hint: Optional[Type[Any]] = None) -> NDArray[Any]:
+        dtype = np.dtype(payload.metadata["dtype"].decode())
+        shape = json.loads(payload.metadata["shape"])
+        # copy, frombuffer() would return a read-only view of the payload
+        return np.frombuffer(payload.data, dtype=dtype).reshape(shape).copy()
+
+
+class PydanticJSONPayloadConverter(EncodingPayloadConverter):
+    """
+    JSON (de)serialization with pydantic-core, so dataclasses holding pydantic models (e.g. HDF5File) are validated
+    in one pass. Uses the standard json/plain encoding, payloads stay readable by other Temporal clients.
+    """
+
+    def __init__(self) -> None:
+        self._type_adapters: dict[Any, TypeAdapter[Any]] = {}
+
+    @property
+    def encoding(self) -> str:
+        return "json/plain"
+
+    def to_payload(self, value: Any) -> Optional[Payload]:
+        # serialize with the schema of the value's type (not by inference), so that annotated fields are packed
+        return Payload(metadata={"encoding": self.encoding.encode()},
+                       data=self.type_adapter(type(value)).dump_json(value, context=PAYLOAD_CONTEXT))
+
+    def from_payload(self, payload: Payload, type_hint: Optional[Type[Any]] = None) -> Any:
+        return self.type_adapter(type_hint).validate_json(payload.data, context=PAYLOAD_CONTEXT)
+
+    def type_adapter(self, type_hint: Optional[Type[Any]]) -> TypeAdapter[Any]:
+        key = type_hint if type_hint is not None else Any
+        type_adapter = self._type_adapters.get(key)
+        if type_adapter is None:
+            type_adapter = TypeAdapter(key)
+            self._type_adapters[key] = type_adapter
+        return type_adapter
+
+
+class BiosimPayloadConverter(CompositePayloadConverter):
+    def __init__(self) -> None:
+        super().__init__(
+            BinaryNullPayloadConverter(),
+            BinaryPlainPayloadConverter(),
+            NumpyPayloadConverter(),
+            JSONProtoPayloadConverter(),
+            BinaryProtoPayloadConverter(),
+            PydanticJSONPayloadConverter(),
+        )
+
+
+class CompressionCodec(PayloadCodec):
+    """
+    zlib compression of payloads of at least threshold bytes, smaller payloads are passed through unchanged.
+
+    Compressed payloads wrap the serialized original payload, so its metadata (encoding, dtype, shape) is restored.
+    """
+    ENCODING = b"binary/zlib"
+    threshold: int
+    level: int
+
+    def __init__(self, threshold: int, level: int) -> None:
+        self.threshold = threshold
+        self.level = level
+
+    async def encode(self, payloads: Sequence[Payload]) -> list[Payload]:
+        return [self.compress(payload) for payload in payloads]
+
+    async def decode(self, payloads: Sequence[Payload]) -> list[Payload]:
+        return [self.decompress(payload) for payload in payloads]
+
+    def compress(self, payload: Payload) -> Payload:
+        if len(payload.data) < self.threshold:
+            return payload
+        return Payload(metadata={"encoding": self.ENCODING},
+                       data=zlib.compress(payload.SerializeToString(), self.level))
+
+    def decompress(self, payload: Payload) -> Payload:
+        if payload.metadata.get("encoding") != self.ENCODING:
+            return payload
+        return Payload.FromString(zlib.decompress(payload.data))
+
+
+def create_data_converter() -> DataConverter:
+    settings = get_settings()
+    return dataclasses.replace(DataConverter.default,
+                               payload_converter_class=BiosimPayloadConverter,
+                               payload_codec=CompressionCodec(threshold=settings.temporal_payload_compression_threshold,
+                                                              level=settings.temporal_payload_compression_level))
+
+
+# used by all Temporal clients (and so by the workers), payloads must be readable on both sides
+biosim_data_converter = create_data_converter()
@@ -1,8 +1,14 @@
+from pathlib import Path
+
 from temporalio.client import Client as TemporalClient
 
+from biosim_server.config import get_settings
+from biosim_server.data_converter import biosim_data_converter
 from biosim_server.io.file_service import FileService
 from biosim_server.io.file_service_S3 import FileServiceS3
+from biosim_server.io.file_service_cached import FileServiceCached, LocalFileCache
 from biosim_server.omex_sim.biosim1.biosim_service import BiosimService
+from biosim_server.omex_sim.biosim1.biosim_service_cached import BiosimServiceCached, Hdf5MetadataCache
 from biosim_server.omex_sim.biosim1.biosim_service_rest import BiosimServiceRest
 
 #------ file service (standalone or pytest) ------
@@ -44,17 +50,27 @@ def get_temporal_client() -> TemporalClient | None:
 #------ initialized standalone application (standalone) ------
 
 async def init_standalone() -> None:
-    set_file_service(FileServiceS3())
-    set_biosim_service(BiosimServiceRest())
-    set_temporal_client(await TemporalClient.connect("localhost:7233"))
+    file_service_s3 = FileServiceS3()
+    await file_service_s3.init()
+    settings = get_settings()
+    if settings.storage_local_cache_dir:
+        file_cache = LocalFileCache(Path(settings.storage_local_cache_dir), settings.storage_local_cache_max_size)
+        set_file_service(FileServiceCached(file_service_s3, file_cache))
+    else:
+        set_file_service(file_service_s3)
+    metadata_cache = Hdf5MetadataCache(max_entries=settings.biosim_metadata_cache_max_entries,
+                                       ttl=settings.biosim_metadata_cache_ttl,
+                                       file_service=get_file_service() if settings.biosim_metadata_cache_persist else None)
+    set_biosim_service(BiosimServiceCached(BiosimServiceRest(), metadata_cache))
+    set_temporal_client(await TemporalClient.connect("localhost:7233", data_converter=biosim_data_converter))
 
 async def shutdown_standalone() -> None:
     file_service = get_file_service()
     if file_service:
         await file_service.close()
-    # biosim_service = get_biosim_service()
-    # if biosim_service:
-    #     await biosim_service.close()
+    biosim_service = get_biosim_service()
+    if biosim_service:
+        await biosim_service.close()
     # temporal_client = get_temporal_client()
     # if temporal_client:
     #     await temporal_client.close()
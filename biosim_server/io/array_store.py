@@ -0,0 +1,67 @@
+import io
+from collections import OrderedDict
+
+import numpy as np
+from numpy.typing import NDArray
+
+from biosim_server.io.file_service import FileService
+from biosim_server.io.keyed_lock import KeyedLock
+
+
+def ndarray_to_bytes(array: NDArray[np.float64]) -> bytes:
+    """ serialize as a .npy blob: a small header with dtype and shape followed by the raw little-endian values """
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array, dtype="<f8"), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def ndarray_from_bytes(contents: bytes) -> NDArray[np.float64]:
+    array: NDArray[np.float64] = np.load(io.BytesIO(contents), allow_pickle=False)
+    return array
+
+
+async def save_ndarray(file_service: FileService, array: NDArray[np.float64], s3_path: str) -> str:
+    return await file_service.upload_bytes(ndarray_to_bytes(array), s3_path)
+
+
+async def load_ndarray(file_service: FileService, s3_path: str) -> NDArray[np.float64]:
+    return ndarray_from_bytes(await file_service.get_file_contents(s3_path))
+
+
+class NdarrayCache:
+    """
+    In-memory LRU of arrays loaded with load_ndarray(), keyed by s3 path, bounded to max_size bytes.
+
+    Stored results are written once and read many times (e.g. every simulator is compared again as the others
+    finish), so entries are not invalidated. Cached arrays are shared between callers and therefore read-only.
+    """
+    max_size: int
+    size: int
+    hits: int
+    misses: int
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._arrays: OrderedDict[str, NDArray[np.float64]] = OrderedDict()
+        self._locks: KeyedLock[str] = KeyedLock()
+
+    async def load(self, file_service: FileService, s3_path: str) -> NDArray[np.float64]:
+        async with self._locks.acquire(s3_path):
+            array = self._arrays.get(s3_path)
+            if array is not None:
+                self.hits += 1
+                self._arrays.move_to_end(s3_path)
+                return array
+            self.misses += 1
+            array = await load_ndarray(file_service, s3_path)
+            array.flags.writeable = False
+            if array.nbytes <= self.max_size:
+                self._arrays[s3_path] = array
+                self.size += array.nbytes
+                while self.size > self.max_size:
+                    _, evicted = self._arrays.popitem(last=False)
+                    self.size -= evicted.nbytes
+            return array
@@ -6,7 +6,7 @@ from temporalio import workflow
 with workflow.unsafe.imports_passed_through():
     from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional
 import aiofiles
 import hashlib
 
@@ -18,17 +18,32 @@ class ListingItem:
     Size: int
 
 
-async def calculate_file_md5(local_filepath: Path) -> str:
-    hasher = hashlib.md5()
+async def read_file_chunks(local_filepath: Path, chunk_size: int = 8192) -> AsyncIterator[bytes]:
     async with aiofiles.open(local_filepath, 'rb') as f:
-        while True:
-            chunk = await f.read(8192)
-            if not chunk:
-                break
-            hasher.update(chunk)
+        while chunk := await f.read(chunk_size):
+            yield chunk
+
+
+async def calculate_stream_hash(chunks: AsyncIterator[bytes], algorithm: str = "sha256") -> str:
+    hasher = hashlib.new(algorithm)
+    async for chunk in chunks:
+        hasher.update(chunk)
     return hasher.hexdigest()
 
 
+async def calculate_file_md5(local_filepath: Path) -> str:
+    return await calculate_stream_hash(read_file_chunks(local_filepath), algorithm="md5")
+
+
+async def file_exists(file_service: "FileService", s3_path: str) -> bool:
+    """ a single metadata request (HEAD for S3), the object itself is not read """
+    try:
+        await file_service.get_modified_date(s3_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
 class FileService(ABC):
 
     @abstractmethod
@@ -43,10 +58,24 @@ class FileService(ABC):
     async def upload_bytes(self, file_contents: bytes, s3_path: str) -> str:
         pass
 
+    @abstractmethod
+    async def upload_stream(self, chunks: AsyncIterator[bytes], s3_path: str) -> str:
+        pass
+
     @abstractmethod
     async def get_modified_date(self, s3_path: str) -> datetime:
         pass
 
+    @abstractmethod
+    async def get_etag(self, s3_path: str) -> str:
+        """ changes whenever the contents of the object change """
+        pass
+
+    @abstractmethod
+    async def get_download_url(self, s3_path: str) -> Optional[str]:
+        """ a URL from which external services can fetch the object, or None if there is none """
+        pass
+
     @abstractmethod
     async def get_listing(self, s3_path: str) -> list[ListingItem]:
         pass
@@ -1,19 +1,26 @@
 import logging
 import uuid
+from contextlib import AsyncExitStack
 from temporalio import workflow
 with workflow.unsafe.imports_passed_through():
     from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 from typing_extensions import override
 
+from biosim_server.config import get_settings
 from biosim_server.io.file_service import FileService, ListingItem
 from biosim_server.io.s3_aiobotocore import (
+    S3Client,
+    create_s3_client,
     download_s3_file,
+    get_s3_etag,
     get_s3_modified_date,
+    get_s3_presigned_url,
     get_listing_of_s3_path,
     upload_bytes_to_s3,
+    upload_stream_to_s3,
     upload_file_to_s3,
     get_s3_file_contents
 )
@@ -21,35 +28,64 @@ from biosim_server.io.s3_aiobotocore import (
 logger = logging.getLogger(__name__)
 
 class FileServiceS3(FileService):
+    """
+    File service backed by S3 compatible storage.
+
+    init() opens one long-lived client (with its connection pool) which is shared by all operations
+    until close(); without init() every operation creates a temporary client.
+    """
+    _exit_stack: AsyncExitStack | None = None
+    _s3_client: S3Client | None = None
+
+    async def init(self) -> None:
+        if self._s3_client is not None:
+            return
+        self._exit_stack = AsyncExitStack()
+        self._s3_client = await self._exit_stack.enter_async_context(create_s3_client())
 
     @override
     async def download_file(self, s3_path: str, file_path: Optional[Path]=None) -> tuple[str, str]:
         if file_path is None:
             file_path = Path(__file__).parent / ("temp_file_"+uuid.uuid4().hex)
-        full_s3_path = await download_s3_file(s3_path, file_path)
+        full_s3_path = await download_s3_file(s3_path, file_path, s3_client=self._s3_client)
         return full_s3_path, str(file_path)
 
     @override
     async def upload_file(self, file_path: Path, s3_path: str) -> str:
-        return await upload_file_to_s3(file_path, s3_path)
+        return await upload_file_to_s3(file_path, s3_path, s3_client=self._s3_client)
 
     @override
     async def upload_bytes(self, file_contents: bytes, s3_path: str) -> str:
-        return await upload_bytes_to_s3(file_contents, s3_path)
+        return await upload_bytes_to_s3(file_contents, s3_path, s3_client=self._s3_client)
+
+    @override
+    async def upload_stream(self, chunks: AsyncIterator[bytes], s3_path: str) -> str:
+        return await upload_stream_to_s3(chunks, s3_path, s3_client=self._s3_client)
 
     @override
     async def get_modified_date(self, s3_path: str) -> datetime:
-        return await get_s3_modified_date(s3_path)
+        return await get_s3_modified_date(s3_path, s3_client=self._s3_client)
+
+    @override
+    async def get_etag(self, s3_path: str) -> str:
+        return await get_s3_etag(s3_path, s3_client=self._s3_client)
+
+    @override
+    async def get_download_url(self, s3_path: str) -> Optional[str]:
+        return await get_s3_presigned_url(s3_path, expires_in=get_settings().storage_presigned_url_expiry,
+                                          s3_client=self._s3_client)
 
     @override
     async def get_listing(self, s3_path: str) -> list[ListingItem]:
-        return await get_listing_of_s3_path(s3_path)
+        return await get_listing_of_s3_path(s3_path, s3_client=self._s3_client)
 
     @override
     async def get_file_contents(self, s3_path: str) -> bytes:
-        return await get_s3_file_contents(s3_path)
+        return await get_s3_file_contents(s3_path, s3_client=self._s3_client)
 
     @override
     async def close(self) -> None:
-        # nothing to close here
-        pass
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+        self._exit_stack = None
+        self._s3_client = None
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from temporalio import workflow
+with workflow.unsafe.imports_passed_through():
+    from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import aiofiles
+from typing_extensions import override
+
+from biosim_server.io.file_service import FileService, ListingItem
+from biosim_server.io.keyed_lock import KeyedLock
+
+logger = logging.getLogger(__name__)
+
+TEMP_FILE_PREFIX = "temp_file_"
+
+T = TypeVar("T")
+
+
+class LocalFileCache:
+    """
+    Size bounded directory of downloaded objects, keyed by object key and ETag.
+
+    Entries are written to a temporary file and renamed into place, so concurrent readers (also in other worker
+    processes sharing the directory) never see a partial file. Reading an entry refreshes its modification time,
+    and the least recently used entries are evicted once the directory grows beyond max_size bytes.
+    """
+    cache_dir: Path
+    max_size: int
+
+    def __init__(self, cache_dir: Path, max_size: int) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._locks: KeyedLock[Path] = KeyedLock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def entry_path(self, s3_path: str, etag: str) -> Path:
+        return self.cache_dir / hashlib.sha256(f"{s3_path}\n{etag}".encode()).hexdigest()
+
+    async def get_or_fill(self, s3_path: str, etag: str, file_service: FileService) -> Path:
+        """ path of the cached copy of s3_path, downloaded with file_service only if not already cached """
+        entry_path = self.entry_path(s3_path, etag)
+        # activities of the same worker wait for a download in progress instead of starting another one
+        async with self._locks.acquire(entry_path):
+            try:
+                os.utime(entry_path)
+                return entry_path
+            except FileNotFoundError:
+                pass  # not cached, or just evicted
+            temp_path = self.cache_dir / f"{TEMP_FILE_PREFIX}{uuid.uuid4().hex}"
+            try:
+                await file_service.download_file(s3_path, temp_path)
+                os.replace(temp_path, entry_path)
+            finally:
+                temp_path.unlink(missing_ok=True)
+            logger.info(f"cached {s3_path} at {entry_path}")
+        await asyncio.to_thread(self.evict, entry_path)
+        return entry_path
+
+    def evict(self, keep_path: Path) -> None:
+        """ remove least recently used entries (except keep_path) until the cache fits in max_size """
+        entries: list[tuple[float, int, Path]] = []
+        for path in self.cache_dir.iterdir():
+            if path.name.startswith(TEMP_FILE_PREFIX):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if path == keep_path:
+                continue
+            path.unlink(missing_ok=True)
+            total_size -= size
+            logger.info(f"evicted {path} from the file cache")
+
+
+class FileServiceCached(FileService):
+    """
+    Read-through local cache in front of another file service.
+
+    Reads cost one ETag lookup when the object is already cached. Writes go straight to the wrapped service, which
+    changes the ETag and so retires any cached copy.
+    """
+    file_service: FileService
+    file_cache: LocalFileCache
+
+    def __init__(self, file_service: FileService, file_cache: LocalFileCache) -> None:
+        self.file_service = file_service
+        self.file_cache = file_cache
+
+    @override
+    async def download_file(self, s3_path: str, file_path: Optional[Path]=None) -> tuple[str, str]:
+        if file_path is None:
+            file_path = Path(tempfile.gettempdir()) / (TEMP_FILE_PREFIX + uuid.uuid4().hex)
+        local_path = file_path
+
+        async def copy_entry(entry_path: Path) -> tuple[str, str]:
+            # callers own (and usually delete) the returned file, so they get a copy of the cached entry
+            await asyncio.to_thread(shutil.copyfile, entry_path, local_path)
+            return s3_path, str(local_path)
+
+        async def download() -> tuple[str, str]:
+            return await self.file_service.download_file(s3_path, local_path)
+
+        return await self.read_entry(s3_path, copy_entry, download)
+
+    @override
+    async def get_file_contents(self, s3_path: str) -> bytes:
+        async def read_contents(entry_path: Path) -> bytes:
+            async with aiofiles.open(entry_path, mode='rb') as f:
+                contents: bytes = await f.read()
+                return contents
+
+        async def download() -> bytes:
+            return await self.file_service.get_file_contents(s3_path)
+
+        return await self.read_entry(s3_path, read_contents, download)
+
+    async def read_entry(self, s3_path: str, read: Callable[[Path], Awaitable[T]],
+                         read_uncached: Callable[[], Awaitable[T]]) -> T:
+        """ read the cached copy of s3_path, an entry evicted before it is read counts as a miss """
+        etag = await self.file_service.get_etag(s3_path)
+        entry_path = await self.file_cache.get_or_fill(s3_path, etag, self.file_service)
+        try:
+            return await read(entry_path)
+        except FileNotFoundError:
+            logger.info(f"cached copy of {s3_path} was evicted before it was read, reading it uncached")
+            return await read_uncached()
+
+    @override
+    async def upload_file(self, file_path: Path, s3_path: str) -> str:
+        return await self.file_service.upload_file(file_path, s3_path)
+
+    @override
+    async def upload_bytes(self, file_contents: bytes, s3_path: str) -> str:
+        return await self.file_service.upload_bytes(file_contents, s3_path)
+
+    @override
+    async def upload_stream(self, chunks: AsyncIterator[bytes], s3_path: str) -> str:
+        return await self.file_service.upload_stream(chunks, s3_path)
+
+    @override
+    async def get_modified_date(self, s3_path: str) -> datetime:
+        return await self.file_service.get_modified_date(s3_path)
+
+    @override
+    async def get_etag(self, s3_path: str) -> str:
+        return await self.file_service.get_etag(s3_path)
+
+    @override
+    async def get_download_url(self, s3_path: str) -> Optional[str]:
+        return await self.file_service.get_download_url(s3_path)
+
+    @override
+    async def get_listing(self, s3_path: str) -> list[ListingItem]:
+        return await self.file_service.get_listing(s3_path)
+
+    @override
+    async def close(self) -> None:
+        await self.file_service.close()
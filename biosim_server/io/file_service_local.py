@@ -5,7 +5,7 @@ from temporalio import workflow
 with workflow.unsafe.imports_passed_through():
     from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
 import aiofiles
 from typing_extensions import override
@@ -70,12 +70,38 @@ class FileServiceLocal(FileService):
         self.s3_files_written.append(s3_file_path)
         return str(s3_file_path)
 
+    @override
+    async def upload_stream(self, chunks: AsyncIterator[bytes], s3_path: str) -> str:
+        # copy the chunks to mock s3 as they arrive
+        s3_file_path = self.BASE_DIR / s3_path
+        s3_file_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            async with aiofiles.open(s3_file_path, mode='wb') as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+        except BaseException:
+            s3_file_path.unlink(missing_ok=True)
+            raise
+        self.s3_files_written.append(s3_file_path)
+        return str(s3_file_path)
+
     @override
     async def get_modified_date(self, s3_path: str) -> datetime:
         # get the modified date of the file in mock s3
         s3_file_path = self.BASE_DIR / s3_path
         return datetime.fromtimestamp(s3_file_path.stat().st_mtime)
 
+    @override
+    async def get_etag(self, s3_path: str) -> str:
+        # modification time and size of the file in mock s3
+        stat = (self.BASE_DIR / s3_path).stat()
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    @override
+    async def get_download_url(self, s3_path: str) -> Optional[str]:
+        # files in mock s3 are not reachable from outside
+        return None
+
     @override
     async def get_listing(self, s3_path: str) -> List[ListingItem]:
         # get the listing of the directory in mock s3
@@ -0,0 +1,42 @@
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+@dataclass
+class _KeyedLockEntry:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    users: int = 0  # tasks holding or waiting for the lock
+
+
+class KeyedLock(Generic[K]):
+    """
+    One asyncio.Lock per key, e.g. so that concurrent requests for the same cache entry wait for one fetch.
+
+    A key's lock is kept while any task holds or waits for it, and dropped when the last one is done, so a task
+    arriving while others still wait always joins the same lock.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[K, _KeyedLockEntry] = {}
+
+    @asynccontextmanager
+    async def acquire(self, key: K) -> AsyncIterator[None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _KeyedLockEntry()
+            self._entries[key] = entry
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,12 +1,15 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from temporalio import workflow
 with workflow.unsafe.imports_passed_through():
     from datetime import datetime
 from pathlib import Path
+from typing import Any, AsyncIterator, Iterable, Optional, TypeAlias
 
 import aiofiles
 from aiobotocore.config import AioConfig
-from aiobotocore.session import AioSession
+from aiobotocore.session import AioSession, ClientCreatorContext
 from botocore.exceptions import ClientError
 
 from biosim_server.config import get_settings
@@ -14,81 +17,285 @@ from biosim_server.io.file_service import ListingItem
 
 logger = logging.getLogger(__name__)
 
+# the s3 client methods are generated at runtime, so the client is not statically typed
+S3Client: TypeAlias = Any
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_MULTIPART_PART_SIZE = 5 * 1024 * 1024
+# a download is started over this many times if the object is replaced while its ranges are fetched
+MAX_DOWNLOAD_ATTEMPTS = 3
 
-async def download_s3_file(s3_path: str, file_path: Path) -> str:
-    logger.info(f"Downloading {s3_path} to {file_path}")
-    session = AioSession()
 
+def create_s3_client(session: Optional[AioSession] = None) -> "ClientCreatorContext[S3Client]":
+    """
+    Client context for the configured storage. A client holds its own connection pool (up to
+    storage_max_pool_connections) and resolved credentials, so it should be kept open and reused.
+    """
+    settings = get_settings()
+    config = AioConfig(connect_timeout=settings.storage_connect_timeout,
+                       read_timeout=settings.storage_read_timeout,
+                       max_pool_connections=settings.storage_max_pool_connections)
+    return (session or AioSession()).create_client(
+        service_name='s3',
+        config=config,
+        endpoint_url=settings.storage_endpoint_url,
+        aws_access_key_id=settings.storage_access_key_id,
+        aws_secret_access_key=settings.storage_secret)
+
+
+@asynccontextmanager
+async def s3_client_scope(s3_client: Optional[S3Client]) -> AsyncIterator[S3Client]:
+    """ use the given long-lived client, or a temporary one if none is given """
+    if s3_client is not None:
+        yield s3_client
+    else:
+        async with create_s3_client() as temp_s3_client:
+            yield temp_s3_client
+
+
+class ObjectChangedError(IOError):
+    """ the object was replaced between two ranged GETs of one download (412 on If-Match) """
+
+
+async def download_s3_file(s3_path: str, file_path: Path, s3_client: Optional[S3Client] = None) -> str:
+    """
+    Download an object with a single GET of its first storage_multipart_part_size bytes, which also tells the
+    object size (Content-Range) and version (ETag); the rest of a larger object is fetched with parallel ranged
+    GETs of that version, starting over if the object is replaced meanwhile.
+    """
+    logger.info(f"Downloading {s3_path} to {file_path}")
     settings = get_settings()
-    config = AioConfig(connect_timeout=1, read_timeout=1)
     bucket_name = settings.storage_bucket
 
-    async with session.create_client(
-            service_name='s3',
-            config=config,
-            endpoint_url=settings.storage_endpoint_url,
-            aws_access_key_id=settings.storage_access_key_id,
-            aws_secret_access_key=settings.storage_secret) as s3_client:
-        obj = await s3_client.get_object(Bucket=bucket_name, Key=s3_path)
+    async with s3_client_scope(s3_client) as client:
+        for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
+            try:
+                await download_object(client, bucket_name, s3_path, file_path)
+                break
+            except ObjectChangedError:
+                if attempt == MAX_DOWNLOAD_ATTEMPTS:
+                    raise
+                logger.warning(f"{s3_path} changed while it was downloaded, starting over")
+        return f"{settings.storage_endpoint_url}/{settings.storage_bucket}/{s3_path}"
+
+
+async def download_object(client: S3Client, bucket_name: str, s3_path: str, file_path: Path) -> None:
+    try:
+        first_part = await client.get_object(Bucket=bucket_name, Key=s3_path,
+                                             Range=f"bytes=0-{multipart_part_size() - 1}")
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+            raise
+        # range requests of empty objects are rejected
+        async with aiofiles.open(file_path, mode='wb'):
+            pass
+        return
+
+    content_range: Optional[str] = first_part.get('ContentRange')
+    if content_range is None:
+        # the whole object came back (the range was ignored)
         async with aiofiles.open(file_path, mode='wb') as f:
-            async for chunk in obj['Body'].iter_chunks():
+            async for chunk in first_part['Body'].iter_chunks():
                 await f.write(chunk)
-        settings = get_settings()
-        return f"{settings.storage_endpoint_url}/{settings.storage_bucket}/{s3_path}"
+    else:
+        size = int(content_range.rsplit("/", 1)[1])
+        await ranged_download(client, bucket_name, s3_path, size, file_path, first_part=first_part)
 
 
-async def upload_file_to_s3(file_path: Path, s3_path: str) -> str:
-    logger.info(f"Uploading {file_path} to {s3_path}")
-    session = AioSession()
+async def ranged_download(client: S3Client, bucket_name: str, s3_path: str, size: int, file_path: Path,
+                          first_part: Optional[dict[str, Any]] = None) -> None:
+    """
+    Download an object of the given size with concurrent byte-range GETs.
+
+    The local file is preallocated and each range of storage_multipart_part_size bytes is streamed to its offset,
+    with at most storage_multipart_max_concurrency ranges in flight. first_part is the response of an already
+    requested first range, if any; otherwise the first range is requested before the others. The other ranges
+    are only served from the version (ETag) of the first one.
 
+    :raises ObjectChangedError: if the object was replaced after its first range was requested
+    """
+    settings = get_settings()
+    part_size = multipart_part_size()
+    semaphore = asyncio.Semaphore(max(settings.storage_multipart_max_concurrency, 1))
+
+    async with aiofiles.open(file_path, mode='wb') as f:
+        await f.truncate(size)
+
+    if first_part is None:
+        first_part = await client.get_object(Bucket=bucket_name, Key=s3_path,
+                                             Range=f"bytes=0-{min(part_size, size) - 1}")
+    first_range = first_part
+    if_match: dict[str, str] = {'IfMatch': first_range['ETag']} if first_range.get('ETag') else {}
+
+    async def download_range(offset: int) -> None:
+        async with semaphore:
+            end = min(offset + part_size, size) - 1
+            if offset == 0:
+                obj = first_range
+            else:
+                try:
+                    obj = await client.get_object(Bucket=bucket_name, Key=s3_path, Range=f"bytes={offset}-{end}",
+                                                  **if_match)
+                except ClientError as e:
+                    if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', '412'):
+                        raise
+                    raise ObjectChangedError(f"{s3_path} changed while it was downloaded") from e
+            # each range opens its own handle so that concurrent ranges do not share a file position
+            async with aiofiles.open(file_path, mode='r+b') as part_file:
+                await part_file.seek(offset)
+                async for chunk in obj['Body'].iter_chunks():
+                    await part_file.write(chunk)
+
+    tasks = [asyncio.create_task(download_range(offset)) for offset in range(0, size, part_size)]
+    try:
+        await asyncio.gather(*tasks)
+        logger.info(f"Downloaded {size} bytes from {s3_path} in {len(tasks)} ranges")
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def upload_file_to_s3(file_path: Path, s3_path: str, s3_client: Optional[S3Client] = None) -> str:
+    logger.info(f"Uploading {file_path} to {s3_path}")
     settings = get_settings()
-    config = AioConfig(connect_timeout=1, read_timeout=1)
     bucket_name = settings.storage_bucket
 
-    async with session.create_client(
-            service_name='s3',
-            config=config,
-            endpoint_url=settings.storage_endpoint_url,
-            aws_access_key_id=settings.storage_access_key_id,
-            aws_secret_access_key=settings.storage_secret) as s3_client:
-        async with aiofiles.open(file_path, mode='rb') as f:
-            await s3_client.put_object(Bucket=bucket_name, Key=s3_path, Body=await f.read())
+    async with s3_client_scope(s3_client) as client:
+        if file_path.stat().st_size >= settings.storage_multipart_threshold:
+            await multipart_upload(client, bucket_name, s3_path, read_file_parts(file_path, multipart_part_size()))
+        else:
+            async with aiofiles.open(file_path, mode='rb') as f:
+                await client.put_object(Bucket=bucket_name, Key=s3_path, Body=await f.read())
         return f"{settings.storage_endpoint_url}/{settings.storage_bucket}/{s3_path}"
 
 
-async def upload_bytes_to_s3(file_contents: bytes, s3_path: str) -> str:
+async def upload_bytes_to_s3(file_contents: bytes, s3_path: str, s3_client: Optional[S3Client] = None) -> str:
     logger.info(f"Uploading {len(file_contents)} bytes to {s3_path}")
-    session = AioSession()
+    settings = get_settings()
+    bucket_name = settings.storage_bucket
+
+    async with s3_client_scope(s3_client) as client:
+        if len(file_contents) >= settings.storage_multipart_threshold:
+            part_size = multipart_part_size()
+            parts = (file_contents[offset:offset + part_size] for offset in range(0, len(file_contents), part_size))
+            await multipart_upload(client, bucket_name, s3_path, iterate_async(parts))
+        else:
+            await client.put_object(Bucket=bucket_name, Key=s3_path, Body=file_contents)
+        return f"{settings.storage_endpoint_url}/{settings.storage_bucket}/{s3_path}"
 
+
+async def upload_stream_to_s3(chunks: AsyncIterator[bytes], s3_path: str, s3_client: Optional[S3Client] = None) -> str:
+    """ upload a stream of unknown length, as a single PUT if it fits in one part and as a multipart upload if not """
+    logger.info(f"Uploading stream to {s3_path}")
     settings = get_settings()
-    config = AioConfig(connect_timeout=1, read_timeout=1)
     bucket_name = settings.storage_bucket
 
-    async with session.create_client(
-            service_name='s3',
-            config=config,
-            endpoint_url=settings.storage_endpoint_url,
-            aws_access_key_id=settings.storage_access_key_id,
-            aws_secret_access_key=settings.storage_secret) as s3_client:
-        await s3_client.put_object(Bucket=bucket_name, Key=s3_path, Body=file_contents)
+    parts = regroup_chunks(chunks, multipart_part_size())
+    first_part = await anext(parts, b"")
+    second_part = await anext(parts, None)
+    async with s3_client_scope(s3_client) as client:
+        if second_part is None:
+            await client.put_object(Bucket=bucket_name, Key=s3_path, Body=first_part)
+        else:
+            await multipart_upload(client, bucket_name, s3_path, chain_async([first_part, second_part], parts))
         return f"{settings.storage_endpoint_url}/{settings.storage_bucket}/{s3_path}"
 
 
+async def multipart_upload(client: S3Client, bucket_name: str, s3_path: str, parts: AsyncIterator[bytes]) -> None:
+    """
+    Upload an object as a multipart upload, one part per item of parts (all but the last at least 5 MiB).
+
+    The next part is only pulled from parts once one of the storage_multipart_max_concurrency upload slots is free,
+    so the memory used is bounded no matter how large the object is.
+    If any part fails the upload is aborted so that S3 does not keep the orphaned parts.
+    """
+    settings = get_settings()
+    semaphore = asyncio.Semaphore(max(settings.storage_multipart_max_concurrency, 1))
+
+    response = await client.create_multipart_upload(Bucket=bucket_name, Key=s3_path)
+    upload_id: str = response['UploadId']
+
+    async def upload_part(part_number: int, body: bytes) -> dict[str, Any]:
+        try:
+            part = await client.upload_part(Bucket=bucket_name, Key=s3_path, UploadId=upload_id,
+                                            PartNumber=part_number, Body=body)
+            return {'PartNumber': part_number, 'ETag': part['ETag']}
+        finally:
+            semaphore.release()
+
+    tasks: list[asyncio.Task[dict[str, Any]]] = []
+    try:
+        size = 0
+        while True:
+            # hold an upload slot before pulling the next part, so at most one part per slot is in memory
+            await semaphore.acquire()
+            # stop reading as soon as an earlier part has failed
+            for task in tasks:
+                if task.done():
+                    task.result()
+            body = await anext(parts, None)
+            if body is None:
+                semaphore.release()
+                break
+            size += len(body)
+            tasks.append(asyncio.create_task(upload_part(len(tasks) + 1, body)))
+        completed_parts = await asyncio.gather(*tasks)
+        await client.complete_multipart_upload(Bucket=bucket_name, Key=s3_path, UploadId=upload_id,
+                                               MultipartUpload={'Parts': completed_parts})
+        logger.info(f"Uploaded {size} bytes to {s3_path} in {len(completed_parts)} parts")
+    except BaseException:
+        logger.warning(f"Aborting multipart upload of {s3_path}")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await client.abort_multipart_upload(Bucket=bucket_name, Key=s3_path, UploadId=upload_id)
+        raise
+
+
+def multipart_part_size() -> int:
+    return max(get_settings().storage_multipart_part_size, MIN_MULTIPART_PART_SIZE)
+
+
+async def read_file_parts(file_path: Path, part_size: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(file_path, mode='rb') as f:
+        while part := await f.read(part_size):
+            yield part
+
+
+async def regroup_chunks(chunks: AsyncIterator[bytes], part_size: int) -> AsyncIterator[bytes]:
+    """ regroup chunks of arbitrary size into parts of exactly part_size bytes (except the last) """
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if len(buffer) > 0:
+        yield bytes(buffer)
+
+
+async def iterate_async(items: Iterable[bytes]) -> AsyncIterator[bytes]:
+    for item in items:
+        yield item
+
+
+async def chain_async(first: Iterable[bytes], rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    for item in first:
+        yield item
+    async for item in rest:
+        yield item
+
+
 # download file contents from s3 as bytes
-async def get_s3_file_contents(s3_path: str) -> bytes:
+async def get_s3_file_contents(s3_path: str, s3_client: Optional[S3Client] = None) -> bytes:
     logger.info(f"Downloading {s3_path} as bytes")
-    session = AioSession()
     settings = get_settings()
-    config = AioConfig(connect_timeout=1, read_timeout=1)
-
-    async with session.create_client(
-            service_name='s3',
-            config=config,
-            endpoint_url=settings.storage_endpoint_url,
-            aws_access_key_id=settings.storage_access_key_id,
-            aws_secret_access_key=settings.storage_secret) as s3_client:
+
+    async with s3_client_scope(s3_client) as client:
         try:
-            obj = await s3_client.get_object(Bucket=settings.storage_bucket, Key=s3_path)
+            obj = await client.get_object(Bucket=settings.storage_bucket, Key=s3_path)
             contents: bytes = await obj['Body'].read()
             return contents
         except ClientError as e:
@@ -100,45 +307,54 @@ async def get_s3_file_contents(s3_path: str) -> bytes:
                 raise e
 
 
-async def get_s3_modified_date(s3_path: str) -> datetime:
+async def get_s3_modified_date(s3_path: str, s3_client: Optional[S3Client] = None) -> datetime:
     logger.info(f"Retrieving LastModified from {s3_path}")
-    session = AioSession()
+    response = await head_s3_object(s3_path, s3_client=s3_client)
+    last_modified: datetime = response['LastModified']
+    return last_modified
+
+
+async def get_s3_etag(s3_path: str, s3_client: Optional[S3Client] = None) -> str:
+    logger.info(f"Retrieving ETag from {s3_path}")
+    response = await head_s3_object(s3_path, s3_client=s3_client)
+    etag: str = response['ETag']
+    return etag
+
+
+async def get_s3_presigned_url(s3_path: str, expires_in: int, s3_client: Optional[S3Client] = None) -> str:
+    logger.info(f"Creating presigned URL for {s3_path}")
     settings = get_settings()
-    config = AioConfig(connect_timeout=1, read_timeout=1)
-
-    async with session.create_client(
-            service_name='s3',
-            config=config,
-            endpoint_url=settings.storage_endpoint_url,
-            aws_access_key_id=settings.storage_access_key_id,
-            aws_secret_access_key=settings.storage_secret) as s3_client:
+
+    async with s3_client_scope(s3_client) as client:
+        url: str = await client.generate_presigned_url('get_object',
+                                                       Params={'Bucket': settings.storage_bucket, 'Key': s3_path},
+                                                       ExpiresIn=expires_in)
+        return url
+
+
+async def head_s3_object(s3_path: str, s3_client: Optional[S3Client] = None) -> dict[str, Any]:
+    settings = get_settings()
+
+    async with s3_client_scope(s3_client) as client:
         try:
-            response = await s3_client.get_object(Bucket=settings.storage_bucket, Key=s3_path)
-            last_modified: datetime = response['LastModified']
-            return last_modified
+            response: dict[str, Any] = await client.head_object(Bucket=settings.storage_bucket, Key=s3_path)
+            return response
         except ClientError as e:
-            if e.response['Error']['Code'] == "NoSuchKey":
-                logger.info(f"failed to retrieve modified date: {str(e)}")
+            if e.response['Error']['Code'] in ("NoSuchKey", "404"):
+                logger.info(f"failed to retrieve object metadata: {str(e)}")
                 raise FileNotFoundError(f"File {s3_path} not found in S3")
             else:
                 logger.exception(e)
                 raise e
 
 
-async def get_listing_of_s3_path(s3_path: str) -> list[ListingItem]:
+async def get_listing_of_s3_path(s3_path: str, s3_client: Optional[S3Client] = None) -> list[ListingItem]:
     logger.info(f"Retrieving file list from {s3_path}")
-    session = AioSession()
     settings = get_settings()
-    config = AioConfig(connect_timeout=1, read_timeout=1)
 
     files: list[ListingItem] = []
-    async with session.create_client(
-            service_name='s3',
-            config=config,
-            endpoint_url=settings.storage_endpoint_url,
-            aws_access_key_id=settings.storage_access_key_id,
-            aws_secret_access_key=settings.storage_secret) as s3_client:
-        paginator = s3_client.get_paginator("list_objects")
+    async with s3_client_scope(s3_client) as client:
+        paginator = client.get_paginator("list_objects")
         async for result in paginator.paginate(Bucket=settings.storage_bucket, Prefix=s3_path):
             for c in result.get('Contents', []):
                 last_modified: datetime = c['LastModified']
@@ -1,5 +1,9 @@
 import logging
 from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
 
 from biosim_server.omex_sim.biosim1.models import BiosimSimulationRun, HDF5File, Hdf5DataValues, BiosimSimulationRunStatus, BiosimSimulatorSpec
 
@@ -15,6 +19,19 @@ class BiosimService(ABC):
     async def run_biosim_sim(self, local_omex_path: str, omex_name: str, simulator_spec: BiosimSimulatorSpec) -> BiosimSimulationRun:
         pass
 
+    @abstractmethod
+    async def run_biosim_sim_from_url(self, omex_url: str, omex_name: str, simulator_spec: BiosimSimulatorSpec) -> BiosimSimulationRun:
+        pass
+
+    @abstractmethod
+    async def cancel_sim_run(self, simulation_run_id: str) -> bool:
+        """ ask biosimulations to stop the run, returns False if that is not possible """
+        pass
+
+    @abstractmethod
+    async def get_latest_simulator_version(self, simulator: str) -> str:
+        pass
+
     @abstractmethod
     async def get_hdf5_metadata(self, simulation_run_id: str) -> HDF5File:
         pass
@@ -23,6 +40,15 @@ class BiosimService(ABC):
     async def get_hdf5_data(self, simulation_run_id: str, dataset_name: str) -> Hdf5DataValues:
         pass
 
+    @abstractmethod
+    async def get_hdf5_datasets(self, simulation_run_id: str,
+                                dataset_names: list[str]) -> dict[str, NDArray[np.float64]]:
+        pass
+
+    @abstractmethod
+    async def download_hdf5_file(self, hdf5_file_uri: str, local_path: Path) -> None:
+        pass
+
     @abstractmethod
     async def close(self) -> None:
         pass
@@ -0,0 +1,163 @@
+import logging
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+from typing_extensions import override
+
+from biosim_server.io.file_service import FileService, file_exists
+from biosim_server.io.keyed_lock import KeyedLock
+from biosim_server.omex_sim.biosim1.biosim_service import BiosimService
+from biosim_server.omex_sim.biosim1.models import BiosimSimulationRun, BiosimSimulatorSpec, HDF5File, \
+    Hdf5DataValues
+
+logger = logging.getLogger(__name__)
+
+HDF5_METADATA_S3_PREFIX = "verify/hdf5_metadata"
+
+
+def hdf5_metadata_s3_path(simulation_run_id: str) -> str:
+    return f"{HDF5_METADATA_S3_PREFIX}/{simulation_run_id}.json"
+
+
+class Hdf5MetadataCache:
+    """
+    Process-wide cache of the HDF5File metadata of simulation runs, keyed by simulation run id.
+
+    The metadata of a run can only be read once the run has finished, and does not change after that, so entries
+    are not invalidated; they expire after ttl seconds and the least recently used ones are evicted beyond
+    max_entries. If a file service is given, entries are also persisted there and survive restarts.
+    """
+    max_entries: int
+    ttl: float
+    file_service: Optional[FileService]
+    hits: int
+    misses: int
+
+    def __init__(self, max_entries: int, ttl: float, file_service: Optional[FileService] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.file_service = file_service
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, HDF5File]] = OrderedDict()
+        self._locks: KeyedLock[str] = KeyedLock()
+
+    def get(self, simulation_run_id: str) -> Optional[HDF5File]:
+        entry = self._entries.get(simulation_run_id)
+        if entry is None:
+            return None
+        expires, hdf5_file = entry
+        if self._clock() >= expires:
+            del self._entries[simulation_run_id]
+            return None
+        self._entries.move_to_end(simulation_run_id)
+        return hdf5_file
+
+    def put(self, simulation_run_id: str, hdf5_file: HDF5File) -> None:
+        self._entries[simulation_run_id] = (self._clock() + self.ttl, hdf5_file)
+        self._entries.move_to_end(simulation_run_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(self, simulation_run_id: str, biosim_service: BiosimService) -> HDF5File:
+        """ cached metadata of the run, read from the file service or fetched with biosim_service on a miss """
+        hdf5_file = self.get(simulation_run_id)
+        if hdf5_file is not None:
+            self.hits += 1
+            return hdf5_file
+        # concurrent requests for the same run wait for one fetch instead of starting another one
+        async with self._locks.acquire(simulation_run_id):
+            hdf5_file = self.get(simulation_run_id)
+            if hdf5_file is not None:
+                self.hits += 1
+                return hdf5_file
+            self.misses += 1
+            hdf5_file = await self.load(simulation_run_id)
+            if hdf5_file is None:
+                hdf5_file = await biosim_service.get_hdf5_metadata(simulation_run_id)
+                await self.save(simulation_run_id, hdf5_file)
+            self.put(simulation_run_id, hdf5_file)
+            return hdf5_file
+
+    async def load(self, simulation_run_id: str) -> Optional[HDF5File]:
+        if self.file_service is None:
+            return None
+        s3_path = hdf5_metadata_s3_path(simulation_run_id)
+        try:
+            if not await file_exists(self.file_service, s3_path):
+                return None
+            return HDF5File.model_validate_json(await self.file_service.get_file_contents(s3_path))
+        except Exception as e:
+            logger.warning(f"could not read persisted metadata of {simulation_run_id}: {e}")
+            return None
+
+    async def save(self, simulation_run_id: str, hdf5_file: HDF5File) -> None:
+        if self.file_service is None:
+            return
+        try:
+            await self.file_service.upload_bytes(hdf5_file.model_dump_json().encode(),
+                                                 hdf5_metadata_s3_path(simulation_run_id))
+        except Exception as e:
+            logger.warning(f"could not persist metadata of {simulation_run_id}: {e}")
+
+
+class BiosimServiceCached(BiosimService):
+    """
+    Biosim service which answers get_hdf5_metadata from a Hdf5MetadataCache, everything else is delegated.
+    """
+    biosim_service: BiosimService
+    metadata_cache: Hdf5MetadataCache
+
+    def __init__(self, biosim_service: BiosimService, metadata_cache: Hdf5MetadataCache) -> None:
+        self.biosim_service = biosim_service
+        self.metadata_cache = metadata_cache
+
+    @override
+    async def get_sim_run(self, simulation_run_id: str) -> BiosimSimulationRun:
+        return await self.biosim_service.get_sim_run(simulation_run_id)
+
+    @override
+    async def run_biosim_sim(self, local_omex_path: str, omex_name: str,
+                             simulator_spec: BiosimSimulatorSpec) -> BiosimSimulationRun:
+        return await self.biosim_service.run_biosim_sim(local_omex_path, omex_name, simulator_spec)
+
+    @override
+    async def run_biosim_sim_from_url(self, omex_url: str, omex_name: str,
+                                      simulator_spec: BiosimSimulatorSpec) -> BiosimSimulationRun:
+        return await self.biosim_service.run_biosim_sim_from_url(omex_url, omex_name, simulator_spec)
+
+    @override
+    async def cancel_sim_run(self, simulation_run_id: str) -> bool:
+        return await self.biosim_service.cancel_sim_run(simulation_run_id)
+
+    @override
+    async def get_latest_simulator_version(self, simulator: str) -> str:
+        return await self.biosim_service.get_latest_simulator_version(simulator)
+
+    @override
+    async def get_hdf5_metadata(self, simulation_run_id: str) -> HDF5File:
+        return await self.metadata_cache.get_or_fetch(simulation_run_id, self.biosim_service)
+
+    @override
+    async def get_hdf5_data(self, simulation_run_id: str, dataset_name: str) -> Hdf5DataValues:
+        return await self.biosim_service.get_hdf5_data(simulation_run_id, dataset_name)
+
+    @override
+    async def get_hdf5_datasets(self, simulation_run_id: str,
+                                dataset_names: list[str]) -> dict[str, NDArray[np.float64]]:
+        return await self.biosim_service.get_hdf5_datasets(simulation_run_id, dataset_names)
+
+    @override
+    async def download_hdf5_file(self, hdf5_file_uri: str, local_path: Path) -> None:
+        await self.biosim_service.download_hdf5_file(hdf5_file_uri, local_path)
+
+    @override
+    async def close(self) -> None:
+        logger.info(f"HDF5 metadata cache: {self.metadata_cache.hits} hits, {self.metadata_cache.misses} misses")
+        await self.biosim_service.close()
@@ -1,32 +1,63 @@
+import asyncio
 import json
 import logging
-import os
 from dataclasses import asdict
 from pathlib import Path
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator
 
 import aiofiles
 import aiohttp
+import numpy as np
 from aiohttp import FormData
+from numpy.typing import NDArray
 from typing_extensions import override
 
+from biosim_server.config import get_settings
 from biosim_server.omex_sim.biosim1.biosim_service import BiosimService
 from biosim_server.omex_sim.biosim1.models import BiosimSimulationRun, BiosimSimulationRunApiRequest, HDF5File, \
-    Hdf5DataValues, BiosimSimulationRunStatus, BiosimSimulatorSpec
+    Hdf5DataValues, BiosimSimulationRunStatus, BiosimSimulatorSpec, BiosimSimulationRunUrlApiRequest
+from biosim_server.omex_sim.biosim1.simdata_json import parse_hdf5_data_json
 
 logger = logging.getLogger(__name__)
 
 
 class BiosimServiceRest(BiosimService):
+    """
+    Client for the biosimulations REST APIs.
+
+    All requests share one long-lived aiohttp session (created on first use, released by close()) so that
+    status polls and dataset fetches reuse keep-alive connections and cached DNS lookups.
+    """
+    api_base_url: str
+    simdata_api_base_url: str
+    simulators_api_base_url: str
+    _session: aiohttp.ClientSession | None = None
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self.api_base_url = settings.api_base_url
+        self.simdata_api_base_url = settings.simdata_api_base_url
+        self.simulators_api_base_url = settings.simulators_api_base_url
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            settings = get_settings()
+            connector = aiohttp.TCPConnector(limit=settings.biosim_http_max_connections,
+                                             limit_per_host=settings.biosim_http_max_connections_per_host,
+                                             keepalive_timeout=settings.biosim_http_keepalive_timeout,
+                                             ttl_dns_cache=settings.biosim_http_dns_cache_ttl)
+            timeout = aiohttp.ClientTimeout(sock_connect=settings.biosim_http_connect_timeout,
+                                            sock_read=settings.biosim_http_read_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
     @override
     async def get_sim_run(self, simulation_run_id: str) -> BiosimSimulationRun:
-        api_base_url = os.environ.get('API_BASE_URL') or "https://api.biosimulations.org"
-        assert (api_base_url is not None)
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(api_base_url + "/runs/" + simulation_run_id) as resp:
-                resp.raise_for_status()
-                res = await resp.json()
+        session = self._get_session()
+        async with session.get(self.api_base_url + "/runs/" + simulation_run_id) as resp:
+            resp.raise_for_status()
+            res = await resp.json()
 
         sim_run = BiosimSimulationRun(
             id=res["id"],
@@ -45,8 +76,6 @@ class BiosimServiceRest(BiosimService):
         """
         This function runs the project on biosimulations.
         """
-        api_base_url = os.environ.get('API_BASE_URL') or "https://api.biosimulations.org"
-
         simulation_run_request = BiosimSimulationRunApiRequest(
             name=omex_name,
             simulator=simulator_spec.simulator,
@@ -54,18 +83,42 @@ class BiosimServiceRest(BiosimService):
             maxTime=600,
         )
 
-        print(local_omex_path)
-        async with aiohttp.ClientSession() as session:
-            with Path(local_omex_path).open('rb') as f:
-                data = FormData()
-                data.add_field(name='file', value=f, filename='omex.omex', content_type='multipart/form-data')
-                data.add_field(name='simulationRun', value=json.dumps(asdict(simulation_run_request)),
-                               content_type='multipart/form-data')
+        session = self._get_session()
+        with Path(local_omex_path).open('rb') as f:
+            data = FormData()
+            data.add_field(name='file', value=f, filename='omex.omex', content_type='multipart/form-data')
+            data.add_field(name='simulationRun', value=json.dumps(asdict(simulation_run_request)),
+                           content_type='multipart/form-data')
+
+            async with session.post(url=self.api_base_url + '/runs', data=data) as resp:
+                resp.raise_for_status()
+                res = await resp.json()
+
+        return self._parse_submitted_sim_run(res, simulator_spec)
 
-                async with session.post(url=api_base_url + '/runs', data=data) as resp:
-                    resp.raise_for_status()
-                    res = await resp.json()
+    @override
+    async def run_biosim_sim_from_url(self, omex_url: str, omex_name: str,
+                                      simulator_spec: BiosimSimulatorSpec) -> BiosimSimulationRun:
+        """
+        This function runs the project on biosimulations, which fetches the archive from omex_url itself.
+        """
+        simulation_run_request = BiosimSimulationRunUrlApiRequest(
+            name=omex_name,
+            simulator=simulator_spec.simulator,
+            simulatorVersion=simulator_spec.version or "latest",
+            maxTime=600,
+            url=omex_url,
+        )
 
+        session = self._get_session()
+        async with session.post(url=self.api_base_url + '/runs', json=asdict(simulation_run_request)) as resp:
+            resp.raise_for_status()
+            res = await resp.json()
+
+        return self._parse_submitted_sim_run(res, simulator_spec)
+
+    @staticmethod
+    def _parse_submitted_sim_run(res: dict[str, Any], simulator_spec: BiosimSimulatorSpec) -> BiosimSimulationRun:
         if simulator_spec.version is None:
             simulator_spec.version = res['simulatorVersion']
 
@@ -83,35 +136,83 @@ class BiosimServiceRest(BiosimService):
         return sim_run
 
     @override
-    async def get_hdf5_metadata(self, simulation_run_id: str) -> HDF5File:
-        api_base_url = os.environ.get('SIMDATA_API_BASE_URL') or "https://simdata.api.biosimulations.org"
-        assert (api_base_url is not None)
+    async def cancel_sim_run(self, simulation_run_id: str) -> bool:
+        # the biosimulations API has no endpoint to cancel a submitted run, it runs to completion (or maxTime)
+        logger.info(f"simulation run {simulation_run_id} cannot be cancelled at biosimulations")
+        return False
 
-        async with aiohttp.ClientSession() as session:
-            url = f"{api_base_url}/datasets/{simulation_run_id}/metadata"
-            async with session.get(url) as resp:
-                resp.raise_for_status()
-                hdf5_metadata_json = await resp.text()
-                hdf5_file: HDF5File = HDF5File.model_validate_json(hdf5_metadata_json)
-                return hdf5_file
+    @override
+    async def get_latest_simulator_version(self, simulator: str) -> str:
+        session = self._get_session()
+        async with session.get(f"{self.simulators_api_base_url}/simulators/{simulator}/latest") as resp:
+            resp.raise_for_status()
+            res = await resp.json()
+        version: str = res["version"]
+        return version
+
+    @override
+    async def get_hdf5_metadata(self, simulation_run_id: str) -> HDF5File:
+        session = self._get_session()
+        url = f"{self.simdata_api_base_url}/datasets/{simulation_run_id}/metadata"
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            hdf5_metadata_json = await resp.text()
+            hdf5_file: HDF5File = HDF5File.model_validate_json(hdf5_metadata_json)
+            return hdf5_file
 
     @override
     async def get_hdf5_data(self, simulation_run_id: str, dataset_name: str) -> Hdf5DataValues:
-        api_base_url = os.environ.get('SIMDATA_API_BASE_URL') or "https://simdata.api.biosimulations.org"
-        assert (api_base_url is not None)
+        values = await self._get_hdf5_array(self._get_session(), self.simdata_api_base_url, simulation_run_id,
+                                            dataset_name)
+        return Hdf5DataValues(shape=list(values.shape), values=values.ravel().tolist())
 
-        async with aiohttp.ClientSession() as session:
-            url = f"{api_base_url}/datasets/{simulation_run_id}/data"
-            async with session.get(url, params={"dataset_name": dataset_name}) as resp:
-                resp.raise_for_status()
-                hdf5_data_dict = await resp.json()
-                logger.info(f"Got data for dataset: {dataset_name}")
-                hdf5_data_values = Hdf5DataValues(shape=hdf5_data_dict['shape'], values=hdf5_data_dict['values'])
-                return hdf5_data_values
+    @override
+    async def get_hdf5_datasets(self, simulation_run_id: str,
+                                dataset_names: list[str]) -> dict[str, NDArray[np.float64]]:
+        """
+        Fetch several datasets of one simulation run concurrently over the shared HTTP session, with at most
+        biosim_http_max_concurrent_datasets requests (and parsed reports) in flight.
+        """
+        session = self._get_session()
+        semaphore = asyncio.Semaphore(max(1, get_settings().biosim_http_max_concurrent_datasets))
+
+        async def get_hdf5_array_bounded(dataset_name: str) -> NDArray[np.float64]:
+            async with semaphore:
+                return await self._get_hdf5_array(session, self.simdata_api_base_url, simulation_run_id, dataset_name)
+
+        arrays = await asyncio.gather(*[get_hdf5_array_bounded(dataset_name) for dataset_name in dataset_names])
+        return dict(zip(dataset_names, arrays))
+
+    @staticmethod
+    async def _get_hdf5_array(session: aiohttp.ClientSession, api_base_url: str, simulation_run_id: str,
+                              dataset_name: str) -> NDArray[np.float64]:
+        url = f"{api_base_url}/datasets/{simulation_run_id}/data"
+        async with session.get(url, params={"dataset_name": dataset_name}) as resp:
+            resp.raise_for_status()
+            body = await resp.read()
+        # parsing large reports is CPU bound, keep it off the event loop
+        values = await asyncio.to_thread(parse_hdf5_data_json, body)
+        logger.info(f"Got data for dataset: {dataset_name}")
+        return values
+
+    @override
+    async def download_hdf5_file(self, hdf5_file_uri: str, local_path: Path) -> None:
+        """
+        Stream the complete results file of a simulation run (e.g. reports.h5) to local_path.
+        """
+        session = self._get_session()
+        async with session.get(hdf5_file_uri) as resp:
+            resp.raise_for_status()
+            async with aiofiles.open(local_path, mode='wb') as f:
+                async for chunk in resp.content.iter_chunked(1024 * 1024):
+                    await f.write(chunk)
+        logger.info(f"Downloaded {hdf5_file_uri} to {local_path}")
 
     @override
     async def close(self) -> None:
-        pass
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
 
 async def file_sender(file_name: str) -> AsyncGenerator[bytes, None]:
@@ -0,0 +1,26 @@
+from pathlib import Path
+from typing import Optional
+
+import h5py  # type: ignore
+import numpy as np
+from numpy.typing import NDArray
+
+
+def read_hdf5_datasets(local_path: Path, dataset_names: list[str],
+                       dataset_rows: Optional[dict[str, list[int]]] = None) -> dict[str, NDArray[np.float64]]:
+    """
+    Read datasets of a downloaded results file (e.g. reports.h5) straight into NumPy arrays.
+
+    Dataset names are the HDF5 paths used by the simdata API (e.g. 'simulation.sedml/report').
+    If dataset_rows has (sorted) row indices for a 2-D dataset, only those rows are read.
+    """
+    datasets: dict[str, NDArray[np.float64]] = {}
+    with h5py.File(local_path, "r") as hdf5_file:
+        for dataset_name in dataset_names:
+            dataset = hdf5_file[dataset_name]
+            rows = dataset_rows.get(dataset_name) if dataset_rows is not None else None
+            if rows is not None and dataset.ndim > 1:
+                datasets[dataset_name] = np.asarray(dataset[rows, ...], dtype=np.float64)
+            else:
+                datasets[dataset_name] = np.asarray(dataset[()], dtype=np.float64)
+    return datasets
@@ -1,8 +1,36 @@
+import base64
 from dataclasses import dataclass
 from enum import Enum, StrEnum
-from typing import Optional
+from typing import Annotated, Any, Optional
+
+import numpy as np
+from pydantic import BaseModel, BeforeValidator, SerializationInfo, SerializerFunctionWrapHandler, WithJsonSchema, \
+    WrapSerializer
+
+# serialization context used for Temporal payloads (but not e.g. for FastAPI responses)
+PAYLOAD_CONTEXT: dict[str, Any] = {"temporal_payload": True}
+
+
+def _pack_float64(values: list[float], handler: SerializerFunctionWrapHandler, info: SerializationInfo) -> Any:
+    """ in payloads, a list of floats is sent as the base64 encoded little-endian float64 buffer """
+    if isinstance(info.context, dict) and info.context.get("temporal_payload"):
+        buffer = np.asarray(values, dtype="<f8").tobytes()
+        return {"dtype": "<f8", "shape": [len(values)], "data": base64.b64encode(buffer).decode("ascii")}
+    return handler(values)
+
+
+def _unpack_float64(value: Any) -> Any:
+    if isinstance(value, dict) and "data" in value:
+        return np.frombuffer(base64.b64decode(value["data"]), dtype=value.get("dtype", "<f8")).tolist()
+    return value
+
+
+# list[float] which is packed into a binary buffer in Temporal payloads, and a plain list everywhere else
+PackedFloatList = Annotated[list[float],
+                            BeforeValidator(_unpack_float64),
+                            WrapSerializer(_pack_float64),
+                            WithJsonSchema({"type": "array", "items": {"type": "number"}})]
 
-from pydantic import BaseModel
 
 ATTRIBUTE_VALUE_TYPE = int | float | str | bool | list[str] | list[int] | list[float] | list[bool]
 
@@ -17,6 +45,21 @@ class HDF5Dataset(BaseModel):
     shape: list[int]
     attributes: list[HDF5Attribute]
 
+    def get_attribute(self, key: str) -> Optional[ATTRIBUTE_VALUE_TYPE]:
+        for attribute in self.attributes:
+            if attribute.key == key:
+                return attribute.value
+        return None
+
+    def get_labels(self) -> list[str]:
+        """ row labels of the dataset (sedmlDataSetLabels, falling back to sedmlDataSetIds, then row index) """
+        for key in ("sedmlDataSetLabels", "sedmlDataSetIds"):
+            value = self.get_attribute(key)
+            if isinstance(value, list) and len(value) > 0 and all(str(label) != "" for label in value):
+                return [str(label) for label in value]
+        num_rows = self.shape[0] if len(self.shape) > 1 else 1
+        return [f"{self.name}[{i}]" for i in range(num_rows)]
+
 
 class HDF5Group(BaseModel):
     name: str
@@ -36,7 +79,15 @@ class Hdf5DataValues:
     # simulation_run_id: str
     # dataset_name: str
     shape: list[int]
-    values: list[float]
+    values: PackedFloatList
+
+
+@dataclass
+class Hdf5DataRef:
+    """ location and shape of one dataset's values, stored in the file service as a .npy blob """
+    dataset_name: str
+    shape: list[int]
+    s3_path: str
 
 
 class BiosimSimulationRunStatus(StrEnum):
@@ -54,6 +105,7 @@ class BiosimSimulationRunStatus(StrEnum):
 class SourceOmex:
     name: str
     omex_s3_file: str
+    content_hash: Optional[str] = None  # sha256 of the archive, if known results can be reused across runs
 
 
 @dataclass
@@ -73,6 +125,11 @@ class BiosimSimulationRunApiRequest:
     # memory: Optional[int] = None (in GB)
 
 
+@dataclass
+class BiosimSimulationRunUrlApiRequest(BiosimSimulationRunApiRequest):
+    url: str  # biosimulations downloads the archive from here
+
+
 @dataclass
 class BiosimSimulationRun:
     id: str
@@ -0,0 +1,74 @@
+import json
+import math
+from typing import Any, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+
+_BRACKETS_TO_SPACES = bytes.maketrans(b"[]", b"  ")
+_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_hdf5_data_json(body: bytes) -> NDArray[np.float64]:
+    """
+    Parse a simdata /datasets/{id}/data response ({"shape": [...], "values": [[...], ...]}) into a float64 array.
+
+    The numbers of the (nested) values list are parsed as text by numpy, chunk by chunk, straight into the array,
+    instead of building Python lists of boxed floats first. Responses which do not fit that fast path
+    (e.g. null values) are parsed with the json module.
+    """
+    values_key = body.find(b'"values"')
+    values_start = body.find(b"[", values_key) if values_key >= 0 else -1
+    values_end = _find_list_end(body, values_start) if values_start >= 0 else -1
+    if values_end >= 0:
+        shape: list[int] = json.loads(body[:values_start] + b"null" + body[values_end:])["shape"]
+        values = _parse_values_text(body, values_start, values_end, math.prod(shape))
+        if values is not None:
+            return values.reshape(shape)
+    return _parse_hdf5_data_json_slow(body)
+
+
+def _find_list_end(body: bytes, list_start: int) -> int:
+    """ index after the ']' which closes the list starting at list_start, -1 if not found """
+    depth = 0
+    pos = list_start
+    while True:
+        close = body.find(b"]", pos)
+        if close < 0:
+            return -1
+        depth += body.count(b"[", pos, close) - 1
+        if depth == 0:
+            return close + 1
+        pos = close + 1
+
+
+def _parse_values_text(body: bytes, start: int, end: int, size: int) -> Optional[NDArray[np.float64]]:
+    """ the numbers in body[start:end] (brackets ignored), None unless there are exactly size numbers """
+    values = np.empty(size, dtype=np.float64)
+    filled = 0
+    pos = start
+    while pos < end:
+        # chunks end right after a ',' so that no number is split
+        chunk_end = end
+        if end - pos > _CHUNK_SIZE:
+            chunk_end = body.rfind(b",", pos, pos + _CHUNK_SIZE) + 1
+            if chunk_end <= pos:
+                chunk_end = end
+        chunk_text = body[pos:chunk_end].translate(_BRACKETS_TO_SPACES).strip()
+        pos = chunk_end
+        if len(chunk_text) == 0:
+            continue
+        try:
+            chunk = np.fromstring(chunk_text, dtype=np.float64, sep=",")
+        except ValueError:
+            return None
+        if filled + chunk.size > size:
+            return None
+        values[filled:filled + chunk.size] = chunk
+        filled += chunk.size
+    return values if filled == size else None
+
+
+def _parse_hdf5_data_json_slow(body: bytes) -> NDArray[np.float64]:
+    hdf5_data_dict: dict[str, Any] = json.loads(body)
+    return np.asarray(hdf5_data_dict["values"], dtype=np.float64).reshape(hdf5_data_dict["shape"])
@@ -1,15 +1,48 @@
+import asyncio
 import logging
 import os
+import tempfile
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
 
+import aiohttp
+import numpy as np
+from numpy.typing import NDArray
 from temporalio import activity
 
+from biosim_server.config import get_settings
 from biosim_server.omex_sim.biosim1.biosim_service import BiosimService
 from biosim_server.dependencies import get_file_service, get_biosim_service
+from biosim_server.io.array_store import save_ndarray
 from biosim_server.io.file_service import FileService
-from biosim_server.omex_sim.biosim1.biosim_service_rest import BiosimServiceRest
+from biosim_server.omex_sim.biosim1.hdf5_local import read_hdf5_datasets
+from biosim_server.omex_verify.comparison import select_rows
 from biosim_server.omex_sim.biosim1.models import BiosimSimulationRunStatus, SourceOmex, BiosimSimulatorSpec, BiosimSimulationRun, \
-    HDF5File, Hdf5DataValues
+    HDF5File, Hdf5DataValues, Hdf5DataRef
+
+SIM_RESULTS_S3_PREFIX = "verify/sim_results"
+HEARTBEAT_INTERVAL = 10.0  # seconds, must be well below the heartbeat_timeout used by the workflows
+
+
+@asynccontextmanager
+async def heartbeating(interval: float = HEARTBEAT_INTERVAL) -> AsyncIterator[None]:
+    """ heartbeat in the background, so that a cancelled workflow also cancels long running activities """
+    async def heartbeat() -> None:
+        while True:
+            activity.heartbeat()
+            await asyncio.sleep(interval)
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        yield
+    finally:
+        heartbeat_task.cancel()
+
+
+def sim_results_s3_path(simulation_run_id: str) -> str:
+    return f"{SIM_RESULTS_S3_PREFIX}/{simulation_run_id}"
 
 
 @dataclass
@@ -20,11 +53,43 @@ class GetSimRunInput:
 @activity.defn
 async def get_sim_run(get_sim_run_input: GetSimRunInput) -> BiosimSimulationRun:
     activity.logger.setLevel(logging.INFO)
-    biosim_service = BiosimServiceRest()
+    biosim_service: BiosimService | None = get_biosim_service()
+    if biosim_service is None:
+        raise Exception("Biosim service is not initialized")
     biosim_sim_run: BiosimSimulationRun = await biosim_service.get_sim_run(get_sim_run_input.biosim_run_id)
     return biosim_sim_run
 
 
+@dataclass
+class GetSimRunsInput:
+    biosim_run_ids: list[str]
+    max_concurrency: int
+
+
+@activity.defn
+async def get_sim_runs(get_sim_runs_input: GetSimRunsInput) -> list[BiosimSimulationRun]:
+    """ status of many runs over the shared HTTP session, runs which could not be fetched are left out """
+    activity.logger.setLevel(logging.INFO)
+    biosim_service: BiosimService | None = get_biosim_service()
+    if biosim_service is None:
+        raise Exception("Biosim service is not initialized")
+    semaphore = asyncio.Semaphore(max(1, get_sim_runs_input.max_concurrency))
+
+    async def get_sim_run_bounded(biosim_run_id: str) -> BiosimSimulationRun:
+        async with semaphore:
+            return await biosim_service.get_sim_run(biosim_run_id)
+
+    results = await asyncio.gather(*[get_sim_run_bounded(biosim_run_id)
+                                     for biosim_run_id in get_sim_runs_input.biosim_run_ids], return_exceptions=True)
+    biosim_runs: list[BiosimSimulationRun] = []
+    for biosim_run_id, result in zip(get_sim_runs_input.biosim_run_ids, results):
+        if isinstance(result, BaseException):
+            activity.logger.warning(f"failed to get status of simulation run {biosim_run_id}: {result}")
+        else:
+            biosim_runs.append(result)
+    return biosim_runs
+
+
 @dataclass
 class SubmitBiosimSimInput:
     source_omex: SourceOmex
@@ -40,6 +105,18 @@ async def submit_biosim_sim(input: SubmitBiosimSimInput) -> BiosimSimulationRun:
     file_service: FileService | None = get_file_service()
     if file_service is None:
         raise Exception("File service is not initialized")
+    # let biosimulations fetch the archive from storage, rather than moving it through this worker
+    omex_url = await file_service.get_download_url(input.source_omex.omex_s3_file)
+    if omex_url is not None:
+        try:
+            return await biosim_service.run_biosim_sim_from_url(omex_url, input.source_omex.name,
+                                                                input.simulator_spec)
+        except aiohttp.ClientResponseError as e:
+            # only a clear rejection falls back to an upload; after a timeout or connection error biosimulations
+            # may have accepted the run, and uploading would submit a second one
+            if not 400 <= e.status < 500:
+                raise
+            activity.logger.warning(f"submission by URL rejected, uploading the archive instead: {e}")
     (_, local_omex_path) = await file_service.download_file(input.source_omex.omex_s3_file)
     simulation_run = await biosim_service.run_biosim_sim(local_omex_path, input.source_omex.name,
                                                          input.simulator_spec)
@@ -47,17 +124,33 @@ async def submit_biosim_sim(input: SubmitBiosimSimInput) -> BiosimSimulationRun:
     return simulation_run
 
 
+@dataclass
+class CancelBiosimSimInput:
+    biosim_run_id: str
+
+
+@activity.defn
+async def cancel_biosim_sim(input: CancelBiosimSimInput) -> bool:
+    activity.logger.setLevel(logging.INFO)
+    biosim_service: BiosimService | None = get_biosim_service()
+    if biosim_service is None:
+        raise Exception("Biosim service is not initialized")
+    return await biosim_service.cancel_sim_run(input.biosim_run_id)
+
+
 @dataclass
 class GetHdf5MetadataInput:
     simulation_run_id: str
 
 
 @activity.defn
-async def get_hdf5_metadata(input: GetHdf5MetadataInput) -> str:
+async def get_hdf5_metadata(input: GetHdf5MetadataInput) -> HDF5File:
     activity.logger.setLevel(logging.INFO)
-    biosim_service = BiosimServiceRest()
+    biosim_service: BiosimService | None = get_biosim_service()
+    if biosim_service is None:
+        raise Exception("Biosim service is not initialized")
     hdf5_file: HDF5File = await biosim_service.get_hdf5_metadata(input.simulation_run_id)
-    return hdf5_file.model_dump_json()
+    return hdf5_file
 
 
 @dataclass
@@ -69,7 +162,86 @@ class GetHdf5DataInput:
 @activity.defn
 async def get_hdf5_data(input: GetHdf5DataInput) -> Hdf5DataValues:
     activity.logger.setLevel(logging.INFO)
-    biosim_service = BiosimServiceRest()
+    biosim_service: BiosimService | None = get_biosim_service()
+    if biosim_service is None:
+        raise Exception("Biosim service is not initialized")
     hdf5_data_values: Hdf5DataValues = await biosim_service.get_hdf5_data(simulation_run_id=input.simulation_run_id,
                                                                           dataset_name=input.dataset_name)
     return hdf5_data_values
+
+
+@dataclass
+class StoreHdf5DatasetsInput:
+    simulation_run_id: str
+    dataset_names: list[str]
+    dataset_rows: Optional[dict[str, list[int]]] = None  # store only these rows of the datasets (see select_rows)
+
+
+@activity.defn
+async def store_hdf5_datasets(input: StoreHdf5DatasetsInput) -> list[Hdf5DataRef]:
+    """ fetch several datasets of a run with one HTTP session and store them, returning their locations in order """
+    activity.logger.setLevel(logging.INFO)
+    biosim_service: BiosimService | None = get_biosim_service()
+    if biosim_service is None:
+        raise Exception("Biosim service is not initialized")
+    file_service: FileService | None = get_file_service()
+    if file_service is None:
+        raise Exception("File service is not initialized")
+    async with heartbeating():
+        datasets: dict[str, NDArray[np.float64]] = await biosim_service.get_hdf5_datasets(
+            simulation_run_id=input.simulation_run_id, dataset_names=input.dataset_names)
+        dataset_rows = input.dataset_rows or {}
+        selected = [(dataset_name, select_rows(datasets[dataset_name], dataset_rows.get(dataset_name)))
+                    for dataset_name in input.dataset_names]
+        return await save_hdf5_arrays(file_service, input.simulation_run_id, selected)
+
+
+@dataclass
+class StoreHdf5FileInput:
+    simulation_run_id: str
+    hdf5_file_uri: str
+    dataset_names: list[str]
+    dataset_rows: Optional[dict[str, list[int]]] = None  # read only these rows of the datasets
+
+
+@activity.defn
+async def store_hdf5_file(input: StoreHdf5FileInput) -> list[Hdf5DataRef]:
+    """
+    download the complete results file of a run once, read the datasets locally with h5py
+    and store them, returning their locations in order
+    """
+    activity.logger.setLevel(logging.INFO)
+    biosim_service: BiosimService | None = get_biosim_service()
+    if biosim_service is None:
+        raise Exception("Biosim service is not initialized")
+    file_service: FileService | None = get_file_service()
+    if file_service is None:
+        raise Exception("File service is not initialized")
+    async with heartbeating():
+        with tempfile.TemporaryDirectory() as temp_dir:
+            local_hdf5_path = Path(temp_dir) / "reports.h5"
+            await biosim_service.download_hdf5_file(hdf5_file_uri=input.hdf5_file_uri, local_path=local_hdf5_path)
+            datasets = await asyncio.to_thread(read_hdf5_datasets, local_hdf5_path, input.dataset_names,
+                                               input.dataset_rows)
+        return await save_hdf5_arrays(file_service, input.simulation_run_id,
+                                      [(dataset_name, datasets[dataset_name]) for dataset_name in input.dataset_names])
+
+
+async def save_hdf5_arrays(file_service: FileService, simulation_run_id: str,
+                           arrays: list[tuple[str, NDArray[np.float64]]]) -> list[Hdf5DataRef]:
+    """ store the arrays of a run with at most storage_max_concurrent_uploads uploads in flight, refs in order """
+    semaphore = asyncio.Semaphore(max(1, get_settings().storage_max_concurrent_uploads))
+
+    async def save_hdf5_array_bounded(dataset_name: str, values: NDArray[np.float64]) -> Hdf5DataRef:
+        async with semaphore:
+            return await save_hdf5_array(file_service, simulation_run_id, dataset_name, values)
+
+    return list(await asyncio.gather(*[save_hdf5_array_bounded(dataset_name, values)
+                                       for dataset_name, values in arrays]))
+
+
+async def save_hdf5_array(file_service: FileService, simulation_run_id: str, dataset_name: str,
+                          values: NDArray[np.float64]) -> Hdf5DataRef:
+    s3_path = f"{sim_results_s3_path(simulation_run_id)}/{dataset_name}.npy"
+    await save_ndarray(file_service, values, s3_path)
+    return Hdf5DataRef(dataset_name=dataset_name, shape=list(values.shape), s3_path=s3_path)
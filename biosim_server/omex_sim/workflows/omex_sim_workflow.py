@@ -1,22 +1,54 @@
+import asyncio
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import timedelta
 from enum import StrEnum
 
 from temporalio import workflow
 from temporalio.common import RetryPolicy
+from temporalio.exceptions import ActivityError, FailureError
 
 from biosim_server.omex_sim.biosim1.models import BiosimSimulationRun, BiosimSimulationRunStatus, HDF5File, \
-    Hdf5DataValues, SourceOmex, BiosimSimulatorSpec
-from biosim_server.omex_sim.workflows.biosim_activities import get_hdf5_metadata, get_hdf5_data
+    Hdf5DataRef, SourceOmex, BiosimSimulatorSpec
+from biosim_server.omex_sim.workflows.biosim_activities import get_hdf5_metadata, store_hdf5_datasets, \
+    store_hdf5_file, sim_results_s3_path
 from biosim_server.omex_sim.workflows.biosim_activities import get_sim_run, submit_biosim_sim, \
-    SubmitBiosimSimInput, GetSimRunInput, GetHdf5DataInput, GetHdf5MetadataInput
+    SubmitBiosimSimInput, GetSimRunInput, StoreHdf5DatasetsInput, StoreHdf5FileInput, GetHdf5MetadataInput, \
+    cancel_biosim_sim, CancelBiosimSimInput
+from biosim_server.omex_sim.workflows.sim_run_poller_activities import track_sim_run, TrackSimRunInput
+from biosim_server.omex_sim.workflows.sim_run_poller_workflow import TrackedSimRun, SIM_RUN_UPDATED_SIGNAL, \
+    SIM_RUN_POLLER_WORKFLOW_ID
+from biosim_server.omex_sim.workflows.result_cache_activities import CachedSimResults, resolve_simulator_version, \
+    ResolveSimulatorVersionInput, get_cached_sim_results, GetCachedSimResultsInput, save_cached_sim_results, \
+    SaveCachedSimResultsInput
+from biosim_server.omex_verify.comparison import select_observable_rows, select_hdf5_rows
 
 
 @dataclass
 class OmexSimWorkflowInput:
     source_omex: SourceOmex
     simulator_spec: BiosimSimulatorSpec
+    max_concurrent_fetches: int = 8  # maximum number of dataset fetch activities running at the same time
+    max_datasets_per_fetch: int = 20  # maximum number of datasets fetched by a single activity
+    download_hdf5_file: bool = True  # download the whole results file once (falls back to per-dataset fetches)
+    use_result_cache: bool = True  # reuse stored results of the same archive, simulator and version
+    # store only the dataset rows holding these observables (matched by label or id) and the time rows,
+    # instead of every dataset of the results file
+    observables: list[str] | None = None
+    # run status polling: the interval grows by poll_backoff_coefficient up to poll_max_interval while the run is
+    # queued, and up to poll_active_max_interval once it is RUNNING or PROCESSING, randomized by +/- poll_jitter
+    poll_initial_interval: float = 2.0
+    poll_max_interval: float = 60.0
+    poll_active_max_interval: float = 10.0
+    poll_backoff_coefficient: float = 1.5
+    poll_jitter: float = 0.2
+    max_polls_per_run: int = 100  # continue-as-new after this many polls to keep the history bounded
+    # wait for status signals from the central SimRunPollerWorkflow, checking the run directly only every
+    # poller_check_interval seconds, instead of polling the run from this workflow. The check is the safety net
+    # for a run the poller lost, so the interval must stay well below the execution timeout of this workflow.
+    use_central_poller: bool = True
+    poller_check_interval: float = 60.0
+    biosim_run: BiosimSimulationRun | None = None  # run submitted by a previous execution (continue-as-new)
 
 
 class OmexSimWorkflowStatus(StrEnum):
@@ -24,6 +56,7 @@ class OmexSimWorkflowStatus(StrEnum):
     IN_PROGRESS = "IN_PROGRESS"
     COMPLETED = "COMPLETED"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
 
 
 @dataclass
@@ -33,6 +66,16 @@ class OmexSimWorkflowOutput:
     workflow_status: OmexSimWorkflowStatus
     biosim_run: BiosimSimulationRun | None = None
     result_s3_path: str | None = None
+    hdf5_file: HDF5File | None = None
+    result_datasets: dict[str, Hdf5DataRef] | None = None
+    # rows of the stored datasets which hold the results (hdf5_file describes only those), None for all rows;
+    # set when complete cached results are reused for a request with observables
+    dataset_rows: dict[str, list[int]] | None = None
+
+
+def is_finished(biosim_run: BiosimSimulationRun | None) -> bool:
+    return biosim_run is not None and biosim_run.status in [BiosimSimulationRunStatus.SUCCEEDED,
+                                                            BiosimSimulationRunStatus.FAILED]
 
 
 @workflow.defn
@@ -52,46 +95,78 @@ class OmexSimWorkflow:
     async def get_omex_sim_workflow_run(self) -> OmexSimWorkflowOutput:
         return self.sim_output
 
+    @workflow.signal(name=SIM_RUN_UPDATED_SIGNAL)
+    def sim_run_updated(self, biosim_run: BiosimSimulationRun) -> None:
+        if self.sim_output.biosim_run is not None and self.sim_output.biosim_run.id == biosim_run.id:
+            self.sim_output.biosim_run = biosim_run
+
     @workflow.run
     async def run(self, sim_input: OmexSimWorkflowInput) -> OmexSimWorkflowOutput:
         self.sim_output.workflow_id = workflow.info().workflow_id
         workflow.logger.setLevel(level=logging.DEBUG)
         workflow.logger.info(f"Child workflow started for {sim_input.simulator_spec.simulator}.")
+        try:
+            return await self.simulate(sim_input)
+        except asyncio.CancelledError:
+            workflow.logger.info(f"Child workflow for {sim_input.simulator_spec.simulator} cancelled.")
+            await self.release_sim_run()
+            self.sim_output.workflow_status = OmexSimWorkflowStatus.CANCELLED
+            raise
 
-        workflow.logger.info(f"submitting job for simulator {sim_input.simulator_spec.simulator}.")
-        submit_biosim_input = SubmitBiosimSimInput(source_omex=sim_input.source_omex,
-                                                   simulator_spec=sim_input.simulator_spec)
-        self.sim_output.biosim_run = await workflow.execute_activity(
-            submit_biosim_sim,
-            args=[submit_biosim_input],
-            start_to_close_timeout=timedelta(seconds=60),  # Activity timeout
-            retry_policy=RetryPolicy(maximum_attempts=1),
-        )
-
-        workflow.logger.info(
-            f"Job {self.sim_output.biosim_run.id} for {sim_input.simulator_spec.simulator}, "
-            f"status is {self.sim_output.biosim_run.status}.")
+    async def release_sim_run(self) -> None:
+        """ stop tracking the submitted run and cancel it at biosimulations, if it is still running """
+        biosim_run = self.sim_output.biosim_run
+        if biosim_run is None or is_finished(biosim_run):
+            return
+        try:
+            await workflow.get_external_workflow_handle(SIM_RUN_POLLER_WORKFLOW_ID).signal(
+                "untrack", workflow.info().workflow_id)
+        except FailureError:
+            pass  # the poller is not running
+        try:
+            await workflow.execute_activity(
+                cancel_biosim_sim,
+                args=[CancelBiosimSimInput(biosim_run_id=biosim_run.id)],
+                start_to_close_timeout=timedelta(seconds=30),
+                retry_policy=RetryPolicy(maximum_attempts=3)
+            )
+        except ActivityError as e:
+            workflow.logger.warning(f"could not cancel job {biosim_run.id}: {e.cause}")
 
-        while self.sim_output.biosim_run is not None and self.sim_output.biosim_run.status not in [
-            BiosimSimulationRunStatus.SUCCEEDED, BiosimSimulationRunStatus.FAILED]:
+    async def simulate(self, sim_input: OmexSimWorkflowInput) -> OmexSimWorkflowOutput:
 
-            await workflow.sleep(2.0)
+        content_hash = sim_input.source_omex.content_hash
+        if sim_input.biosim_run is not None:
+            workflow.logger.info(f"continuing to poll job {sim_input.biosim_run.id}.")
+            self.sim_output.biosim_run = sim_input.biosim_run
+        else:
+            if sim_input.use_result_cache and content_hash is not None:
+                cached_sim_results = await self.get_cached_results(content_hash)
+                if cached_sim_results is not None:
+                    workflow.logger.info(f"reusing results of simulation run {cached_sim_results.biosim_run.id} "
+                                         f"for {sim_input.simulator_spec.simulator}.")
+                    return self.use_cached_results(cached_sim_results)
 
+            workflow.logger.info(f"submitting job for simulator {sim_input.simulator_spec.simulator}.")
+            submit_biosim_input = SubmitBiosimSimInput(source_omex=sim_input.source_omex,
+                                                       simulator_spec=sim_input.simulator_spec)
             self.sim_output.biosim_run = await workflow.execute_activity(
-                get_sim_run, args=[GetSimRunInput(biosim_run_id=self.sim_output.biosim_run.id)],
-                start_to_close_timeout=timedelta(seconds=60),
-                retry_policy=RetryPolicy(maximum_attempts=3)
+                submit_biosim_sim,
+                args=[submit_biosim_input],
+                start_to_close_timeout=timedelta(seconds=60),  # Activity timeout
+                retry_policy=RetryPolicy(maximum_attempts=1),
             )
 
-            workflow.logger.info(
-                f"Job {self.sim_output.biosim_run.id} for {sim_input.simulator_spec.simulator}, "
-                f"status is {self.sim_output.biosim_run.status}.")
+        workflow.logger.info(
+            f"Job {self.sim_output.biosim_run.id} for {sim_input.simulator_spec.simulator}, "
+            f"status is {self.sim_output.biosim_run.status}.")
 
-            if self.sim_output.biosim_run.status == BiosimSimulationRunStatus.FAILED:
-                self.sim_output.workflow_status = OmexSimWorkflowStatus.FAILED
-                return self.sim_output
+        self.sim_output.biosim_run = await self.wait_for_sim_run(self.sim_output.biosim_run)
+        if self.sim_output.biosim_run.status == BiosimSimulationRunStatus.FAILED:
+            self.sim_output.workflow_status = OmexSimWorkflowStatus.FAILED
+            return self.sim_output
 
-        hdf5_metadata_json: str = await workflow.execute_activity(
+        hdf5_file: HDF5File = await workflow.execute_activity(
             get_hdf5_metadata,
             args=[GetHdf5MetadataInput(simulation_run_id=self.sim_output.biosim_run.id)],
             start_to_close_timeout=timedelta(seconds=60),  # Activity timeout
@@ -99,25 +174,222 @@ class OmexSimWorkflow:
         )
 
         workflow.logger.info(
-            f"Simulation run metadata for simulation_run_id: {self.sim_output.biosim_run.id} is {hdf5_metadata_json}")
-
-        hdf5_file: HDF5File = HDF5File.model_validate_json(hdf5_metadata_json)
-        results_dict: dict[str, Hdf5DataValues] = {}
-        for group in hdf5_file.groups:
-            for dataset in group.datasets:
-                workflow.logger.info(f"getting data for dataset: {dataset.name}")
-                hdf5_data_values: Hdf5DataValues = await workflow.execute_activity(
-                    get_hdf5_data,
-                    args=[GetHdf5DataInput(simulation_run_id=self.sim_output.biosim_run.id, dataset_name=dataset.name)],
-                    start_to_close_timeout=timedelta(seconds=60),
-                    retry_policy=RetryPolicy(maximum_attempts=100, maximum_interval=timedelta(seconds=5), backoff_coefficient=2.0)
-                )
-                results_dict[dataset.name] = hdf5_data_values
+            f"Simulation run metadata for simulation_run_id: {self.sim_output.biosim_run.id} is {hdf5_file}")
+
+        # the stored datasets hold only the selected rows, the metadata describes them that way
+        hdf5_file, dataset_rows = self.select_observables(hdf5_file)
+        self.sim_output.hdf5_file = hdf5_file
+        # datasets are written to the file service by the activities, only their locations come back.
+        dataset_names = [dataset.name for group in hdf5_file.groups for dataset in group.datasets]
+        result_datasets: dict[str, Hdf5DataRef] | None = None
+        if sim_input.download_hdf5_file:
+            result_datasets = await self.store_datasets_from_file(hdf5_file, dataset_names, dataset_rows)
+        if result_datasets is None:
+            result_datasets = await self.store_datasets_from_api(dataset_names, dataset_rows)
 
-        workflow.logger.info(f"retrieved Simulation run data for simulation_run_id: {self.sim_output.biosim_run.id}")
+        workflow.logger.info(f"stored Simulation run data for simulation_run_id: {self.sim_output.biosim_run.id}")
+        self.sim_output.result_datasets = result_datasets
+        self.sim_output.result_s3_path = sim_results_s3_path(self.sim_output.biosim_run.id)
+        self.sim_output.workflow_status = OmexSimWorkflowStatus.COMPLETED
+
+        # only complete results are cached, a lookup with observables may reuse them
+        if sim_input.use_result_cache and content_hash is not None and dataset_rows is None:
+            await self.save_cached_results(content_hash, CachedSimResults(biosim_run=self.sim_output.biosim_run,
+                                                                          hdf5_file=hdf5_file,
+                                                                          result_datasets=result_datasets))
+        return self.sim_output
 
-        # Simulate SLURM job monitoring (replace with actual monitoring activity)
-        # await workflow.sleep(1)  # Simulating job run time
-        self.sim_output.result_s3_path = f"s3://bucket-name/results/{self.sim_output.workflow_input.simulator_spec.simulator}.output"
+    def use_cached_results(self, cached_sim_results: CachedSimResults) -> OmexSimWorkflowOutput:
+        """ complete the workflow with cached results, reduced to the requested observables like fresh results """
+        hdf5_file, dataset_rows = self.select_observables(cached_sim_results.hdf5_file)
+        result_datasets = cached_sim_results.result_datasets
+        if dataset_rows is not None:
+            # the stored datasets hold all rows, the comparison selects dataset_rows when it loads them
+            result_datasets = {name: hdf5_data_ref for name, hdf5_data_ref in result_datasets.items()
+                               if name in dataset_rows}
+        self.sim_output.biosim_run = cached_sim_results.biosim_run
+        self.sim_output.hdf5_file = hdf5_file
+        self.sim_output.dataset_rows = dataset_rows
+        self.sim_output.result_datasets = result_datasets
+        self.sim_output.result_s3_path = sim_results_s3_path(cached_sim_results.biosim_run.id)
         self.sim_output.workflow_status = OmexSimWorkflowStatus.COMPLETED
         return self.sim_output
+
+    def select_observables(self, hdf5_file: HDF5File) -> tuple[HDF5File, dict[str, list[int]] | None]:
+        """ metadata of only the dataset rows holding the requested observables, and those rows (None for all) """
+        observables = self.sim_input.observables
+        if not observables:
+            return hdf5_file, None
+        dataset_rows = select_observable_rows(hdf5_file, observables)
+        if len(dataset_rows) == 0:
+            workflow.logger.warning(f"none of the observables {observables} found, using all datasets")
+            return hdf5_file, None
+        return select_hdf5_rows(hdf5_file, dataset_rows), dataset_rows
+
+    async def wait_for_sim_run(self, biosim_run: BiosimSimulationRun) -> BiosimSimulationRun:
+        if self.sim_input.use_central_poller and not is_finished(biosim_run):
+            try:
+                await workflow.execute_activity(
+                    track_sim_run,
+                    args=[TrackSimRunInput(tracked_run=TrackedSimRun(biosim_run_id=biosim_run.id,
+                                                                     workflow_id=workflow.info().workflow_id,
+                                                                     status=biosim_run.status))],
+                    start_to_close_timeout=timedelta(seconds=30),
+                    retry_policy=RetryPolicy(maximum_attempts=5)
+                )
+            except ActivityError as e:
+                workflow.logger.warning(f"could not register job {biosim_run.id} with the poller, "
+                                        f"polling it directly: {e.cause}")
+            else:
+                return await self.wait_for_sim_run_signals(biosim_run)
+        return await self.poll_sim_run(biosim_run)
+
+    async def wait_for_sim_run_signals(self, biosim_run: BiosimSimulationRun) -> BiosimSimulationRun:
+        """
+        wait for the central poller to signal that the run SUCCEEDED or FAILED. In case the poller lost track of
+        the run, it is checked directly (and registered again) every poller_check_interval seconds.
+        """
+        sim_input = self.sim_input
+        num_checks = 0
+        while not is_finished(self.sim_output.biosim_run):
+            try:
+                await workflow.wait_condition(lambda: is_finished(self.sim_output.biosim_run),
+                                              timeout=timedelta(seconds=sim_input.poller_check_interval))
+            except asyncio.TimeoutError:
+                if num_checks >= sim_input.max_polls_per_run:
+                    workflow.continue_as_new(args=[replace(sim_input, biosim_run=self.sim_output.biosim_run)])
+                num_checks += 1
+                self.sim_output.biosim_run = await workflow.execute_activity(
+                    get_sim_run, args=[GetSimRunInput(biosim_run_id=biosim_run.id)],
+                    start_to_close_timeout=timedelta(seconds=60),
+                    retry_policy=RetryPolicy(maximum_attempts=3)
+                )
+                if not is_finished(self.sim_output.biosim_run):
+                    await workflow.execute_activity(
+                        track_sim_run,
+                        args=[TrackSimRunInput(tracked_run=TrackedSimRun(
+                            biosim_run_id=biosim_run.id, workflow_id=workflow.info().workflow_id,
+                            status=self.sim_output.biosim_run.status))],
+                        start_to_close_timeout=timedelta(seconds=30),
+                        retry_policy=RetryPolicy(maximum_attempts=5)
+                    )
+        assert self.sim_output.biosim_run is not None
+        workflow.logger.info(f"Job {biosim_run.id} for {sim_input.simulator_spec.simulator}, "
+                             f"status is {self.sim_output.biosim_run.status}.")
+        return self.sim_output.biosim_run
+
+    async def poll_sim_run(self, biosim_run: BiosimSimulationRun) -> BiosimSimulationRun:
+        """
+        poll the run status with exponential backoff and jitter until the run SUCCEEDED or FAILED,
+        continuing as new (with the submitted run) after max_polls_per_run polls.
+        """
+        sim_input = self.sim_input
+        poll_interval = sim_input.poll_initial_interval
+        num_polls = 0
+        while not is_finished(biosim_run):
+            if num_polls >= sim_input.max_polls_per_run:
+                workflow.logger.info(f"Job {biosim_run.id} still {biosim_run.status} after {num_polls} polls, "
+                                     f"continuing as new.")
+                workflow.continue_as_new(args=[replace(sim_input, biosim_run=biosim_run)])
+
+            jitter = workflow.random().uniform(-sim_input.poll_jitter, sim_input.poll_jitter)
+            await workflow.sleep(poll_interval * (1.0 + jitter))
+
+            biosim_run = await workflow.execute_activity(
+                get_sim_run, args=[GetSimRunInput(biosim_run_id=biosim_run.id)],
+                start_to_close_timeout=timedelta(seconds=60),
+                retry_policy=RetryPolicy(maximum_attempts=3)
+            )
+            self.sim_output.biosim_run = biosim_run
+            num_polls += 1
+
+            workflow.logger.info(
+                f"Job {biosim_run.id} for {sim_input.simulator_spec.simulator}, status is {biosim_run.status}.")
+
+            if biosim_run.status in [BiosimSimulationRunStatus.RUNNING, BiosimSimulationRunStatus.PROCESSING]:
+                max_interval = sim_input.poll_active_max_interval
+            else:
+                max_interval = sim_input.poll_max_interval
+            poll_interval = min(poll_interval * sim_input.poll_backoff_coefficient, max_interval)
+        return biosim_run
+
+    async def get_cached_results(self, content_hash: str) -> CachedSimResults | None:
+        """ look up stored results for the resolved simulator version, a failed lookup counts as a miss """
+        simulator_spec = self.sim_input.simulator_spec
+        try:
+            simulator_version: str = await workflow.execute_activity(
+                resolve_simulator_version,
+                args=[ResolveSimulatorVersionInput(simulator_spec=simulator_spec)],
+                start_to_close_timeout=timedelta(seconds=30),
+                retry_policy=RetryPolicy(maximum_attempts=3)
+            )
+            cached_sim_results: CachedSimResults | None = await workflow.execute_activity(
+                get_cached_sim_results,
+                args=[GetCachedSimResultsInput(content_hash=content_hash, simulator=simulator_spec.simulator,
+                                               simulator_version=simulator_version)],
+                start_to_close_timeout=timedelta(seconds=30),
+                retry_policy=RetryPolicy(maximum_attempts=3)
+            )
+        except ActivityError as e:
+            workflow.logger.warning(f"result cache lookup failed for {simulator_spec.simulator}: {e.cause}")
+            return None
+        return cached_sim_results
+
+    async def save_cached_results(self, content_hash: str, cached_sim_results: CachedSimResults) -> None:
+        try:
+            await workflow.execute_activity(
+                save_cached_sim_results,
+                args=[SaveCachedSimResultsInput(content_hash=content_hash, cached_sim_results=cached_sim_results)],
+                start_to_close_timeout=timedelta(seconds=30),
+                retry_policy=RetryPolicy(maximum_attempts=3)
+            )
+        except ActivityError as e:
+            workflow.logger.warning(f"could not save results of {cached_sim_results.biosim_run.id} to the cache: {e.cause}")
+
+    async def store_datasets_from_file(self, hdf5_file: HDF5File, dataset_names: list[str],
+                                       dataset_rows: dict[str, list[int]] | None) -> dict[str, Hdf5DataRef] | None:
+        """ download the complete results file in one activity, returns None if that is not possible """
+        assert self.sim_output.biosim_run is not None
+        try:
+            hdf5_data_refs: list[Hdf5DataRef] = await workflow.execute_activity(
+                store_hdf5_file,
+                args=[StoreHdf5FileInput(simulation_run_id=self.sim_output.biosim_run.id,
+                                         hdf5_file_uri=hdf5_file.uri,
+                                         dataset_names=dataset_names,
+                                         dataset_rows=dataset_rows)],
+                start_to_close_timeout=timedelta(seconds=300),
+                heartbeat_timeout=timedelta(seconds=30),
+                retry_policy=RetryPolicy(maximum_attempts=3, maximum_interval=timedelta(seconds=5), backoff_coefficient=2.0)
+            )
+        except ActivityError as e:
+            workflow.logger.warning(f"could not download {hdf5_file.uri}, fetching datasets individually: {e.cause}")
+            return None
+        return {hdf5_data_ref.dataset_name: hdf5_data_ref for hdf5_data_ref in hdf5_data_refs}
+
+    async def store_datasets_from_api(self, dataset_names: list[str],
+                                      dataset_rows: dict[str, list[int]] | None) -> dict[str, Hdf5DataRef]:
+        """
+        fetch datasets from the simdata API in batches of max_datasets_per_fetch (one activity and HTTP session
+        per batch), with at most max_concurrent_fetches batches running at the same time, each with its own retries.
+        """
+        assert self.sim_output.biosim_run is not None
+        simulation_run_id = self.sim_output.biosim_run.id
+        batch_size = max(1, self.sim_input.max_datasets_per_fetch)
+        batches = [dataset_names[i:i + batch_size] for i in range(0, len(dataset_names), batch_size)]
+        fetch_semaphore = asyncio.Semaphore(max(1, self.sim_input.max_concurrent_fetches))
+
+        async def store_datasets(batch: list[str]) -> list[Hdf5DataRef]:
+            async with fetch_semaphore:
+                workflow.logger.info(f"storing data for datasets: {batch}")
+                hdf5_data_refs: list[Hdf5DataRef] = await workflow.execute_activity(
+                    store_hdf5_datasets,
+                    args=[StoreHdf5DatasetsInput(simulation_run_id=simulation_run_id, dataset_names=batch,
+                                                 dataset_rows=dataset_rows)],
+                    start_to_close_timeout=timedelta(seconds=60),
+                    heartbeat_timeout=timedelta(seconds=30),
+                    retry_policy=RetryPolicy(maximum_attempts=100, maximum_interval=timedelta(seconds=5), backoff_coefficient=2.0)
+                )
+                return hdf5_data_refs
+
+        batch_refs: list[list[Hdf5DataRef]] = await asyncio.gather(*[store_datasets(batch) for batch in batches])
+        return {hdf5_data_ref.dataset_name: hdf5_data_ref for refs in batch_refs for hdf5_data_ref in refs}
@@ -0,0 +1,86 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from pydantic import TypeAdapter
+from temporalio import activity
+
+from biosim_server.dependencies import get_file_service, get_biosim_service
+from biosim_server.io.file_service import FileService, file_exists
+from biosim_server.omex_sim.biosim1.biosim_service import BiosimService
+from biosim_server.omex_sim.biosim1.models import BiosimSimulationRun, BiosimSimulatorSpec, Hdf5DataRef, HDF5File
+
+SIM_RESULT_CACHE_S3_PREFIX = "verify/result_cache"
+
+
+def sim_result_cache_s3_path(content_hash: str, simulator: str, simulator_version: str) -> str:
+    return f"{SIM_RESULT_CACHE_S3_PREFIX}/{content_hash}/{simulator}/{simulator_version}.json"
+
+
+@dataclass
+class CachedSimResults:
+    """ the stored results of one simulator run of one archive, enough to skip the run next time """
+    biosim_run: BiosimSimulationRun
+    hdf5_file: HDF5File
+    result_datasets: dict[str, Hdf5DataRef]
+
+
+cached_sim_results_adapter = TypeAdapter(CachedSimResults)
+
+
+@dataclass
+class ResolveSimulatorVersionInput:
+    simulator_spec: BiosimSimulatorSpec
+
+
+@activity.defn
+async def resolve_simulator_version(input: ResolveSimulatorVersionInput) -> str:
+    """ the requested version, or the version biosimulations currently runs for 'latest' """
+    activity.logger.setLevel(logging.INFO)
+    if input.simulator_spec.version is not None:
+        return input.simulator_spec.version
+    biosim_service: BiosimService | None = get_biosim_service()
+    if biosim_service is None:
+        raise Exception("Biosim service is not initialized")
+    return await biosim_service.get_latest_simulator_version(input.simulator_spec.simulator)
+
+
+@dataclass
+class GetCachedSimResultsInput:
+    content_hash: str
+    simulator: str
+    simulator_version: str
+
+
+@activity.defn
+async def get_cached_sim_results(input: GetCachedSimResultsInput) -> Optional[CachedSimResults]:
+    activity.logger.setLevel(logging.INFO)
+    file_service: FileService | None = get_file_service()
+    if file_service is None:
+        raise Exception("File service is not initialized")
+    s3_path = sim_result_cache_s3_path(input.content_hash, input.simulator, input.simulator_version)
+    if not await file_exists(file_service, s3_path):
+        return None
+    cached_sim_results = cached_sim_results_adapter.validate_json(await file_service.get_file_contents(s3_path))
+    activity.logger.info(f"found cached results of {input.simulator}:{input.simulator_version} "
+                         f"from simulation run {cached_sim_results.biosim_run.id}")
+    return cached_sim_results
+
+
+@dataclass
+class SaveCachedSimResultsInput:
+    content_hash: str
+    cached_sim_results: CachedSimResults
+
+
+@activity.defn
+async def save_cached_sim_results(input: SaveCachedSimResultsInput) -> str:
+    """ keyed by the simulator version the run actually used, which need not be the requested one """
+    activity.logger.setLevel(logging.INFO)
+    file_service: FileService | None = get_file_service()
+    if file_service is None:
+        raise Exception("File service is not initialized")
+    biosim_run = input.cached_sim_results.biosim_run
+    s3_path = sim_result_cache_s3_path(input.content_hash, biosim_run.simulator, biosim_run.simulator_version)
+    await file_service.upload_bytes(cached_sim_results_adapter.dump_json(input.cached_sim_results), s3_path)
+    return s3_path
@@ -0,0 +1,30 @@
+import logging
+from dataclasses import dataclass
+
+from temporalio import activity
+from temporalio.client import Client as TemporalClient
+
+from biosim_server.dependencies import get_temporal_client
+from biosim_server.omex_sim.workflows.sim_run_poller_workflow import SimRunPollerWorkflow, SimRunPollerInput, \
+    TrackedSimRun, SIM_RUN_POLLER_WORKFLOW_ID
+
+
+@dataclass
+class TrackSimRunInput:
+    tracked_run: TrackedSimRun
+
+
+@activity.defn
+async def track_sim_run(input: TrackSimRunInput) -> None:
+    """ register a run with the central poller, starting the poller if it is not running (signal-with-start) """
+    activity.logger.setLevel(logging.INFO)
+    temporal_client: TemporalClient | None = get_temporal_client()
+    if temporal_client is None:
+        raise Exception("Temporal client is not initialized")
+    await temporal_client.start_workflow(
+        SimRunPollerWorkflow.run,
+        args=[SimRunPollerInput()],
+        id=SIM_RUN_POLLER_WORKFLOW_ID,
+        task_queue=activity.info().task_queue,
+        start_signal="track",
+        start_signal_args=[input.tracked_run])
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field, replace
+from datetime import timedelta
+
+from temporalio import workflow
+from temporalio.common import RetryPolicy
+from temporalio.exceptions import ActivityError, FailureError
+
+from biosim_server.omex_sim.biosim1.models import BiosimSimulationRun, BiosimSimulationRunStatus
+from biosim_server.omex_sim.workflows.biosim_activities import get_sim_runs, GetSimRunsInput
+
+SIM_RUN_POLLER_WORKFLOW_ID = "biosim-run-poller"
+SIM_RUN_UPDATED_SIGNAL = "sim_run_updated"
+
+
+@dataclass
+class TrackedSimRun:
+    biosim_run_id: str
+    workflow_id: str  # workflow which is signalled (SIM_RUN_UPDATED_SIGNAL) when the run status changes
+    status: BiosimSimulationRunStatus
+
+
+@dataclass
+class SimRunPollerInput:
+    tracked_runs: list[TrackedSimRun] = field(default_factory=list)
+    sweep_interval: float = 5.0  # seconds between two sweeps over all tracked runs
+    max_concurrent_polls: int = 20  # maximum number of status requests in flight during a sweep
+    max_sweeps_per_run: int = 500  # continue-as-new after this many sweeps to keep the history bounded
+    idle_timeout: float = 300.0  # the poller completes after this many seconds without tracked runs
+
+
+@workflow.defn
+class SimRunPollerWorkflow:
+    """
+    Single long-running poller for the status of all in-flight biosimulations runs.
+
+    Workflows register their run with the track signal (see track_sim_run activity, which also starts the poller
+    if needed). Every sweep fetches the status of all tracked runs in one activity and signals the registered
+    workflow when the status of its run changed; runs which SUCCEEDED or FAILED are no longer tracked.
+    """
+    tracked_runs: dict[str, TrackedSimRun]
+
+    @workflow.init
+    def __init__(self, poller_input: SimRunPollerInput) -> None:
+        self.tracked_runs = {tracked_run.workflow_id: tracked_run for tracked_run in poller_input.tracked_runs}
+
+    @workflow.signal
+    def track(self, tracked_run: TrackedSimRun) -> None:
+        self.tracked_runs[tracked_run.workflow_id] = tracked_run
+
+    @workflow.signal
+    def untrack(self, workflow_id: str) -> None:
+        self.tracked_runs.pop(workflow_id, None)
+
+    @workflow.query
+    def get_tracked_runs(self) -> list[TrackedSimRun]:
+        return list(self.tracked_runs.values())
+
+    @workflow.run
+    async def run(self, poller_input: SimRunPollerInput) -> None:
+        workflow.logger.setLevel(level=logging.INFO)
+        num_sweeps = 0
+        while True:
+            if len(self.tracked_runs) == 0:
+                try:
+                    await workflow.wait_condition(lambda: len(self.tracked_runs) > 0,
+                                                  timeout=timedelta(seconds=poller_input.idle_timeout))
+                except asyncio.TimeoutError:
+                    workflow.logger.info("no simulation runs to poll, stopping the poller.")
+                    return
+
+            if num_sweeps >= poller_input.max_sweeps_per_run:
+                workflow.continue_as_new(args=[replace(poller_input, tracked_runs=list(self.tracked_runs.values()))])
+
+            await self.sweep(poller_input)
+            num_sweeps += 1
+            await workflow.sleep(poller_input.sweep_interval)
+
+    async def sweep(self, poller_input: SimRunPollerInput) -> None:
+        biosim_run_ids = sorted({tracked_run.biosim_run_id for tracked_run in self.tracked_runs.values()})
+        try:
+            biosim_runs: list[BiosimSimulationRun] = await workflow.execute_activity(
+                get_sim_runs,
+                args=[GetSimRunsInput(biosim_run_ids=biosim_run_ids,
+                                      max_concurrency=poller_input.max_concurrent_polls)],
+                start_to_close_timeout=timedelta(seconds=120),
+                retry_policy=RetryPolicy(maximum_attempts=3)
+            )
+        except ActivityError as e:
+            # e.g. the biosimulations API is down, every waiting workflow depends on this poller staying alive
+            workflow.logger.warning(f"could not fetch the status of {len(biosim_run_ids)} runs, "
+                                    f"skipping this sweep: {e.cause}")
+            return
+        biosim_runs_by_id = {biosim_run.id: biosim_run for biosim_run in biosim_runs}
+
+        updates: list[tuple[str, BiosimSimulationRun]] = []
+        for workflow_id, tracked_run in list(self.tracked_runs.items()):
+            biosim_run = biosim_runs_by_id.get(tracked_run.biosim_run_id)
+            if biosim_run is None or biosim_run.status == tracked_run.status:
+                continue
+            tracked_run.status = biosim_run.status
+            if biosim_run.status in [BiosimSimulationRunStatus.SUCCEEDED, BiosimSimulationRunStatus.FAILED]:
+                del self.tracked_runs[workflow_id]
+            updates.append((workflow_id, biosim_run))
+        await asyncio.gather(*[self.signal_update(workflow_id, biosim_run) for workflow_id, biosim_run in updates])
+
+    async def signal_update(self, workflow_id: str, biosim_run: BiosimSimulationRun) -> None:
+        try:
+            await workflow.get_external_workflow_handle(workflow_id).signal(SIM_RUN_UPDATED_SIGNAL, biosim_run)
+        except FailureError as e:
+            # e.g. the workflow was terminated, nobody is waiting for this run any more
+            workflow.logger.warning(f"could not signal {workflow_id}, no longer tracking it: {e}")
+            tracked_run = self.tracked_runs.get(workflow_id)
+            if tracked_run is not None and tracked_run.biosim_run_id == biosim_run.id:
+                del self.tracked_runs[workflow_id]
@@ -3,13 +3,14 @@ import uuid
 
 from temporalio.client import Client
 
+from biosim_server.data_converter import biosim_data_converter
 from biosim_server.omex_sim.biosim1.models import SourceOmex, BiosimSimulatorSpec
 from biosim_server.omex_sim.workflows.omex_sim_workflow import OmexSimWorkflow, OmexSimWorkflowInput, \
     OmexSimWorkflowOutput
 
 
 async def start_workflow() -> None:
-    client = await Client.connect("localhost:7233")
+    client = await Client.connect("localhost:7233", data_converter=biosim_data_converter)
     omex_sim_workflow_input = OmexSimWorkflowInput(
         source_omex=SourceOmex(omex_s3_file="path/to/model.obj", name="name"),
         simulator_spec=BiosimSimulatorSpec(simulator="vcell"))
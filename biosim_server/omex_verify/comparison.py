@@ -0,0 +1,272 @@
+import re
+from typing import Iterable, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+
+from biosim_server.omex_sim.biosim1.models import HDF5File, HDF5Group, HDF5Dataset
+
+
+def get_observables(hdf5_file: HDF5File, results: dict[str, NDArray[np.float64]]) -> dict[str, NDArray[np.float64]]:
+    """
+    Split the report datasets of one simulation run into one time course per observable.
+
+    Each dataset holds one row per SED-ML data set (labelled by the sedmlDataSetLabels attribute)
+    and one column per time point. If the same label appears in more than one dataset, the first one wins.
+    """
+    observables: dict[str, NDArray[np.float64]] = {}
+    for group in hdf5_file.groups:
+        for dataset in group.datasets:
+            if dataset.name not in results:
+                continue
+            values = results[dataset.name]
+            if values.ndim == 1:
+                values = values.reshape(1, -1)
+            for label, row in zip(dataset.get_labels(), values):
+                observables.setdefault(label, row)
+    return observables
+
+
+def stack_observables(sim_observables: list[dict[str, NDArray[np.float64]]]) \
+        -> tuple[list[str], NDArray[np.float64]]:
+    """
+    Stack the observables of all simulators into one array of shape (simulators, observables, time).
+
+    Observables are the union of all simulators' labels; missing observables and missing
+    trailing time points are filled with NaN.
+    """
+    names: list[str] = []
+    for observables in sim_observables:
+        for name in observables:
+            if name not in names:
+                names.append(name)
+    num_times = max((len(row) for observables in sim_observables for row in observables.values()), default=0)
+    stacked = np.full((len(sim_observables), len(names), num_times), np.nan, dtype=np.float64)
+    for sim_index, observables in enumerate(sim_observables):
+        for obs_index, name in enumerate(names):
+            row = observables.get(name)
+            if row is not None:
+                stacked[sim_index, obs_index, :len(row)] = row
+    return names, stacked
+
+
+TIME_OBSERVABLE_PATTERN = re.compile(r"(^|[_\W])time$", re.IGNORECASE)
+
+
+def find_time_observable(names: Iterable[str]) -> Optional[str]:
+    """ name of the observable holding the time points (e.g. 'time', 'Time', 'data_set_time'), if any """
+    for name in names:
+        if TIME_OBSERVABLE_PATTERN.search(name):
+            return name
+    return None
+
+
+def select_observable_rows(hdf5_file: HDF5File, observables: Iterable[str]) -> dict[str, list[int]]:
+    """
+    Rows of each dataset which hold one of the requested observables, by dataset name.
+
+    Observables are matched against the row labels (sedmlDataSetLabels) and ids (sedmlDataSetIds), ignoring case
+    (as in known_observables() at upload). Datasets with
+    a matching row also keep their time row, which is needed to align the simulators; datasets without a
+    matching row are left out.
+    """
+    requested = {observable.lower() for observable in observables}
+    dataset_rows: dict[str, list[int]] = {}
+    for group in hdf5_file.groups:
+        for dataset in group.datasets:
+            labels = dataset.get_labels()
+            ids = dataset.get_attribute("sedmlDataSetIds")
+            row_names = [[label] for label in labels]
+            if isinstance(ids, list) and len(ids) == len(labels):
+                row_names = [[label, str(row_id)] for label, row_id in zip(labels, ids)]
+            matched = [i for i, names in enumerate(row_names) if any(name.lower() in requested for name in names)]
+            if len(matched) == 0:
+                continue
+            time_rows = [i for i, names in enumerate(row_names) if find_time_observable(names) is not None]
+            dataset_rows[dataset.name] = sorted(set(matched) | set(time_rows))
+    return dataset_rows
+
+
+def select_rows(values: NDArray[np.float64], rows: Optional[list[int]]) -> NDArray[np.float64]:
+    """ the given rows of a (rows x time) dataset, 1-D datasets are a single row and returned as they are """
+    if rows is None or values.ndim < 2:
+        return values
+    return values[rows]
+
+
+def select_hdf5_rows(hdf5_file: HDF5File, dataset_rows: dict[str, list[int]]) -> HDF5File:
+    """
+    Metadata of only the datasets in dataset_rows, reduced to those rows (shape and per row attributes such as
+    sedmlDataSetLabels), describing the datasets as stored after select_rows().
+    """
+    groups: list[HDF5Group] = []
+    for group in hdf5_file.groups:
+        datasets: list[HDF5Dataset] = []
+        for dataset in group.datasets:
+            rows = dataset_rows.get(dataset.name)
+            if rows is None:
+                continue
+            if len(dataset.shape) < 2:
+                datasets.append(dataset)
+                continue
+            num_rows = dataset.shape[0]
+            attributes = [attribute.model_copy(update={"value": [attribute.value[i] for i in rows]})
+                          if isinstance(attribute.value, list) and len(attribute.value) == num_rows else attribute
+                          for attribute in dataset.attributes]
+            datasets.append(dataset.model_copy(update={"shape": [len(rows)] + dataset.shape[1:],
+                                                       "attributes": attributes}))
+        if len(datasets) > 0:
+            groups.append(group.model_copy(update={"datasets": datasets}))
+    return hdf5_file.model_copy(update={"groups": groups})
+
+
+def reference_time_grid(sim_times: list[NDArray[np.float64]]) -> NDArray[np.float64]:
+    """
+    Common time grid for a set of simulator time grids which may differ in length, start/end and float drift.
+
+    The grid is uniform over the interval covered by every simulator, with as many points as the
+    densest simulator has within that interval.
+    """
+    start = max(float(times[0]) for times in sim_times)
+    end = min(float(times[-1]) for times in sim_times)
+    if end <= start:
+        return np.array([start], dtype=np.float64)
+    # allow for float drift at the ends of the interval when counting points
+    slack = 1e-9 * max(abs(start), abs(end), end - start)
+    num_points = max(int(np.count_nonzero((times >= start - slack) & (times <= end + slack))) for times in sim_times)
+    return np.linspace(start, end, max(num_points, 2))
+
+
+def interpolate_rows(times: NDArray[np.float64], rows: NDArray[np.float64],
+                     grid: NDArray[np.float64]) -> NDArray[np.float64]:
+    """
+    Linear interpolation of every row of `rows` (observables x len(times)) onto `grid` at once.
+
+    Same semantics as np.interp applied row by row, but the interval lookup and weights are computed
+    once and shared by all rows. Grid points outside [times[0], times[-1]] are NaN rather than clamped.
+    """
+    if len(times) == 1:
+        result = np.repeat(rows[:, :1], len(grid), axis=1)
+        result[:, grid != times[0]] = np.nan
+        return result
+    upper = np.clip(np.searchsorted(times, grid, side="right"), 1, len(times) - 1)
+    lower = upper - 1
+    span = times[upper] - times[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = np.where(span > 0, (grid - times[lower]) / span, 0.0)
+    result = rows[:, lower] * (1.0 - weight) + rows[:, upper] * weight
+    result[:, (grid < times[0]) | (grid > times[-1])] = np.nan
+    return result
+
+
+def align_observables(sim_observables: list[dict[str, NDArray[np.float64]]], time_name: str) \
+        -> tuple[list[str], NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Resample the observables of all simulators onto one reference time grid.
+
+    Every simulator must have a `time_name` observable. Returns the observable names, an array of shape
+    (simulators, observables, time) on the reference grid (NaN where an observable is missing), and the grid.
+    """
+    names: list[str] = []
+    for observables in sim_observables:
+        for name in observables:
+            if name not in names:
+                names.append(name)
+
+    sim_times: list[NDArray[np.float64]] = []
+    for observables in sim_observables:
+        times = observables[time_name]
+        sim_times.append(np.sort(times) if np.any(np.diff(times) < 0) else times)
+    grid = reference_time_grid(sim_times)
+
+    aligned = np.full((len(sim_observables), len(names), len(grid)), np.nan, dtype=np.float64)
+    for sim_index, observables in enumerate(sim_observables):
+        times = observables[time_name]
+        order = np.argsort(times, kind="stable")
+        indices = [i for i, name in enumerate(names) if name in observables and len(observables[name]) == len(times)]
+        rows = np.stack([observables[names[i]] for i in indices])
+        aligned[sim_index, indices] = interpolate_rows(times[order], rows[:, order], grid)
+    return names, aligned, grid
+
+
+def align_pairs(sim_observables: list[dict[str, NDArray[np.float64]]], time_name: str,
+                first: NDArray[np.intp], second: NDArray[np.intp]) \
+        -> tuple[list[str], NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Resample both simulators of every pair (first[i], second[i]) onto the reference time grid of that pair alone.
+
+    A pair is compared over the interval covered by its two simulators, whatever the other simulators cover,
+    so its scores do not depend on which other simulators are compared at the same time. Returns the observable
+    names and two arrays of shape (pairs, observables, time), NaN padded beyond the length of a pair's grid.
+    """
+    names: list[str] = []
+    for observables in sim_observables:
+        for name in observables:
+            if name not in names:
+                names.append(name)
+    name_index = {name: i for i, name in enumerate(names)}
+
+    pair_alignments = [align_observables([sim_observables[i], sim_observables[j]], time_name)
+                       for i, j in zip(first, second)]
+    num_times = max((len(grid) for _, _, grid in pair_alignments), default=0)
+    a = np.full((len(pair_alignments), len(names), num_times), np.nan, dtype=np.float64)
+    b = np.full((len(pair_alignments), len(names), num_times), np.nan, dtype=np.float64)
+    for pair_index, (pair_names, aligned, grid) in enumerate(pair_alignments):
+        indices = [name_index[name] for name in pair_names]
+        a[pair_index, indices, :len(grid)] = aligned[0]
+        b[pair_index, indices, :len(grid)] = aligned[1]
+    return names, a, b
+
+
+def simulator_pairs(num_sims: int, with_index: Optional[int] = None) -> tuple[NDArray[np.intp], NDArray[np.intp]]:
+    """ indices of every pair of simulators, earlier simulator first (only the pairs with with_index, if given) """
+    first, second = np.triu_indices(num_sims, k=1)
+    if with_index is not None:
+        with_pair = (first == with_index) | (second == with_index)
+        first, second = first[with_pair], second[with_pair]
+    return first, second
+
+
+def sequential_sum(values: NDArray[np.float64]) -> NDArray[np.float64]:
+    """
+    Sum over the last axis, adding the values in order. Unlike the pairwise summation of np.sum, trailing zeros
+    (NaN padding of shorter pair grids) do not change the result, not even in the last bit.
+    """
+    if values.shape[-1] == 0:
+        return np.zeros(values.shape[:-1], dtype=np.float64)
+    sums: NDArray[np.float64] = np.cumsum(values, axis=-1)[..., -1]
+    return sums
+
+
+def pair_statistics(a: NDArray[np.float64], b: NDArray[np.float64], rtol: float, atol: float) \
+        -> tuple[NDArray[np.float64], NDArray[np.bool_]]:
+    """
+    RMSE and rTol/aTol closeness of a[i] and b[i] for every pair i and observable at once.
+
+    :param a: array of shape (pairs, observables, time), NaN where a value is missing, and b the same
+    :return: (rmse, within_tolerance) of shape (pairs, observables). Pairs with no overlapping points get a NaN rmse.
+    """
+    diff = a - b
+    valid = ~np.isnan(diff)
+    num_valid = valid.sum(axis=-1)
+    sum_sq = sequential_sum(np.where(valid, diff * diff, 0.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rmse = np.sqrt(sum_sq / num_valid)
+    tolerance = atol + rtol * np.maximum(np.abs(a), np.abs(b))
+    close = np.where(valid, np.abs(diff) <= tolerance, True).all(axis=-1) & (num_valid > 0)
+    return rmse, close
+
+
+def pairwise_statistics(data: NDArray[np.float64], rtol: float, atol: float, with_index: Optional[int] = None) \
+        -> tuple[NDArray[np.intp], NDArray[np.intp], NDArray[np.float64], NDArray[np.bool_]]:
+    """
+    Compare every pair of simulators for every observable at once.
+
+    :param data: array of shape (simulators, observables, time), NaN where a value is missing
+    :param with_index: only compare the pairs which include this simulator
+    :return: (first simulator index, second simulator index, rmse, within_tolerance) where rmse and
+             within_tolerance have shape (pairs, observables). Pairs with no overlapping points get a NaN rmse.
+    """
+    first, second = simulator_pairs(data.shape[0], with_index)
+    rmse, close = pair_statistics(data[first], data[second], rtol=rtol, atol=atol)
+    return first, second, rmse, close
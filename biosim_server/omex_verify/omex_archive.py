@@ -0,0 +1,121 @@
+import logging
+import xml.etree.ElementTree as ElementTree
+import zipfile
+import zlib
+from dataclasses import dataclass, field
+from typing import IO
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_LOCATION = "manifest.xml"
+SEDML_FORMAT = "combine.specifications/sed-ml"
+MAX_SEDML_SIZE = 32 * 1024 * 1024  # larger SED-ML documents are rejected rather than parsed
+MAX_MANIFEST_SIZE = 1024 * 1024  # larger manifests are rejected rather than parsed
+
+
+class OmexArchiveError(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+
+
+@dataclass
+class SedmlDataSet:
+    id: str
+    label: str
+
+
+@dataclass
+class SedmlReport:
+    dataset_name: str  # name of the report's dataset in the simulation results, e.g. 'simulation.sedml/report'
+    data_sets: list[SedmlDataSet] = field(default_factory=list)
+
+
+@dataclass
+class OmexArchiveIndex:
+    """ what the archive will report, read from its manifest and SED-ML documents before anything is simulated """
+    sedml_locations: list[str]
+    reports: list[SedmlReport]
+
+
+def read_omex_archive_index(archive: IO[bytes]) -> OmexArchiveIndex:
+    """
+    Check that archive is a COMBINE/OMEX archive with at least one uniform time course simulation and one report,
+    and index the reports. Only the zip central directory, the manifest and the SED-ML documents are read.
+
+    :raises OmexArchiveError: if the archive can not be verified
+    """
+    try:
+        with zipfile.ZipFile(archive) as zip_file:
+            members = {info.filename.removeprefix("./"): info for info in zip_file.infolist()}
+            if MANIFEST_LOCATION not in members:
+                raise OmexArchiveError("the archive has no manifest.xml")
+            if members[MANIFEST_LOCATION].file_size > MAX_MANIFEST_SIZE:
+                raise OmexArchiveError(f"the manifest of the archive is larger than {MAX_MANIFEST_SIZE} bytes")
+            sedml_locations = _read_sedml_locations(zip_file.read(members[MANIFEST_LOCATION]))
+            if len(sedml_locations) == 0:
+                raise OmexArchiveError("the manifest of the archive lists no SED-ML document")
+
+            num_time_courses = 0
+            reports: list[SedmlReport] = []
+            for sedml_location in sedml_locations:
+                info = members.get(sedml_location)
+                if info is None:
+                    raise OmexArchiveError(f"SED-ML document {sedml_location} listed in the manifest is missing")
+                if info.file_size > MAX_SEDML_SIZE:
+                    raise OmexArchiveError(f"SED-ML document {sedml_location} is larger than {MAX_SEDML_SIZE} bytes")
+                sedml = _parse_xml(zip_file.read(info), sedml_location)
+                num_time_courses += sum(1 for element in sedml.iter() if _local_name(element) == "uniformTimeCourse")
+                reports.extend(_read_reports(sedml, sedml_location))
+    except (zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError, EOFError, ValueError) as e:
+        # corrupt or truncated members, unsupported compression and encrypted members surface as these
+        raise OmexArchiveError(f"the archive is not a valid zip file: {e}")
+
+    if num_time_courses == 0:
+        raise OmexArchiveError("the SED-ML of the archive has no uniform time course simulation")
+    if len(reports) == 0:
+        raise OmexArchiveError("the SED-ML of the archive has no report")
+    return OmexArchiveIndex(sedml_locations=sedml_locations, reports=reports)
+
+
+def known_observables(omex_index: OmexArchiveIndex, observables: list[str]) -> list[str]:
+    """ the requested observables which are a data set label or id of a report (case-insensitive) """
+    names = {name.lower() for report in omex_index.reports for data_set in report.data_sets
+             for name in (data_set.id, data_set.label)}
+    return [observable for observable in observables if observable.lower() in names]
+
+
+def _read_sedml_locations(manifest_xml: bytes) -> list[str]:
+    manifest = _parse_xml(manifest_xml, MANIFEST_LOCATION)
+    locations: list[str] = []
+    for content in manifest.iter():
+        if _local_name(content) == "content" and SEDML_FORMAT in content.get("format", ""):
+            location = content.get("location", "").removeprefix("./")
+            if location != "" and location not in locations:
+                locations.append(location)
+    return locations
+
+
+def _read_reports(sedml: ElementTree.Element, sedml_location: str) -> list[SedmlReport]:
+    reports: list[SedmlReport] = []
+    for element in sedml.iter():
+        if _local_name(element) != "report":
+            continue
+        report = SedmlReport(dataset_name=f"{sedml_location}/{element.get('id', '')}")
+        for data_set in element.iter():
+            if _local_name(data_set) == "dataSet":
+                data_set_id = data_set.get("id", "")
+                report.data_sets.append(SedmlDataSet(id=data_set_id, label=data_set.get("label", data_set_id)))
+        reports.append(report)
+    return reports
+
+
+def _parse_xml(document: bytes, location: str) -> ElementTree.Element:
+    try:
+        return ElementTree.fromstring(document)
+    except ElementTree.ParseError as e:
+        raise OmexArchiveError(f"{location} is not valid XML: {e}")
+
+
+def _local_name(element: ElementTree.Element) -> str:
+    """ tag without namespace, SED-ML levels and versions use different namespaces """
+    return element.tag.rsplit("}", 1)[-1] if isinstance(element.tag, str) else ""
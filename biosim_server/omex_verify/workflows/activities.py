@@ -1,18 +1,131 @@
-from typing import List, Dict
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
 
+import numpy as np
+from numpy.typing import NDArray
 from temporalio import activity
 
+from biosim_server.config import get_settings
+from biosim_server.dependencies import get_file_service
+from biosim_server.io.array_store import NdarrayCache
+from biosim_server.io.file_service import FileService
+from biosim_server.omex_sim.biosim1.models import Hdf5DataValues
+from biosim_server.omex_sim.workflows.omex_sim_workflow import OmexSimWorkflowOutput
+from biosim_server.omex_verify.comparison import get_observables, stack_observables, pairwise_statistics, \
+    find_time_observable, align_pairs, pair_statistics, simulator_pairs, select_rows
+
+
+@dataclass
+class SimulatorRMSE:
+    simulator1: str
+    simulator2: str
+    rmse_scores: dict[str, float]
+    within_tolerance: dict[str, bool] = field(default_factory=dict)
+
+
+@dataclass
+class GenerateStatisticsInput:
+    sim_outputs: list[OmexSimWorkflowOutput]
+    include_outputs: bool
+    rTol: float
+    aTol: float
+    new_sim_index: Optional[int] = None  # only compare sim_outputs[new_sim_index] to the others (as they complete)
+
+
+@dataclass
+class GenerateStatisticsOutput:
+    compare_results: list[SimulatorRMSE]
+    sim_results: Optional[list[dict[str, Hdf5DataValues]]] = None
+
+
+# the results of a simulator are read again each time another simulator finishes, keep them in memory
+result_arrays = NdarrayCache(max_size=get_settings().storage_array_cache_max_size)
+
+
+def simulator_name(sim_output: OmexSimWorkflowOutput) -> str:
+    if sim_output.biosim_run is not None:
+        return f"{sim_output.biosim_run.simulator}:{sim_output.biosim_run.simulator_version}"
+    simulator_spec = sim_output.workflow_input.simulator_spec
+    return f"{simulator_spec.simulator}:{simulator_spec.version}" if simulator_spec.version else simulator_spec.simulator
+
+
+def compare_simulators(names: list[str], sim_observables: list[dict[str, NDArray[np.float64]]],
+                       rtol: float, atol: float, with_index: Optional[int] = None) -> list[SimulatorRMSE]:
+    """ RMSE and rTol/aTol closeness of every pair of simulators (or those with simulator with_index) """
+    # put each pair on the time grid of its own overlap, unless some simulator did not report its time points
+    time_names = [find_time_observable(observables) for observables in sim_observables]
+    time_name = time_names[0] if len(time_names) > 0 else None
+    if time_name is not None and all(name == time_name for name in time_names):
+        first, second = simulator_pairs(len(names), with_index)
+        observable_names, a, b = align_pairs(sim_observables, time_name, first, second)
+        activity.logger.info(f"aligned {len(first)} pairs of simulators onto time grids of up to {a.shape[-1]} points")
+        rmse, close = pair_statistics(a, b, rtol=rtol, atol=atol)
+    else:
+        observable_names, data = stack_observables(sim_observables)
+        first, second, rmse, close = pairwise_statistics(data, rtol=rtol, atol=atol, with_index=with_index)
+
+    compare_results: list[SimulatorRMSE] = []
+    for pair_index in range(len(first)):
+        scored = ~np.isnan(rmse[pair_index])
+        compare_results.append(SimulatorRMSE(
+            simulator1=names[first[pair_index]],
+            simulator2=names[second[pair_index]],
+            rmse_scores={observable_names[i]: float(rmse[pair_index, i]) for i in np.flatnonzero(scored)},
+            within_tolerance={observable_names[i]: bool(close[pair_index, i]) for i in np.flatnonzero(scored)}))
+    return compare_results
+
+
 @activity.defn
-async def generate_statistics(run_ids: list[str]) -> str:
+async def generate_statistics(stats_input: GenerateStatisticsInput) -> GenerateStatisticsOutput:
     """
-    Generates a comparison report from the results.
+    Compares the results of every pair of simulators, observable by observable.
 
-    Args:
-        results (List[Dict]): List of results from simulators.
+    Both simulators of a pair are resampled onto a time grid over their common interval (so that the scores of a
+    pair do not depend on the other simulators), and all pairs are stacked into (pairs x observables x time)
+    arrays so that the RMSE and rTol/aTol closeness of every pair and every observable are computed in a single
+    vectorized pass.
 
-    Returns:
-        str: S3 path or location of the report.
+    With new_sim_index, only the pairs of that simulator with each of the others are compared, and sim_results only
+    holds that simulator's results; the scores are the same as those of a comparison of all simulators at once.
+    The stored results are read through an in-memory cache, so the earlier simulators are not downloaded again
+    each time another one finishes.
     """
-    # Simulate report generation logic
-    report_path = "s3://bucket-name/reports/final_report.pdf"
-    return report_path
+    activity.logger.setLevel(logging.INFO)
+    file_service: FileService | None = get_file_service()
+    if file_service is None:
+        raise Exception("File service is not initialized")
+
+    names: list[str] = []
+    sim_observables: list[dict[str, NDArray[np.float64]]] = []
+    sim_results: list[dict[str, Hdf5DataValues]] = []
+    new_sim_position: Optional[int] = None
+    for sim_index, sim_output in enumerate(stats_input.sim_outputs):
+        if sim_output.result_datasets is None or sim_output.hdf5_file is None:
+            activity.logger.warning(f"no results for simulator {simulator_name(sim_output)}, skipping")
+            continue
+        hdf5_file = sim_output.hdf5_file
+        results: dict[str, NDArray[np.float64]] = {}
+        for dataset_name, hdf5_data_ref in sim_output.result_datasets.items():
+            values = await result_arrays.load(file_service, hdf5_data_ref.s3_path)
+            # complete cached results reused for a request with observables are reduced to the requested rows
+            results[dataset_name] = select_rows(values, (sim_output.dataset_rows or {}).get(dataset_name))
+        if sim_index == stats_input.new_sim_index:
+            new_sim_position = len(names)
+        names.append(simulator_name(sim_output))
+        sim_observables.append(get_observables(hdf5_file, results))
+        if stats_input.include_outputs and stats_input.new_sim_index in (None, sim_index):
+            sim_results.append({name: Hdf5DataValues(shape=list(values.shape), values=values.ravel().tolist())
+                                for name, values in results.items()})
+
+    compare_results: list[SimulatorRMSE] = []
+    if stats_input.new_sim_index is None:
+        compare_results = compare_simulators(names, sim_observables, stats_input.rTol, stats_input.aTol)
+    elif new_sim_position is not None:
+        compare_results = compare_simulators(names, sim_observables, stats_input.rTol, stats_input.aTol,
+                                             with_index=new_sim_position)
+    activity.logger.info(f"compared {len(names)} simulators in {len(compare_results)} pairs "
+                         f"(result cache: {result_arrays.hits} hits, {result_arrays.misses} misses)")
+
+    return GenerateStatisticsOutput(compare_results=compare_results,
+                                    sim_results=sim_results if stats_input.include_outputs else None)
@@ -7,11 +7,14 @@ from typing import Any, Optional
 
 from temporalio import workflow
 from temporalio.common import RetryPolicy
+from temporalio.exceptions import ChildWorkflowError
 from temporalio.workflow import ChildWorkflowHandle
 
 from biosim_server.omex_sim.biosim1.models import BiosimSimulatorSpec, SourceOmex, Hdf5DataValues
-from biosim_server.omex_sim.workflows.omex_sim_workflow import OmexSimWorkflow, OmexSimWorkflowInput
-from biosim_server.omex_verify.workflows.activities import generate_statistics
+from biosim_server.omex_sim.workflows.omex_sim_workflow import OmexSimWorkflow, OmexSimWorkflowInput, \
+    OmexSimWorkflowOutput
+from biosim_server.omex_verify.workflows.activities import generate_statistics, GenerateStatisticsInput, \
+    GenerateStatisticsOutput, SimulatorRMSE
 
 
 class OmexVerifyWorkflowStatus(StrEnum):
@@ -19,6 +22,7 @@ class OmexVerifyWorkflowStatus(StrEnum):
     IN_PROGRESS = "IN_PROGRESS"
     COMPLETED = "COMPLETED"
     FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
 
 
 @dataclass
@@ -33,13 +37,6 @@ class OmexVerifyWorkflowInput:
     observables: Optional[list[str]] = None
 
 
-@dataclass
-class SimulatorRMSE:
-    simulator1: str
-    simulator2: str
-    rmse_scores: dict[str, float]
-
-
 @dataclass
 class OmexVerifyWorkflowResults:
     sim_results: Optional[list[dict[str, Hdf5DataValues]]] = None
@@ -60,6 +57,9 @@ class OmexVerifyWorkflowOutput:
 class OmexVerifyWorkflow:
     verify_input: OmexVerifyWorkflowInput
     verify_output: OmexVerifyWorkflowOutput
+    sim_outputs: dict[int, OmexSimWorkflowOutput]  # finished simulators by index in requested_simulators
+    compare_results: dict[tuple[int, int], SimulatorRMSE]
+    sim_results: dict[int, dict[str, Hdf5DataValues]]
 
     @workflow.init
     def __init__(self, verify_input: OmexVerifyWorkflowInput) -> None:
@@ -70,6 +70,9 @@ class OmexVerifyWorkflow:
             workflow_run_id=workflow.info().run_id,
             workflow_status=OmexVerifyWorkflowStatus.IN_PROGRESS,
             timestamp=str(workflow.now()))
+        self.sim_outputs = {}
+        self.compare_results = {}
+        self.sim_results = {}
 
     @workflow.query(name="get_output")
     async def get_omex_sim_workflow_output(self) -> OmexVerifyWorkflowOutput:
@@ -88,7 +91,8 @@ class OmexVerifyWorkflow:
                     OmexSimWorkflow.run,
                     args=[OmexSimWorkflowInput(
                         source_omex=verify_input.source_omex,
-                        simulator_spec=simulator_spec)],
+                        simulator_spec=simulator_spec,
+                        observables=verify_input.observables)],
                     task_queue="verification_tasks",
                     execution_timeout=timedelta(minutes=10),
                 )
@@ -96,36 +100,81 @@ class OmexVerifyWorkflow:
 
         workflow.logger.info(f"Launched {len(child_workflows)} child workflows.")
 
-        # # print types of all members of child_workflows
-        # for i in child_workflows:
-        #     workflow.logger.info(f"waiting for child workflow type is {type(i)}")
-        #     await i
-        #
-
-        # Wait for all child workflows to complete
-        child_results: list[ChildWorkflowHandle[dict[str, str], Any]] = await asyncio.gather(*child_workflows)
-        # print types of all members of child_results
-        for i in child_results:
-            workflow.logger.info(f"child_results member type is {type(i)}")
-
-        workflow.logger.info(f"All child workflows completed: {child_results}")
-        workflow.logger.info(f"child_results type is {type(child_results)}")
-
-        real_results: list[str] = []
-        for i in child_results:
-            workflow.logger.info(f"child_results member type is {type(i)}")
-            a: ChildWorkflowHandle[dict[str,str], Any] = i
-            real_results.append(str(await a))
-            workflow.logger.info(f"real_results member type is {type(a.result())}")
-
-        # Generate comparison report
-        report_location = await workflow.execute_activity(
-            generate_statistics,
-            arg=real_results,
-            start_to_close_timeout=timedelta(seconds=10),
-            retry_policy=RetryPolicy(maximum_attempts=100, backoff_coefficient=2.0, maximum_interval=timedelta(seconds=10)),
-        )
-        workflow.logger.info(f"Report generated at: {report_location}")
-
-        # Return the report location
+        child_handles: list[ChildWorkflowHandle[OmexSimWorkflow, OmexSimWorkflowOutput]] = \
+            await asyncio.gather(*child_workflows)
+
+        # compare each simulator to those already finished as soon as it finishes (one at a time),
+        # so that the get_output query shows partial results without waiting for the slowest simulator
+        self.verify_output.workflow_results = OmexVerifyWorkflowResults(
+            sim_results=[] if verify_input.include_outputs else None, compare_results=[])
+        compare_lock = asyncio.Lock()
+
+        async def collect(sim_index: int,
+                          child_handle: ChildWorkflowHandle[OmexSimWorkflow, OmexSimWorkflowOutput]) -> None:
+            sim_output = await child_handle
+            async with compare_lock:
+                await self.add_sim_output(sim_index, sim_output)
+
+        collect_tasks = [asyncio.create_task(collect(sim_index, child_handle))
+                         for sim_index, child_handle in enumerate(child_handles)]
+        try:
+            await asyncio.gather(*collect_tasks)
+        except (asyncio.CancelledError, ChildWorkflowError) as e:
+            # cancelled by the client, or a simulator failed or timed out: stop the remaining simulators
+            # (each child stops polling and cancels its activities) and keep the results gathered so far
+            workflow.logger.info(f"Cancelling unfinished child workflows: {e}")
+            for child_handle in child_handles:
+                if not child_handle.done():
+                    child_handle.cancel()
+            for collect_task in collect_tasks:
+                collect_task.cancel()
+            await asyncio.gather(*collect_tasks, return_exceptions=True)
+            if isinstance(e, asyncio.CancelledError):
+                self.verify_output.workflow_status = OmexVerifyWorkflowStatus.CANCELLED
+                raise
+            self.verify_output.workflow_status = OmexVerifyWorkflowStatus.FAILED
+            return self.verify_output
+
+        workflow.logger.info(f"All child workflows completed: "
+                             f"{[self.sim_outputs[i].workflow_status for i in sorted(self.sim_outputs)]}")
+
+        self.verify_output.workflow_status = OmexVerifyWorkflowStatus.COMPLETED
         return self.verify_output
+
+    async def add_sim_output(self, sim_index: int, sim_output: OmexSimWorkflowOutput) -> None:
+        """ compare a newly finished simulator to the finished ones with results and publish the partial output """
+        verify_input = self.verify_input
+        self.sim_outputs[sim_index] = sim_output
+        workflow.logger.info(f"Child workflow for {sim_output.workflow_input.simulator_spec.simulator} "
+                             f"finished with status {sim_output.workflow_status}.")
+
+        if sim_output.result_datasets is not None and sim_output.hdf5_file is not None:
+            sim_indices = [i for i in sorted(self.sim_outputs)
+                           if self.sim_outputs[i].result_datasets is not None
+                           and self.sim_outputs[i].hdf5_file is not None]
+            new_sim_index = sim_indices.index(sim_index)
+            stats_output: GenerateStatisticsOutput = await workflow.execute_activity(
+                generate_statistics,
+                arg=GenerateStatisticsInput(sim_outputs=[self.sim_outputs[i] for i in sim_indices],
+                                            include_outputs=verify_input.include_outputs,
+                                            rTol=verify_input.rTol,
+                                            aTol=verify_input.aTol,
+                                            new_sim_index=new_sim_index),
+                start_to_close_timeout=timedelta(seconds=60),
+                retry_policy=RetryPolicy(maximum_attempts=100, backoff_coefficient=2.0, maximum_interval=timedelta(seconds=10)),
+            )
+            # the pairs come back in order of the other simulator, each with the earlier simulator first
+            other_indices = [i for i in sim_indices if i != sim_index]
+            for other_index, compare_result in zip(other_indices, stats_output.compare_results):
+                self.compare_results[(min(other_index, sim_index), max(other_index, sim_index))] = compare_result
+            if stats_output.sim_results:
+                self.sim_results[sim_index] = stats_output.sim_results[0]
+            workflow.logger.info(f"Generated {len(stats_output.compare_results)} simulator comparisons.")
+
+        self.verify_output.actual_simulators = [
+            BiosimSimulatorSpec(simulator=o.biosim_run.simulator, version=o.biosim_run.simulator_version)
+            if o.biosim_run is not None else o.workflow_input.simulator_spec
+            for o in [self.sim_outputs[i] for i in sorted(self.sim_outputs)]]
+        self.verify_output.workflow_results = OmexVerifyWorkflowResults(
+            sim_results=[self.sim_results[i] for i in sorted(self.sim_results)] if verify_input.include_outputs else None,
+            compare_results=[self.compare_results[pair] for pair in sorted(self.compare_results)])
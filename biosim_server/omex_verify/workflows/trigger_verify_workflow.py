@@ -3,12 +3,13 @@ import uuid
 
 from temporalio.client import Client
 
+from biosim_server.data_converter import biosim_data_converter
 from biosim_server.omex_sim.biosim1.models import SourceOmex, BiosimSimulatorSpec
 from biosim_server.omex_verify.workflows.omex_verify_workflow import OmexVerifyWorkflow, OmexVerifyWorkflowInput
 
 
 async def start_workflow() -> None:
-    client = await Client.connect("localhost:7233")
+    client = await Client.connect("localhost:7233", data_converter=biosim_data_converter)
     source_omex = SourceOmex(omex_s3_file="path/to/model.omex", name="model_name")
     workflow_id = uuid.uuid4().hex
     handle = await client.start_workflow(
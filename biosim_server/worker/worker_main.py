@@ -2,12 +2,17 @@ import asyncio
 import logging
 import random
 
-from temporalio.client import Client
 from temporalio.worker import Worker, UnsandboxedWorkflowRunner
 
+from biosim_server.dependencies import init_standalone, shutdown_standalone, get_temporal_client
 from biosim_server.omex_verify.workflows.activities import generate_statistics
-from biosim_server.omex_sim.workflows.biosim_activities import get_sim_run, submit_biosim_sim
-from biosim_server.omex_sim.workflows.biosim_activities import get_hdf5_metadata, get_hdf5_data
+from biosim_server.omex_sim.workflows.biosim_activities import get_sim_run, get_sim_runs, cancel_biosim_sim, submit_biosim_sim
+from biosim_server.omex_sim.workflows.biosim_activities import get_hdf5_metadata, get_hdf5_data, \
+    store_hdf5_datasets, store_hdf5_file
+from biosim_server.omex_sim.workflows.result_cache_activities import resolve_simulator_version, \
+    get_cached_sim_results, save_cached_sim_results
+from biosim_server.omex_sim.workflows.sim_run_poller_activities import track_sim_run
+from biosim_server.omex_sim.workflows.sim_run_poller_workflow import SimRunPollerWorkflow
 from biosim_server.omex_sim.workflows.omex_sim_workflow import OmexSimWorkflow
 from biosim_server.omex_verify.workflows.omex_verify_workflow import OmexVerifyWorkflow
 
@@ -19,20 +24,28 @@ async def main() -> None:
 
     random.seed(667)
 
-    client = await Client.connect("localhost:7233")
+    # activities share the process-wide file service and biosim service (and their connection pools)
+    await init_standalone()
+    client = get_temporal_client()
+    assert client is not None
 
     run_futures = []
     handle = Worker(
         client,
         task_queue="verification_tasks",
-        workflows=[OmexVerifyWorkflow, OmexSimWorkflow],
-        activities=[generate_statistics, get_sim_run, submit_biosim_sim, get_hdf5_metadata, get_hdf5_data],
+        workflows=[OmexVerifyWorkflow, OmexSimWorkflow, SimRunPollerWorkflow],
+        activities=[generate_statistics, get_sim_run, submit_biosim_sim, get_hdf5_metadata, get_hdf5_data,
+                    store_hdf5_datasets, store_hdf5_file, resolve_simulator_version,
+                    get_cached_sim_results, save_cached_sim_results, get_sim_runs, track_sim_run, cancel_biosim_sim],
         workflow_runner=UnsandboxedWorkflowRunner()
     )
     run_futures.append(handle.run())
     print("Started worker for verification_tasks, ctrl+c to exit")
 
-    await asyncio.gather(*run_futures)
+    try:
+        await asyncio.gather(*run_futures)
+    finally:
+        await shutdown_standalone()
 
 
 if __name__ == "__main__":
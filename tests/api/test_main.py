@@ -1,15 +1,18 @@
+import hashlib
 import os
 from copy import copy
 from dataclasses import asdict
+from io import BytesIO
 from pathlib import Path
 
 import pytest
+from fastapi import HTTPException, UploadFile
 from httpx import ASGITransport, AsyncClient
 from temporalio.client import Client
 from temporalio.worker import Worker
 from testcontainers.mongodb import MongoDbContainer  # type: ignore
 
-from biosim_server.api.main import app
+from biosim_server.api.main import app, read_uploaded_file, omex_s3_path as omex_s3_path_for
 from biosim_server.io.file_service_local import FileServiceLocal
 from biosim_server.omex_sim.biosim1.biosim_service_rest import BiosimServiceRest
 from biosim_server.omex_sim.biosim1.models import SourceOmex
@@ -68,7 +71,8 @@ async def test_verify_and_get_output(verify_workflow_input: OmexVerifyWorkflowIn
                 workflow_input=OmexVerifyWorkflowInput(
                     workflow_id=dict_response["workflow_input"]["workflow_id"],
                     source_omex=SourceOmex(omex_s3_file=dict_response["workflow_input"]["source_omex"]["omex_s3_file"],
-                                           name=dict_response["workflow_input"]["source_omex"]["name"]),
+                                           name=dict_response["workflow_input"]["source_omex"]["name"],
+                                           content_hash=dict_response["workflow_input"]["source_omex"]["content_hash"]),
                     user_description=dict_response["workflow_input"]["user_description"],
                     requested_simulators=dict_response["workflow_input"]["requested_simulators"],
                     include_outputs=dict_response["workflow_input"]["include_outputs"],
@@ -88,7 +92,9 @@ async def test_verify_and_get_output(verify_workflow_input: OmexVerifyWorkflowIn
                 timestamp=output.timestamp,
                 workflow_run_id=output.workflow_run_id
             )
+            expected_verify_workflow_output.workflow_input.source_omex = copy(expected_verify_workflow_output.workflow_input.source_omex)
             expected_verify_workflow_output.workflow_input.source_omex.omex_s3_file = output.workflow_input.source_omex.omex_s3_file
+            expected_verify_workflow_output.workflow_input.source_omex.content_hash = output.workflow_input.source_omex.content_hash
             expected_verify_workflow_output.workflow_input.workflow_id = output.workflow_input.workflow_id
             expected_verify_workflow_output.timestamp = output.timestamp
             expected_verify_workflow_output.workflow_run_id = output.workflow_run_id
@@ -96,8 +102,9 @@ async def test_verify_and_get_output(verify_workflow_input: OmexVerifyWorkflowIn
 
     # verify the omex_s3_path file to the original file_path
     # this works because we are using the local file service instead of S3
-    omex_s3_path = Path(output.workflow_input.source_omex.omex_s3_file)
+    omex_s3_path = file_service_local.BASE_DIR / output.workflow_input.source_omex.omex_s3_file
     assert omex_s3_path.exists()
+    assert output.workflow_input.source_omex.omex_s3_file == omex_s3_path_for(hashlib.sha256(file_path.read_bytes()).hexdigest())
     with open(omex_s3_path, "rb") as f:
         assert f.read() == file_path.read_bytes()
 
@@ -109,5 +116,42 @@ async def test_verify_and_get_output(verify_workflow_input: OmexVerifyWorkflowIn
     expected_verify_workflow_output.timestamp = workflow_handle_result['timestamp']
     expected_verify_workflow_output.workflow_run_id = workflow_handle_result['workflow_run_id']
     expected_verify_workflow_output.workflow_status = workflow_handle_result['workflow_status']
+    assert workflow_handle_result['workflow_results']['compare_results'] is not None
+    expected_verify_workflow_output.actual_simulators = workflow_handle_result['actual_simulators']
+    expected_verify_workflow_output.workflow_results = workflow_handle_result['workflow_results']
 
     assert workflow_handle_result == asdict(expected_verify_workflow_output)
+
+
+@pytest.mark.asyncio
+async def test_read_uploaded_file_max_size() -> None:
+    uploaded_file = UploadFile(file=BytesIO(b"0123456789"), filename="test.omex")
+    chunks = [chunk async for chunk in read_uploaded_file(uploaded_file, max_size=10, chunk_size=4)]
+    assert chunks == [b"0123", b"4567", b"89"]
+
+    uploaded_file = UploadFile(file=BytesIO(b"0123456789"), filename="test.omex")
+    with pytest.raises(HTTPException) as exc_info:
+        _ = [chunk async for chunk in read_uploaded_file(uploaded_file, max_size=9, chunk_size=4)]
+    assert exc_info.value.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_verify_rejects_invalid_archive(file_service_local: FileServiceLocal) -> None:
+    root_dir = Path(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    file_path = root_dir / "local_data" / "BIOMD0000000010_tellurium_Negative_feedback_and_ultrasen.omex"
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as test_client:
+        # not a zip file, rejected before anything is stored or simulated
+        files = {"uploaded_file": ("invalid.omex", b"not an archive", "application/zip")}
+        response = await test_client.post("/verify", files=files, params={"user_description": "invalid"})
+        assert response.status_code == 400
+        assert "not a valid zip file" in response.json()["detail"]
+        invalid_s3_path = omex_s3_path_for(hashlib.sha256(b"not an archive").hexdigest())
+        assert not (file_service_local.BASE_DIR / invalid_s3_path).exists()
+
+        # none of the requested observables is in a report of the archive
+        with open(file_path, "rb") as f:
+            files = {"uploaded_file": (file_path.name, f.read(), "application/zip")}
+        response = await test_client.post("/verify", files=files,
+                                          params={"user_description": "unknown", "observables": ["unknown"]})
+        assert response.status_code == 400
+        assert "none of the observables" in response.json()["detail"]
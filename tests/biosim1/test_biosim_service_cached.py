@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from biosim_server.io.file_service_local import FileServiceLocal
+from biosim_server.omex_sim.biosim1.biosim_service_cached import BiosimServiceCached, Hdf5MetadataCache
+from biosim_server.omex_sim.biosim1.models import HDF5File
+from tests.fixtures.biosim_service_mock import BiosimServiceMock
+
+
+class CountingBiosimService(BiosimServiceMock):
+    metadata_count: int = 0
+
+    async def get_hdf5_metadata(self, simulation_run_id: str) -> HDF5File:
+        self.metadata_count += 1
+        await asyncio.sleep(0.01)
+        return await super().get_hdf5_metadata(simulation_run_id)
+
+
+def make_hdf5_file(run_id: str) -> HDF5File:
+    return HDF5File(filename="reports.h5", id=run_id, uri=f"https://example.com/{run_id}/reports.h5", groups=[])
+
+
+@pytest.mark.asyncio
+async def test_biosim_service_cached() -> None:
+    now = [0.0]
+    biosim_service = CountingBiosimService(hdf5_files={run_id: make_hdf5_file(run_id) for run_id in ["a", "b", "c"]})
+    metadata_cache = Hdf5MetadataCache(max_entries=2, ttl=60.0, clock=lambda: now[0])
+    biosim_service_cached = BiosimServiceCached(biosim_service, metadata_cache)
+
+    # concurrent requests for the same run share one fetch
+    hdf5_files = await asyncio.gather(*[biosim_service_cached.get_hdf5_metadata("a") for _ in range(5)])
+    assert hdf5_files == [make_hdf5_file("a")] * 5
+    assert biosim_service.metadata_count == 1
+    assert (metadata_cache.hits, metadata_cache.misses) == (4, 1)
+    assert len(metadata_cache._locks) == 0
+
+    # the least recently used run is evicted beyond max_entries
+    await biosim_service_cached.get_hdf5_metadata("b")
+    await biosim_service_cached.get_hdf5_metadata("a")
+    await biosim_service_cached.get_hdf5_metadata("c")
+    assert metadata_cache.get("b") is None and metadata_cache.get("a") is not None
+    assert biosim_service.metadata_count == 3
+
+    # entries expire after ttl
+    now[0] = 61.0
+    await biosim_service_cached.get_hdf5_metadata("a")
+    assert biosim_service.metadata_count == 4
+
+
+@pytest.mark.asyncio
+async def test_biosim_service_cached_persisted(file_service_local: FileServiceLocal) -> None:
+    biosim_service = CountingBiosimService(hdf5_files={"persisted_run": make_hdf5_file("persisted_run")})
+    first_cache = Hdf5MetadataCache(max_entries=10, ttl=60.0, file_service=file_service_local)
+    await BiosimServiceCached(biosim_service, first_cache).get_hdf5_metadata("persisted_run")
+
+    # e.g. another worker process, reads the persisted metadata instead of calling the API
+    second_cache = Hdf5MetadataCache(max_entries=10, ttl=60.0, file_service=file_service_local)
+    hdf5_file = await BiosimServiceCached(biosim_service, second_cache).get_hdf5_metadata("persisted_run")
+
+    assert hdf5_file == make_hdf5_file("persisted_run")
+    assert biosim_service.metadata_count == 1
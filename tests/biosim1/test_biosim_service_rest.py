@@ -0,0 +1,17 @@
+import pytest
+
+from biosim_server.omex_sim.biosim1.biosim_service_rest import BiosimServiceRest
+
+
+@pytest.mark.asyncio
+async def test_shared_session(biosim_service_rest: BiosimServiceRest) -> None:
+    session = biosim_service_rest._get_session()
+    assert biosim_service_rest._get_session() is session
+    assert session.connector is not None
+    assert session.connector.limit_per_host > 0
+
+    await biosim_service_rest.close()
+    assert session.closed
+
+    # a closed service opens a new session on next use
+    assert biosim_service_rest._get_session() is not session
@@ -0,0 +1,16 @@
+from pathlib import Path
+
+from biosim_server.omex_sim.biosim1.hdf5_local import read_hdf5_datasets
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+
+
+def test_read_hdf5_datasets() -> None:
+    hdf5_path = ROOT_DIR / "local_data" / "repressilator_copasi.h5"
+
+    datasets = read_hdf5_datasets(hdf5_path, ["simulation.sedml/report", "simulation.sedml/Figure_1c"])
+
+    assert datasets["simulation.sedml/report"].shape == (7, 601)
+    assert datasets["simulation.sedml/Figure_1c"].shape == (4, 601)
+    # first row of the report is time (output starts at t=400)
+    assert datasets["simulation.sedml/report"][0, 0] == 400.0
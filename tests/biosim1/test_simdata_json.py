@@ -0,0 +1,31 @@
+import json
+
+import numpy as np
+import pytest
+
+from biosim_server.omex_sim.biosim1 import simdata_json
+from biosim_server.omex_sim.biosim1.simdata_json import parse_hdf5_data_json
+
+
+def test_parse_hdf5_data_json() -> None:
+    values = np.random.default_rng(0).random((7, 601))
+    body = json.dumps({"shape": [7, 601], "values": values.tolist()}).encode()
+
+    assert np.array_equal(parse_hdf5_data_json(body), values)
+
+
+def test_parse_hdf5_data_json_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(simdata_json, "_CHUNK_SIZE", 64)
+    values = np.linspace(-1e5, 1e-5, 300).reshape(3, 100)
+    body = json.dumps({"values": values.tolist(), "shape": [3, 100]}).encode()
+
+    assert np.array_equal(parse_hdf5_data_json(body), values)
+
+
+def test_parse_hdf5_data_json_fallback() -> None:
+    # null is not a number for numpy, such responses are parsed with the json module
+    body = b'{"shape": [2, 2], "values": [[1.0, null], [3.0, 4.0]]}'
+
+    parsed = parse_hdf5_data_json(body)
+
+    assert parsed.shape == (2, 2) and np.isnan(parsed[0, 1]) and parsed[1, 1] == 4.0
@@ -1,5 +1,9 @@
+import shutil
 import uuid
+from pathlib import Path
 
+import numpy as np
+from numpy.typing import NDArray
 from typing_extensions import override
 
 from biosim_server.omex_sim.biosim1.biosim_service import BiosimService
@@ -16,17 +20,22 @@ class BiosimServiceMock(BiosimService):
     sim_runs: dict[str, BiosimSimulationRun] = {}
     hdf5_files: dict[str, HDF5File] = {}
     hdf5_data: dict[str, dict[str, Hdf5DataValues]] = {}
+    hdf5_file_paths: dict[str, Path] = {}
+    submitted_urls: list[str] = []
 
     def __init__(self,
                  sim_runs: dict[str, BiosimSimulationRun] | None = None,
                  hdf5_files: dict[str, HDF5File] | None = None,
-                 hdf5_data: dict[str, dict[str, Hdf5DataValues]] | None = None) -> None:
+                 hdf5_data: dict[str, dict[str, Hdf5DataValues]] | None = None,
+                 hdf5_file_paths: dict[str, Path] | None = None) -> None:
         if sim_runs:
             self.sim_runs = sim_runs
         if hdf5_files:
             self.hdf5_files = hdf5_files
         if hdf5_data:
             self.hdf5_data = hdf5_data
+        if hdf5_file_paths:
+            self.hdf5_file_paths = hdf5_file_paths
 
     @override
     async def get_sim_run(self, simulation_run_id: str) -> BiosimSimulationRun:
@@ -50,6 +59,20 @@ class BiosimServiceMock(BiosimService):
         self.sim_runs[sim_id] = sim_run
         return sim_run
 
+    @override
+    async def run_biosim_sim_from_url(self, omex_url: str, omex_name: str, simulator_spec: BiosimSimulatorSpec) -> BiosimSimulationRun:
+        self.submitted_urls.append(omex_url)
+        return await self.run_biosim_sim(local_omex_path="", omex_name=omex_name, simulator_spec=simulator_spec)
+
+    @override
+    async def cancel_sim_run(self, simulation_run_id: str) -> bool:
+        self.sim_runs[simulation_run_id].status = BiosimSimulationRunStatus.FAILED
+        return True
+
+    @override
+    async def get_latest_simulator_version(self, simulator: str) -> str:
+        return "1.0"
+
     @override
     async def get_hdf5_metadata(self, simulation_run_id: str) -> HDF5File:
         hdf5_file = self.hdf5_files[simulation_run_id]
@@ -66,6 +89,21 @@ class BiosimServiceMock(BiosimService):
         else:
             raise ObjectNotFoundError("HDF5 metadata not found")
 
+    @override
+    async def get_hdf5_datasets(self, simulation_run_id: str,
+                                dataset_names: list[str]) -> dict[str, NDArray[np.float64]]:
+        arrays: dict[str, NDArray[np.float64]] = {}
+        for dataset_name in dataset_names:
+            hdf5_data_values = await self.get_hdf5_data(simulation_run_id, dataset_name)
+            arrays[dataset_name] = np.asarray(hdf5_data_values.values, dtype=np.float64).reshape(hdf5_data_values.shape)
+        return arrays
+
+    @override
+    async def download_hdf5_file(self, hdf5_file_uri: str, local_path: Path) -> None:
+        if hdf5_file_uri not in self.hdf5_file_paths:
+            raise ObjectNotFoundError("HDF5 file not found")
+        shutil.copyfile(self.hdf5_file_paths[hdf5_file_uri], local_path)
+
     @override
     async def close(self) -> None:
         pass
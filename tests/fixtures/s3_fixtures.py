@@ -24,6 +24,7 @@ async def file_service_local() -> AsyncGenerator[FileServiceLocal, None]:
 @pytest_asyncio.fixture(scope="session")
 async def file_service_s3() -> AsyncGenerator[FileServiceS3, None]:
     file_service_s3: FileServiceS3 = FileServiceS3()
+    await file_service_s3.init()
     saved_file_service = get_file_service()
     set_file_service(file_service_s3)
 
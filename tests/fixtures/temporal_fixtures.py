@@ -6,9 +6,15 @@ from temporalio.client import Client
 from temporalio.testing import WorkflowEnvironment
 from temporalio.worker import Worker, UnsandboxedWorkflowRunner
 
+from biosim_server.data_converter import biosim_data_converter
 from biosim_server.dependencies import get_temporal_client, set_temporal_client
 from biosim_server.omex_verify.workflows.activities import generate_statistics
-from biosim_server.omex_sim.workflows.biosim_activities import get_sim_run, submit_biosim_sim, get_hdf5_metadata, get_hdf5_data
+from biosim_server.omex_sim.workflows.biosim_activities import get_sim_run, get_sim_runs, cancel_biosim_sim, submit_biosim_sim, \
+    get_hdf5_metadata, get_hdf5_data, store_hdf5_datasets, store_hdf5_file
+from biosim_server.omex_sim.workflows.result_cache_activities import resolve_simulator_version, \
+    get_cached_sim_results, save_cached_sim_results
+from biosim_server.omex_sim.workflows.sim_run_poller_activities import track_sim_run
+from biosim_server.omex_sim.workflows.sim_run_poller_workflow import SimRunPollerWorkflow
 from biosim_server.omex_sim.workflows.omex_sim_workflow import OmexSimWorkflow
 from biosim_server.omex_verify.workflows.omex_verify_workflow import OmexVerifyWorkflow
 
@@ -17,11 +23,11 @@ from biosim_server.omex_verify.workflows.omex_verify_workflow import OmexVerifyW
 async def temporal_env(request: pytest.FixtureRequest) -> AsyncGenerator[WorkflowEnvironment, None]:
     env_type = request.config.getoption("--workflow-environment")
     if env_type == "local":
-        env = await WorkflowEnvironment.start_local()
+        env = await WorkflowEnvironment.start_local(data_converter=biosim_data_converter)
     elif env_type == "time-skipping":
-        env = await WorkflowEnvironment.start_time_skipping()
+        env = await WorkflowEnvironment.start_time_skipping(data_converter=biosim_data_converter)
     else:
-        env = WorkflowEnvironment.from_client(await Client.connect(env_type))
+        env = WorkflowEnvironment.from_client(await Client.connect(env_type, data_converter=biosim_data_converter))
 
     yield env
 
@@ -43,8 +49,10 @@ async def temporal_verify_worker(temporal_client: Client) -> AsyncGenerator[Work
     async with Worker(
             temporal_client,
             task_queue="verification_tasks",
-            workflows=[OmexVerifyWorkflow, OmexSimWorkflow],
-            activities=[generate_statistics, get_sim_run, submit_biosim_sim, get_hdf5_metadata, get_hdf5_data],
+            workflows=[OmexVerifyWorkflow, OmexSimWorkflow, SimRunPollerWorkflow],
+            activities=[generate_statistics, get_sim_run, submit_biosim_sim, get_hdf5_metadata, get_hdf5_data,
+                        store_hdf5_datasets, store_hdf5_file, resolve_simulator_version,
+                        get_cached_sim_results, save_cached_sim_results, get_sim_runs, track_sim_run, cancel_biosim_sim],
             debug_mode=True,
             workflow_runner=UnsandboxedWorkflowRunner()
     ) as worker:
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from biosim_server.io.array_store import ndarray_to_bytes, ndarray_from_bytes, save_ndarray, load_ndarray, \
+    NdarrayCache
+from biosim_server.io.file_service_local import FileServiceLocal
+
+
+def test_ndarray_bytes_round_trip() -> None:
+    values = np.linspace(0.0, 1.0, 3003).reshape(3, 1001)
+
+    contents = ndarray_to_bytes(values)
+
+    # raw float64 values plus a small header
+    assert len(contents) < values.nbytes + 256
+    assert np.array_equal(ndarray_from_bytes(contents), values)
+
+
+@pytest.mark.asyncio
+async def test_save_and_load_ndarray(file_service_local: FileServiceLocal) -> None:
+    values = np.arange(12, dtype=np.float64).reshape(3, 4)
+    s3_path = "verify/sim_results/run_id/simulation.sedml/report.npy"
+
+    await save_ndarray(file_service_local, values, s3_path)
+    loaded = await load_ndarray(file_service_local, s3_path)
+
+    assert loaded.shape == (3, 4)
+    assert np.array_equal(loaded, values)
+
+
+@pytest.mark.asyncio
+async def test_ndarray_cache(file_service_local: FileServiceLocal) -> None:
+    values = np.arange(12, dtype=np.float64).reshape(3, 4)
+    for name in ["a", "b"]:
+        await save_ndarray(file_service_local, values, f"verify/sim_results/run_id/{name}.npy")
+    ndarray_cache = NdarrayCache(max_size=values.nbytes)
+
+    loaded = await ndarray_cache.load(file_service_local, "verify/sim_results/run_id/a.npy")
+    assert await ndarray_cache.load(file_service_local, "verify/sim_results/run_id/a.npy") is loaded
+    assert not loaded.flags.writeable
+    assert (ndarray_cache.hits, ndarray_cache.misses) == (1, 1)
+
+    # only one array fits, the least recently used one is evicted
+    await ndarray_cache.load(file_service_local, "verify/sim_results/run_id/b.npy")
+    await ndarray_cache.load(file_service_local, "verify/sim_results/run_id/a.npy")
+    assert (ndarray_cache.hits, ndarray_cache.misses) == (1, 3)
+    assert ndarray_cache.size == values.nbytes
@@ -1,9 +1,12 @@
+import hashlib
 import os
 from pathlib import Path
+from typing import AsyncIterator
 
 import pytest
 
 from biosim_server.config import get_settings
+from biosim_server.io.file_service import calculate_stream_hash, file_exists
 from biosim_server.io.file_service_S3 import FileServiceS3
 from biosim_server.io.file_service_local import FileServiceLocal
 
@@ -34,6 +37,21 @@ async def test_file_service_local(file_service_local: FileServiceLocal) -> None:
     os.remove(new_file_path)
 
 
+@pytest.mark.asyncio
+async def test_file_service_local_upload_stream(file_service_local: FileServiceLocal) -> None:
+    s3_path = "some/s3/path/streamed.txt"
+
+    async def chunks() -> AsyncIterator[bytes]:
+        for chunk in [b"Hello", b", ", b"World!"]:
+            yield chunk
+
+    assert not await file_exists(file_service_local, s3_path)
+    await file_service_local.upload_stream(chunks(), s3_path)
+    assert await file_service_local.get_file_contents(s3_path) == b"Hello, World!"
+    assert await file_exists(file_service_local, s3_path)
+    assert await calculate_stream_hash(chunks()) == hashlib.sha256(b"Hello, World!").hexdigest()
+
+
 @pytest.mark.skipif(len(get_settings().storage_secret) == 0,
                     reason="S3 config STORAGE_SECRET not supplied")
 @pytest.mark.asyncio
@@ -0,0 +1,64 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from biosim_server.io.file_service import FileService
+from biosim_server.io.file_service_cached import FileServiceCached, LocalFileCache
+from biosim_server.io.file_service_local import FileServiceLocal
+
+
+class CountingFileService(FileServiceLocal):
+    download_count: int = 0
+
+    async def download_file(self, s3_path: str, file_path: Path | None = None) -> tuple[str, str]:
+        self.download_count += 1
+        return await super().download_file(s3_path, file_path)
+
+
+@pytest.mark.asyncio
+async def test_file_service_cached(file_service_local: FileServiceLocal, tmp_path: Path) -> None:
+    file_service = CountingFileService()
+    file_cache = LocalFileCache(tmp_path / "cache", max_size=25)
+    file_service_cached = FileServiceCached(file_service, file_cache)
+    await file_service_local.upload_bytes(b"0123456789", "cached/a.bin")
+    await file_service_local.upload_bytes(b"abcdefghij", "cached/b.bin")
+
+    # concurrent reads of the same object share one download
+    contents = await asyncio.gather(*[file_service_cached.get_file_contents("cached/a.bin") for _ in range(5)])
+    assert contents == [b"0123456789"] * 5
+    assert file_service.download_count == 1
+
+    _, local_path = await file_service_cached.download_file("cached/a.bin", tmp_path / "a.bin")
+    assert Path(local_path).read_bytes() == b"0123456789"
+    assert file_service.download_count == 1
+
+    # a new version of the object has a new ETag and is downloaded again
+    await asyncio.sleep(0.01)
+    await file_service_local.upload_bytes(b"9876543210", "cached/a.bin")
+    assert await file_service_cached.get_file_contents("cached/a.bin") == b"9876543210"
+    assert file_service.download_count == 2
+
+    # the stale and least recently used entry is evicted to stay within max_size
+    assert await file_service_cached.get_file_contents("cached/b.bin") == b"abcdefghij"
+    assert len(list(file_cache.cache_dir.iterdir())) == 2
+    assert file_cache.entry_path("cached/b.bin", await file_service.get_etag("cached/b.bin")).exists()
+
+
+@pytest.mark.asyncio
+async def test_file_service_cached_evicted_entry(file_service_local: FileServiceLocal, tmp_path: Path) -> None:
+    file_service = CountingFileService()
+    file_cache = LocalFileCache(tmp_path / "cache", max_size=100)
+    file_service_cached = FileServiceCached(file_service, file_cache)
+    await file_service_local.upload_bytes(b"0123456789", "cached/c.bin")
+
+    async def get_or_fill_evicted(s3_path: str, etag: str, file_service: FileService) -> Path:
+        # the entry is evicted (e.g. by another worker process) right after the lookup
+        entry_path = await LocalFileCache.get_or_fill(file_cache, s3_path, etag, file_service)
+        entry_path.unlink()
+        return entry_path
+
+    file_cache.get_or_fill = get_or_fill_evicted  # type: ignore[method-assign]
+    assert await file_service_cached.get_file_contents("cached/c.bin") == b"0123456789"
+    _, local_path = await file_service_cached.download_file("cached/c.bin", tmp_path / "c.bin")
+    assert Path(local_path).read_bytes() == b"0123456789"
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from biosim_server.io.keyed_lock import KeyedLock
+
+
+@pytest.mark.asyncio
+async def test_keyed_lock_late_arrival_joins_waiters() -> None:
+    keyed_lock: KeyedLock[str] = KeyedLock()
+    holders: list[str] = []
+    max_holders = 0
+
+    async def hold(name: str) -> None:
+        nonlocal max_holders
+        async with keyed_lock.acquire("key"):
+            holders.append(name)
+            max_holders = max(max_holders, len(holders))
+            await asyncio.sleep(0.01)
+            holders.remove(name)
+
+    first = asyncio.create_task(hold("first"))
+    waiter = asyncio.create_task(hold("waiter"))
+    await asyncio.sleep(0.005)
+    # arrives after the first task and while the waiter is still waiting, must not get a lock of its own
+    await first
+    late = asyncio.create_task(hold("late"))
+    await asyncio.gather(waiter, late)
+
+    assert max_holders == 1
+    assert len(keyed_lock) == 0
@@ -1,12 +1,15 @@
 import os
 from datetime import datetime
 from pathlib import Path
+from typing import Any, AsyncIterator
 
 import pytest
+from botocore.exceptions import ClientError
 
 from biosim_server.config import get_settings
 from biosim_server.io.file_service import ListingItem
-from biosim_server.io.s3_aiobotocore import get_s3_modified_date, download_s3_file, get_listing_of_s3_path
+from biosim_server.io.s3_aiobotocore import get_s3_modified_date, download_s3_file, get_listing_of_s3_path, \
+    multipart_upload, ranged_download, regroup_chunks, iterate_async, MIN_MULTIPART_PART_SIZE
 
 ROOT_DIR = Path(__file__).parent.parent.parent
 
@@ -47,3 +50,145 @@ async def test_get_listing_of_s3_path() -> None:
     files = await get_listing_of_s3_path(s3_path=S3_PATH)
     assert len(files) > 0
     assert type(files[0]) is ListingItem
+
+
+class MultipartClientStub:
+    """ records the multipart calls made by multipart_upload() """
+
+    def __init__(self, fail_part_number: int | None = None) -> None:
+        self.fail_part_number = fail_part_number
+        self.parts: dict[int, bytes] = {}
+        self.completed_parts: list[dict[str, Any]] | None = None
+        self.aborted = False
+
+    async def create_multipart_upload(self, Bucket: str, Key: str) -> dict[str, Any]:
+        return {'UploadId': "upload_id"}
+
+    async def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes) -> dict[str, Any]:
+        if PartNumber == self.fail_part_number:
+            raise IOError(f"part {PartNumber} failed")
+        self.parts[PartNumber] = Body
+        return {'ETag': f"etag{PartNumber}"}
+
+    async def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str,
+                                        MultipartUpload: dict[str, Any]) -> None:
+        self.completed_parts = MultipartUpload['Parts']
+
+    async def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str) -> None:
+        self.aborted = True
+
+
+@pytest.mark.asyncio
+async def test_multipart_upload() -> None:
+    contents = os.urandom(2 * MIN_MULTIPART_PART_SIZE + 100)
+    chunks = [contents[offset:offset + 1000] for offset in range(0, len(contents), 1000)]
+
+    client = MultipartClientStub()
+    parts = regroup_chunks(iterate_async(chunks), MIN_MULTIPART_PART_SIZE)
+    await multipart_upload(client, "bucket", "key", parts)
+
+    assert client.completed_parts == [{'PartNumber': i, 'ETag': f"etag{i}"} for i in (1, 2, 3)]
+    assert [len(client.parts[i]) for i in (1, 2, 3)] == [MIN_MULTIPART_PART_SIZE, MIN_MULTIPART_PART_SIZE, 100]
+    assert b"".join(client.parts[i] for i in (1, 2, 3)) == contents
+    assert not client.aborted
+
+    failing_client = MultipartClientStub(fail_part_number=2)
+    parts = regroup_chunks(iterate_async(chunks), MIN_MULTIPART_PART_SIZE)
+    with pytest.raises(IOError):
+        await multipart_upload(failing_client, "bucket", "key", parts)
+    assert failing_client.aborted
+    assert failing_client.completed_parts is None
+
+
+@pytest.mark.asyncio
+async def test_multipart_upload_bounded(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(get_settings(), "storage_multipart_max_concurrency", 1)
+    client = MultipartClientStub()
+    pulled: list[int] = []
+
+    async def parts() -> AsyncIterator[bytes]:
+        for part_number in (1, 2, 3):
+            # with one upload slot, a part is only pulled once the previous one is uploaded
+            assert len(client.parts) == part_number - 1
+            pulled.append(part_number)
+            yield bytes(10)
+
+    await multipart_upload(client, "bucket", "key", parts())
+
+    assert pulled == [1, 2, 3]
+    assert client.completed_parts is not None and len(client.completed_parts) == 3
+
+
+class RangedBodyStub:
+    def __init__(self, contents: bytes) -> None:
+        self.contents = contents
+
+    async def iter_chunks(self, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        for offset in range(0, len(self.contents), chunk_size):
+            yield self.contents[offset:offset + chunk_size]
+
+
+class RangedClientStub:
+    """ serves byte-range GETs of an in-memory object, replaced by replacement after the first GET if given """
+
+    def __init__(self, contents: bytes, replacement: bytes | None = None) -> None:
+        self.contents = contents
+        self.etag = f'"{hash(contents)}"'
+        self.replacement = replacement
+        self.ranges: list[str] = []
+        self.if_matches: list[str | None] = []
+
+    async def get_object(self, Bucket: str, Key: str, Range: str, IfMatch: str | None = None) -> dict[str, Any]:
+        self.ranges.append(Range)
+        self.if_matches.append(IfMatch)
+        if IfMatch is not None and IfMatch != self.etag:
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, "GetObject")
+        start, end = Range.removeprefix("bytes=").split("-")
+        end = str(min(int(end), len(self.contents) - 1))
+        response = {'Body': RangedBodyStub(self.contents[int(start):int(end) + 1]),
+                    'ContentRange': f"bytes {start}-{end}/{len(self.contents)}", 'ETag': self.etag}
+        if self.replacement is not None:
+            self.contents, self.replacement = self.replacement, None
+            self.etag = f'"{hash(self.contents)}"'
+        return response
+
+
+@pytest.mark.asyncio
+async def test_ranged_download(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(get_settings(), "storage_multipart_part_size", MIN_MULTIPART_PART_SIZE)
+    contents = os.urandom(2 * MIN_MULTIPART_PART_SIZE + 100)
+    file_path = tmp_path / "downloaded.bin"
+
+    client = RangedClientStub(contents)
+    await ranged_download(client, "bucket", "key", len(contents), file_path)
+
+    assert len(client.ranges) == 3
+    # the ranges after the first are only served from the version of the first
+    assert client.if_matches == [None, client.etag, client.etag]
+    assert file_path.read_bytes() == contents
+
+
+@pytest.mark.asyncio
+async def test_download_s3_file_ranges(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(get_settings(), "storage_multipart_part_size", MIN_MULTIPART_PART_SIZE)
+    small_contents = os.urandom(100)
+    large_contents = os.urandom(2 * MIN_MULTIPART_PART_SIZE + 100)
+
+    # a small object is a single GET, its size is read from the Content-Range of that GET
+    small_client = RangedClientStub(small_contents)
+    await download_s3_file("key", tmp_path / "small.bin", s3_client=small_client)
+    assert small_client.ranges == [f"bytes=0-{MIN_MULTIPART_PART_SIZE - 1}"]
+    assert (tmp_path / "small.bin").read_bytes() == small_contents
+
+    large_client = RangedClientStub(large_contents)
+    await download_s3_file("key", tmp_path / "large.bin", s3_client=large_client)
+    assert len(large_client.ranges) == 3
+    assert large_client.if_matches == [None, large_client.etag, large_client.etag]
+    assert (tmp_path / "large.bin").read_bytes() == large_contents
+
+    # an object replaced during the download is downloaded again, not stitched together from both versions
+    replaced_contents = os.urandom(2 * MIN_MULTIPART_PART_SIZE + 200)
+    replaced_client = RangedClientStub(large_contents, replacement=replaced_contents)
+    await download_s3_file("key", tmp_path / "replaced.bin", s3_client=replaced_client)
+    assert replaced_client.ranges.count(f"bytes=0-{MIN_MULTIPART_PART_SIZE - 1}") == 2
+    assert (tmp_path / "replaced.bin").read_bytes() == replaced_contents
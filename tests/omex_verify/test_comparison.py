@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from biosim_server.omex_sim.biosim1.models import HDF5File, HDF5Group, HDF5Dataset, HDF5Attribute
+from biosim_server.omex_verify.comparison import get_observables, stack_observables, pairwise_statistics, \
+    find_time_observable, align_observables, interpolate_rows, select_observable_rows, select_hdf5_rows, select_rows
+
+
+def make_hdf5_file(labels: list[str], num_times: int) -> HDF5File:
+    dataset = HDF5Dataset(name="simulation.sedml/report", shape=[len(labels), num_times],
+                          attributes=[HDF5Attribute(key="sedmlDataSetLabels", value=labels)])
+    group = HDF5Group(name="simulation.sedml", attributes=[], datasets=[dataset])
+    return HDF5File(filename="reports.h5", id="run_id", uri="uri", groups=[group])
+
+
+def test_get_observables() -> None:
+    hdf5_file = make_hdf5_file(labels=["time", "A", "B"], num_times=4)
+    results = {"simulation.sedml/report": np.arange(12, dtype=np.float64).reshape(3, 4)}
+
+    observables = get_observables(hdf5_file, results)
+
+    assert list(observables) == ["time", "A", "B"]
+    assert np.array_equal(observables["A"], [4.0, 5.0, 6.0, 7.0])
+
+
+def test_select_observables() -> None:
+    hdf5_file = make_hdf5_file(labels=["time", "A", "B", "C"], num_times=4)
+    hdf5_file.groups[0].datasets[0].attributes.append(
+        HDF5Attribute(key="sedmlDataSetIds", value=["data_set_time", "data_set_A", "data_set_B", "data_set_C"]))
+    results = {"simulation.sedml/report": np.arange(16, dtype=np.float64).reshape(4, 4)}
+
+    # matched by label or by id, the time row is always kept
+    dataset_rows = select_observable_rows(hdf5_file, ["C", "data_set_A", "D"])
+    assert dataset_rows == {"simulation.sedml/report": [0, 1, 3]}
+    assert select_observable_rows(hdf5_file, ["D"]) == {}
+
+    selected_file = select_hdf5_rows(hdf5_file, dataset_rows)
+    selected_results = {name: select_rows(values, dataset_rows.get(name)) for name, values in results.items()}
+    assert selected_file.groups[0].datasets[0].shape == [3, 4]
+    assert selected_file.groups[0].datasets[0].get_attribute("sedmlDataSetIds") == \
+           ["data_set_time", "data_set_A", "data_set_C"]
+    observables = get_observables(selected_file, selected_results)
+    assert list(observables) == ["time", "A", "C"]
+    assert np.array_equal(observables["C"], [12.0, 13.0, 14.0, 15.0])
+
+
+def test_pairwise_statistics() -> None:
+    time = np.linspace(0.0, 1.0, 11)
+    sim1 = {"time": time, "A": np.sin(time), "B": np.cos(time)}
+    sim2 = {"time": time, "A": np.sin(time) + 1e-3, "B": np.cos(time)}
+    sim3 = {"time": time, "A": np.sin(time)}
+
+    names, data = stack_observables([sim1, sim2, sim3])
+    assert names == ["time", "A", "B"]
+    assert data.shape == (3, 3, 11)
+
+    first, second, rmse, close = pairwise_statistics(data, rtol=1e-6, atol=1e-9)
+
+    assert list(zip(first, second)) == [(0, 1), (0, 2), (1, 2)]
+    assert rmse[0, 1] == pytest.approx(1e-3)
+    assert rmse[0, 2] == pytest.approx(0.0)
+    assert not close[0, 1]
+    assert close[0, 0] and close[0, 2] and close[1, 1]
+    # observable B is missing for the third simulator
+    assert np.isnan(rmse[1, 2]) and np.isnan(rmse[2, 2])
+    assert not close[1, 2]
+
+    # only the pairs with the second simulator
+    first, second, with_rmse, _ = pairwise_statistics(data, rtol=1e-6, atol=1e-9, with_index=1)
+    assert list(zip(first, second)) == [(0, 1), (1, 2)]
+    assert np.array_equal(with_rmse, rmse[[0, 2]], equal_nan=True)
+
+
+def test_align_observables() -> None:
+    # same time course sampled on grids of different length, end point and float drift
+    time1 = np.linspace(0.0, 10.0, 101)
+    time2 = np.linspace(0.0, 10.5, 211) + 1e-12
+    time3 = np.linspace(0.0, 10.0, 51)
+    sims = [{"time": t, "A": 2.0 * t, "B": 3.0 - t} for t in (time1, time2, time3)]
+    del sims[2]["B"]
+
+    time_name = find_time_observable(sims[0])
+    assert time_name == "time"
+    names, data, grid = align_observables(sims, time_name)
+
+    assert names == ["time", "A", "B"]
+    assert grid[0] == pytest.approx(1e-12) and grid[-1] == 10.0
+    assert len(grid) == 201
+    assert data.shape == (3, 3, 201)
+    assert np.allclose(data[:, 1, :], 2.0 * grid)
+    assert np.allclose(data[:2, 2, :], 3.0 - grid)
+    assert np.all(np.isnan(data[2, 2, :]))
+
+
+def test_interpolate_rows_matches_np_interp() -> None:
+    times = np.array([0.0, 0.5, 1.5, 3.0])
+    rows = np.array([[1.0, 2.0, 0.0, 4.0], [0.0, -1.0, 5.0, 5.0]])
+    grid = np.linspace(0.0, 3.0, 13)
+
+    result = interpolate_rows(times, rows, grid)
+
+    for row, interpolated in zip(rows, result):
+        assert np.allclose(interpolated, np.interp(grid, times, row))
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+from temporalio.testing import ActivityEnvironment
+
+from biosim_server.io.array_store import save_ndarray
+from biosim_server.io.file_service_local import FileServiceLocal
+from biosim_server.omex_sim.biosim1.models import BiosimSimulatorSpec, SourceOmex, Hdf5DataRef
+from biosim_server.omex_sim.workflows.omex_sim_workflow import OmexSimWorkflowOutput, OmexSimWorkflowInput, \
+    OmexSimWorkflowStatus
+from biosim_server.omex_verify.comparison import select_hdf5_rows
+from biosim_server.omex_verify.workflows.activities import generate_statistics, GenerateStatisticsInput, SimulatorRMSE, \
+    result_arrays
+from tests.omex_verify.test_comparison import make_hdf5_file
+
+
+async def make_sim_output(file_service: FileServiceLocal, simulator: str, offset: float) -> OmexSimWorkflowOutput:
+    time = np.linspace(0.0, 1.0, 11)
+    values = np.vstack([time, np.sin(time) + offset])
+    s3_path = f"test_generate_statistics/{simulator}/report.npy"
+    await save_ndarray(file_service, values, s3_path)
+    return OmexSimWorkflowOutput(
+        workflow_id=simulator,
+        workflow_input=OmexSimWorkflowInput(source_omex=SourceOmex(name="name", omex_s3_file="model.omex"),
+                                            simulator_spec=BiosimSimulatorSpec(simulator=simulator, version="1.0")),
+        workflow_status=OmexSimWorkflowStatus.COMPLETED,
+        hdf5_file=make_hdf5_file(labels=["time", "A"], num_times=11),
+        result_datasets={"simulation.sedml/report": Hdf5DataRef(dataset_name="simulation.sedml/report",
+                                                                shape=[2, 11], s3_path=s3_path)})
+
+
+@pytest.mark.asyncio
+async def test_generate_statistics_new_sim(file_service_local: FileServiceLocal) -> None:
+    sim_outputs = [await make_sim_output(file_service_local, simulator, offset)
+                   for simulator, offset in [("copasi", 0.0), ("tellurium", 1e-3), ("vcell", 0.0)]]
+
+    misses = result_arrays.misses
+    all_pairs = await ActivityEnvironment().run(
+        generate_statistics, GenerateStatisticsInput(sim_outputs=sim_outputs, include_outputs=False,
+                                                     rTol=1e-6, aTol=1e-9))
+    new_pairs = await ActivityEnvironment().run(
+        generate_statistics, GenerateStatisticsInput(sim_outputs=sim_outputs, include_outputs=True,
+                                                     rTol=1e-6, aTol=1e-9, new_sim_index=1))
+
+    # only the pairs with the new simulator, each with the earlier simulator first
+    assert [(r.simulator1, r.simulator2) for r in new_pairs.compare_results] == \
+           [("copasi:1.0", "tellurium:1.0"), ("tellurium:1.0", "vcell:1.0")]
+    assert new_pairs.compare_results[0] == all_pairs.compare_results[0]
+    assert new_pairs.compare_results[0].rmse_scores["A"] == pytest.approx(1e-3)
+    assert new_pairs.sim_results is not None and len(new_pairs.sim_results) == 1
+    assert new_pairs.sim_results[0]["simulation.sedml/report"].shape == [2, 11]
+    # the stored results were read once, not again for the second comparison
+    assert result_arrays.misses == misses + 3
+
+
+@pytest.mark.asyncio
+async def test_generate_statistics_dataset_rows(file_service_local: FileServiceLocal) -> None:
+    # complete cached results (rows time, A, B) reused for a request of observable A, next to fresh results
+    # which only hold the requested rows (time, A)
+    time = np.linspace(0.0, 1.0, 11)
+    cached_output = await make_sim_output(file_service_local, "copasi_cached", 0.0)
+    await save_ndarray(file_service_local, np.vstack([time, np.sin(time), np.cos(time)]),
+                       "test_generate_statistics/copasi_cached/report.npy")
+    cached_output.hdf5_file = select_hdf5_rows(make_hdf5_file(labels=["time", "A", "B"], num_times=11),
+                                               {"simulation.sedml/report": [0, 1]})
+    cached_output.dataset_rows = {"simulation.sedml/report": [0, 1]}
+    fresh_output = await make_sim_output(file_service_local, "tellurium_fresh", 1e-3)
+
+    stats_output = await ActivityEnvironment().run(
+        generate_statistics, GenerateStatisticsInput(sim_outputs=[cached_output, fresh_output], include_outputs=True,
+                                                     rTol=1e-6, aTol=1e-9))
+
+    assert list(stats_output.compare_results[0].rmse_scores) == ["time", "A"]
+    assert stats_output.compare_results[0].rmse_scores["A"] == pytest.approx(1e-3)
+    assert stats_output.sim_results is not None
+    assert stats_output.sim_results[0]["simulation.sedml/report"].shape == [2, 11]
+
+
+@pytest.mark.asyncio
+async def test_generate_statistics_completion_order(file_service_local: FileServiceLocal) -> None:
+    # simulators covering different time ranges, the third one only t in [5, 10]
+    sim_outputs: list[OmexSimWorkflowOutput] = []
+    for simulator, time, offset in [("order_a", np.linspace(0.0, 10.0, 101), 0.0),
+                                    ("order_b", np.linspace(0.0, 10.0, 41), 0.01),
+                                    ("order_c", np.linspace(5.0, 10.0, 26), 0.02)]:
+        sim_output = await make_sim_output(file_service_local, simulator, offset)
+        assert sim_output.result_datasets is not None
+        s3_path = sim_output.result_datasets["simulation.sedml/report"].s3_path
+        await save_ndarray(file_service_local, np.vstack([time, np.sin(time) + offset * time]), s3_path)
+        sim_output.hdf5_file = make_hdf5_file(labels=["time", "A"], num_times=len(time))
+        sim_outputs.append(sim_output)
+
+    async def compare_in_order(order: list[int]) -> dict[tuple[str, str], SimulatorRMSE]:
+        """ the comparisons of the verify workflow when the simulators finish in the given order """
+        compare_results: dict[tuple[str, str], SimulatorRMSE] = {}
+        finished: list[int] = []
+        for sim_index in order:
+            finished = sorted(finished + [sim_index])
+            stats_output = await ActivityEnvironment().run(
+                generate_statistics, GenerateStatisticsInput(sim_outputs=[sim_outputs[i] for i in finished],
+                                                             include_outputs=False, rTol=1e-6, aTol=1e-9,
+                                                             new_sim_index=finished.index(sim_index)))
+            for result in stats_output.compare_results:
+                compare_results[(result.simulator1, result.simulator2)] = result
+        return compare_results
+
+    all_pairs = await ActivityEnvironment().run(
+        generate_statistics, GenerateStatisticsInput(sim_outputs=sim_outputs, include_outputs=False,
+                                                     rTol=1e-6, aTol=1e-9))
+    expected = {(result.simulator1, result.simulator2): result for result in all_pairs.compare_results}
+    assert len(expected) == 3
+    assert await compare_in_order([0, 1, 2]) == expected
+    assert await compare_in_order([2, 0, 1]) == expected
+    assert await compare_in_order([1, 2, 0]) == expected
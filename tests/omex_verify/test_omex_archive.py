@@ -0,0 +1,99 @@
+import io
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from biosim_server.omex_verify.omex_archive import read_omex_archive_index, known_observables, OmexArchiveError, \
+    MAX_MANIFEST_SIZE
+
+ROOT_DIR = Path(__file__).parent.parent.parent
+MANIFEST_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<omexManifest xmlns="http://identifiers.org/combine.specifications/omex-manifest">
+  <content location="./simulation.sedml" format="http://identifiers.org/combine.specifications/sed-ml"/>
+</omexManifest>"""
+STEADY_STATE_SEDML = """<?xml version="1.0" encoding="UTF-8"?>
+<sedML xmlns="http://sed-ml.org/sed-ml/level1/version3" level="1" version="3">
+  <listOfSimulations><steadyState id="sim0"/></listOfSimulations>
+  <listOfOutputs>
+    <report id="report"><listOfDataSets><dataSet id="ds_A" label="A" dataReference="A"/></listOfDataSets></report>
+  </listOfOutputs>
+</sedML>"""
+
+
+def make_archive(members: dict[str, str]) -> io.BytesIO:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        for location, contents in members.items():
+            zip_file.writestr(location, contents)
+    archive.seek(0)
+    return archive
+
+
+def make_deflated_archive() -> io.BytesIO:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("manifest.xml", MANIFEST_XML)
+        zip_file.writestr("simulation.sedml", STEADY_STATE_SEDML)
+    archive.seek(0)
+    return archive
+
+
+def member_data_offset(data: bytes, location: str) -> int:
+    """ offset of the compressed data of a member, after its local file header """
+    header_offset = zipfile.ZipFile(io.BytesIO(data)).getinfo(location).header_offset
+    name_length = int.from_bytes(data[header_offset + 26:header_offset + 28], "little")
+    extra_length = int.from_bytes(data[header_offset + 28:header_offset + 30], "little")
+    return header_offset + 30 + name_length + extra_length
+
+
+def truncate_member(archive: io.BytesIO, location: str) -> io.BytesIO:
+    """ halve the compressed size recorded for a member, so its deflate stream ends early """
+    data = bytearray(archive.getvalue())
+    info = zipfile.ZipFile(archive).getinfo(location)
+    size = info.compress_size.to_bytes(4, "little")
+    half = (info.compress_size // 2).to_bytes(4, "little")
+    local_size_offset = info.header_offset + 18
+    # the central directory entry repeats the local header fields from 'version needed' to the CRC, 2 bytes later
+    central_size_offset = data.index(data[info.header_offset + 4:info.header_offset + 18], info.header_offset + 30) + 14
+    for offset in (local_size_offset, central_size_offset):
+        assert data[offset:offset + 4] == size
+        data[offset:offset + 4] = half
+    return io.BytesIO(bytes(data))
+
+
+def corrupt_member(archive: io.BytesIO, location: str) -> io.BytesIO:
+    """ overwrite the start of the deflate stream of a member with an invalid block type """
+    data = bytearray(archive.getvalue())
+    offset = member_data_offset(bytes(data), location)
+    data[offset:offset + 4] = b"\xff\xff\xff\xff"
+    return io.BytesIO(bytes(data))
+
+
+def test_read_omex_archive_index() -> None:
+    omex_path = ROOT_DIR / "local_data" / "BIOMD0000000010_tellurium_Negative_feedback_and_ultrasen.omex"
+    with open(omex_path, "rb") as archive:
+        omex_index = read_omex_archive_index(archive)
+
+    assert omex_index.sedml_locations == ["BIOMD0000000010_url.sedml"]
+    assert omex_index.reports[0].dataset_name == "BIOMD0000000010_url.sedml/report_2"
+    assert [data_set.label for data_set in omex_index.reports[0].data_sets] == \
+           ["task_fig2a.time/60", "task_fig2a.MAPK_PP", "task_fig2a.MAPK"]
+    assert known_observables(omex_index, ["time", "concentration", "MAPK_PP"]) == ["time", "MAPK_PP"]
+
+
+def test_read_omex_archive_index_invalid() -> None:
+    with pytest.raises(OmexArchiveError, match="not a valid zip file"):
+        read_omex_archive_index(io.BytesIO(b"not a zip file"))
+    with pytest.raises(OmexArchiveError, match="no manifest"):
+        read_omex_archive_index(make_archive({"simulation.sedml": STEADY_STATE_SEDML}))
+    with pytest.raises(OmexArchiveError, match="manifest of the archive is larger"):
+        read_omex_archive_index(make_archive({"manifest.xml": " " * (MAX_MANIFEST_SIZE + 1)}))
+    with pytest.raises(OmexArchiveError, match="not a valid zip file"):
+        read_omex_archive_index(truncate_member(make_deflated_archive(), "manifest.xml"))
+    with pytest.raises(OmexArchiveError, match="not a valid zip file"):
+        read_omex_archive_index(corrupt_member(make_deflated_archive(), "manifest.xml"))
+    with pytest.raises(OmexArchiveError, match="is missing"):
+        read_omex_archive_index(make_archive({"manifest.xml": MANIFEST_XML}))
+    with pytest.raises(OmexArchiveError, match="no uniform time course"):
+        read_omex_archive_index(make_archive({"manifest.xml": MANIFEST_XML, "simulation.sedml": STEADY_STATE_SEDML}))
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from temporalio.converter import DataConverter
+
+from biosim_server.data_converter import biosim_data_converter, CompressionCodec
+from biosim_server.omex_sim.biosim1.models import HDF5File, Hdf5DataValues, HDF5Group, HDF5Dataset, HDF5Attribute, \
+    BiosimSimulationRun, BiosimSimulationRunStatus
+from biosim_server.omex_sim.workflows.result_cache_activities import CachedSimResults
+
+
+@pytest.mark.asyncio
+async def test_data_converter_packs_float_values() -> None:
+    values = np.random.default_rng(0).random((7, 601))
+    hdf5_data_values = Hdf5DataValues(shape=[7, 601], values=values.ravel().tolist())
+
+    payloads = await biosim_data_converter.encode([hdf5_data_values])
+    default_payloads = await DataConverter.default.encode([hdf5_data_values])
+
+    assert len(payloads[0].data) < 0.7 * len(default_payloads[0].data)
+    assert await biosim_data_converter.decode(payloads, [Hdf5DataValues]) == [hdf5_data_values]
+
+
+@pytest.mark.asyncio
+async def test_data_converter_ndarray_and_models() -> None:
+    array = np.arange(12, dtype=np.float64).reshape(3, 4)
+    cached_sim_results = CachedSimResults(
+        biosim_run=BiosimSimulationRun(id="run_id", name="name", simulator="copasi", simulator_version="1.0",
+                                       simulator_digest="sha256:1234", status=BiosimSimulationRunStatus.SUCCEEDED),
+        hdf5_file=HDF5File(filename="reports.h5", id="run_id", uri="https://example.com/reports.h5", groups=[
+            HDF5Group(name="simulation.sedml", attributes=[], datasets=[
+                HDF5Dataset(name="simulation.sedml/report", shape=[2, 3],
+                            attributes=[HDF5Attribute(key="sedmlDataSetLabels", value=["time", "A"])])])]),
+        result_datasets={})
+
+    payloads = await biosim_data_converter.encode([array, cached_sim_results])
+    assert payloads[0].metadata["encoding"] == b"binary/numpy"
+    decoded_array, decoded_cached_sim_results = await biosim_data_converter.decode(
+        payloads, [np.ndarray, CachedSimResults])
+
+    assert np.array_equal(decoded_array, array)
+    assert isinstance(decoded_cached_sim_results.hdf5_file, HDF5File)
+    assert decoded_cached_sim_results == cached_sim_results
+
+
+@pytest.mark.asyncio
+async def test_data_converter_compresses_large_payloads() -> None:
+    values = np.linspace(0.0, 1.0, 2002).tolist()
+    sim_results = [{"simulation.sedml/report": Hdf5DataValues(shape=[2, 1001], values=values)}]
+
+    small_payloads = await biosim_data_converter.encode(["model.omex"])
+    large_payloads = await biosim_data_converter.encode([sim_results])
+
+    assert small_payloads[0].metadata["encoding"] == b"json/plain"
+    assert large_payloads[0].metadata["encoding"] == CompressionCodec.ENCODING
+    uncompressed_payloads = await DataConverter.default.encode([sim_results])
+    assert len(large_payloads[0].data) < len(uncompressed_payloads[0].data) / 4
+    assert await biosim_data_converter.decode(large_payloads, [list[dict[str, Hdf5DataValues]]]) == [sim_results]
@@ -0,0 +1,179 @@
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+import numpy as np
+import pytest
+from multidict import CIMultiDict, CIMultiDictProxy
+from temporalio.testing import ActivityEnvironment
+from yarl import URL
+
+from biosim_server.config import get_settings
+from biosim_server.dependencies import set_file_service
+from biosim_server.io.array_store import load_ndarray
+from biosim_server.io.file_service_local import FileServiceLocal
+from biosim_server.omex_sim.biosim1.models import Hdf5DataValues, SourceOmex, BiosimSimulatorSpec, \
+    BiosimSimulationRunStatus, BiosimSimulationRun
+from biosim_server.omex_sim.workflows.biosim_activities import store_hdf5_datasets, StoreHdf5DatasetsInput, \
+    sim_results_s3_path, store_hdf5_file, StoreHdf5FileInput, submit_biosim_sim, SubmitBiosimSimInput, \
+    get_sim_runs, GetSimRunsInput, cancel_biosim_sim, CancelBiosimSimInput, save_hdf5_arrays
+from tests.fixtures.biosim_service_mock import BiosimServiceMock
+
+
+@pytest.mark.asyncio
+async def test_store_hdf5_datasets(biosim_service_mock: BiosimServiceMock,
+                                   file_service_local: FileServiceLocal) -> None:
+    run_id = "run_id_store_hdf5_datasets"
+    biosim_service_mock.hdf5_data = {run_id: {
+        "simulation.sedml/report": Hdf5DataValues(shape=[2, 3], values=[0.0, 1.0, 2.0, 3.0, 4.0, 5.0]),
+        "simulation.sedml/plot": Hdf5DataValues(shape=[1, 3], values=[6.0, 7.0, 8.0])}}
+
+    dataset_names = ["simulation.sedml/report", "simulation.sedml/plot"]
+    hdf5_data_refs = await ActivityEnvironment().run(
+        store_hdf5_datasets, StoreHdf5DatasetsInput(simulation_run_id=run_id, dataset_names=dataset_names))
+
+    assert [ref.dataset_name for ref in hdf5_data_refs] == dataset_names
+    assert [ref.shape for ref in hdf5_data_refs] == [[2, 3], [1, 3]]
+    assert all(ref.s3_path.startswith(sim_results_s3_path(run_id)) for ref in hdf5_data_refs)
+    report = await load_ndarray(file_service_local, hdf5_data_refs[0].s3_path)
+    assert np.array_equal(report, [[0.0, 1.0, 2.0], [3.0, 4.0, 5.0]])
+
+
+@pytest.mark.asyncio
+async def test_store_hdf5_file(biosim_service_mock: BiosimServiceMock,
+                               file_service_local: FileServiceLocal) -> None:
+    run_id = "run_id_store_hdf5_file"
+    hdf5_file_uri = f"https://storage.googleapis.com/files.biosimulations.org/simulations/{run_id}/outputs/reports.h5"
+    biosim_service_mock.hdf5_file_paths = {
+        hdf5_file_uri: Path(__file__).parent.parent.parent / "local_data" / "repressilator_copasi.h5"}
+
+    dataset_names = ["simulation.sedml/report", "simulation.sedml/Figure_1c"]
+    hdf5_data_refs = await ActivityEnvironment().run(
+        store_hdf5_file,
+        StoreHdf5FileInput(simulation_run_id=run_id, hdf5_file_uri=hdf5_file_uri, dataset_names=dataset_names))
+
+    assert [ref.dataset_name for ref in hdf5_data_refs] == dataset_names
+    assert [ref.shape for ref in hdf5_data_refs] == [[7, 601], [4, 601]]
+    report = await load_ndarray(file_service_local, hdf5_data_refs[0].s3_path)
+    assert report.shape == (7, 601)
+
+
+@pytest.mark.asyncio
+async def test_store_hdf5_file_rows(biosim_service_mock: BiosimServiceMock,
+                                    file_service_local: FileServiceLocal) -> None:
+    run_id = "run_id_store_hdf5_file_rows"
+    hdf5_file_uri = f"https://storage.googleapis.com/files.biosimulations.org/simulations/{run_id}/outputs/reports.h5"
+    biosim_service_mock.hdf5_file_paths = {
+        hdf5_file_uri: Path(__file__).parent.parent.parent / "local_data" / "repressilator_copasi.h5"}
+
+    hdf5_data_refs = await ActivityEnvironment().run(
+        store_hdf5_file,
+        StoreHdf5FileInput(simulation_run_id=run_id, hdf5_file_uri=hdf5_file_uri,
+                           dataset_names=["simulation.sedml/report"],
+                           dataset_rows={"simulation.sedml/report": [0, 2]}))
+
+    assert [ref.shape for ref in hdf5_data_refs] == [[2, 601]]
+    report = await load_ndarray(file_service_local, hdf5_data_refs[0].s3_path)
+    assert report[0, 0] == 400.0  # the time row
+
+
+class FileServiceCountingUploads(FileServiceLocal):
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    async def upload_bytes(self, file_contents: bytes, s3_path: str) -> str:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return await super().upload_bytes(file_contents, s3_path)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.asyncio
+async def test_save_hdf5_arrays_bounded(file_service_local: FileServiceLocal, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(get_settings(), "storage_max_concurrent_uploads", 2)
+    file_service = FileServiceCountingUploads()
+    arrays = [(f"simulation.sedml/report_{i}", np.full((2, 3), float(i))) for i in range(6)]
+
+    hdf5_data_refs = await save_hdf5_arrays(file_service, "run_id_save_hdf5_arrays", arrays)
+
+    assert [ref.dataset_name for ref in hdf5_data_refs] == [dataset_name for dataset_name, _ in arrays]
+    assert file_service.max_in_flight == 2
+    report = await load_ndarray(file_service, hdf5_data_refs[5].s3_path)
+    assert np.array_equal(report, arrays[5][1])
+
+
+class FileServiceWithUrls(FileServiceLocal):
+    async def get_download_url(self, s3_path: str) -> Optional[str]:
+        return f"https://storage.example.com/{s3_path}?signature=123"
+
+
+@pytest.mark.asyncio
+async def test_submit_biosim_sim_by_url(biosim_service_mock: BiosimServiceMock,
+                                        file_service_local: FileServiceLocal) -> None:
+    submit_input = SubmitBiosimSimInput(source_omex=SourceOmex(name="name", omex_s3_file="verify/omex/model.omex"),
+                                        simulator_spec=BiosimSimulatorSpec(simulator="copasi", version="4.45.296"))
+    set_file_service(FileServiceWithUrls())
+    try:
+        sim_run = await ActivityEnvironment().run(submit_biosim_sim, submit_input)
+    finally:
+        set_file_service(file_service_local)
+
+    assert sim_run.simulator == "copasi" and sim_run.simulator_version == "4.45.296"
+    assert biosim_service_mock.submitted_urls[-1] == "https://storage.example.com/verify/omex/model.omex?signature=123"
+
+
+
+@pytest.mark.asyncio
+async def test_submit_biosim_sim_url_fallback(biosim_service_mock: BiosimServiceMock,
+                                              file_service_local: FileServiceLocal,
+                                              monkeypatch: pytest.MonkeyPatch) -> None:
+    submit_input = SubmitBiosimSimInput(source_omex=SourceOmex(name="name", omex_s3_file="verify/omex/fallback.omex"),
+                                        simulator_spec=BiosimSimulatorSpec(simulator="copasi", version="4.45.296"))
+    await file_service_local.upload_bytes(b"omex archive", "verify/omex/fallback.omex")
+    request_info = aiohttp.RequestInfo(url=URL("https://api.biosimulations.org/runs"), method="POST",
+                                       headers=CIMultiDictProxy(CIMultiDict()))
+    url_error: Exception = aiohttp.ClientResponseError(request_info, (), status=400, message="Bad Request")
+
+    async def run_biosim_sim_from_url(omex_url: str, omex_name: str,
+                                      simulator_spec: BiosimSimulatorSpec) -> BiosimSimulationRun:
+        raise url_error
+
+    monkeypatch.setattr(biosim_service_mock, "run_biosim_sim_from_url", run_biosim_sim_from_url)
+    set_file_service(FileServiceWithUrls())
+    try:
+        # a rejected URL falls back to uploading the archive
+        sim_run = await ActivityEnvironment().run(submit_biosim_sim, submit_input)
+        assert sim_run.simulator == "copasi"
+
+        # after a timeout the run may have been accepted, uploading could submit it twice
+        url_error = asyncio.TimeoutError()
+        with pytest.raises(asyncio.TimeoutError):
+            await ActivityEnvironment().run(submit_biosim_sim, submit_input)
+    finally:
+        set_file_service(file_service_local)
+
+@pytest.mark.asyncio
+async def test_get_sim_runs(biosim_service_mock: BiosimServiceMock) -> None:
+    sim_run = await biosim_service_mock.run_biosim_sim(local_omex_path="", omex_name="name",
+                                                       simulator_spec=BiosimSimulatorSpec(simulator="copasi"))
+
+    # unknown runs are left out instead of failing the whole sweep
+    sim_runs = await ActivityEnvironment().run(
+        get_sim_runs, GetSimRunsInput(biosim_run_ids=[sim_run.id, "unknown_run_id"], max_concurrency=2))
+
+    assert sim_runs == [sim_run]
+
+
+@pytest.mark.asyncio
+async def test_cancel_biosim_sim(biosim_service_mock: BiosimServiceMock) -> None:
+    sim_run = await biosim_service_mock.run_biosim_sim(local_omex_path="", omex_name="name",
+                                                       simulator_spec=BiosimSimulatorSpec(simulator="copasi"))
+
+    cancelled = await ActivityEnvironment().run(cancel_biosim_sim, CancelBiosimSimInput(biosim_run_id=sim_run.id))
+
+    assert cancelled
+    assert (await biosim_service_mock.get_sim_run(sim_run.id)).status == BiosimSimulationRunStatus.FAILED
@@ -0,0 +1,38 @@
+import pytest
+from temporalio.testing import ActivityEnvironment
+
+from biosim_server.io.file_service_local import FileServiceLocal
+from biosim_server.omex_sim.biosim1.models import BiosimSimulationRun, BiosimSimulationRunStatus, \
+    BiosimSimulatorSpec, Hdf5DataRef, HDF5File
+from biosim_server.omex_sim.workflows.result_cache_activities import CachedSimResults, get_cached_sim_results, \
+    GetCachedSimResultsInput, save_cached_sim_results, SaveCachedSimResultsInput, resolve_simulator_version, \
+    ResolveSimulatorVersionInput
+from tests.fixtures.biosim_service_mock import BiosimServiceMock
+
+
+@pytest.mark.asyncio
+async def test_result_cache(biosim_service_mock: BiosimServiceMock, file_service_local: FileServiceLocal) -> None:
+    content_hash = "0" * 64
+    activity_environment = ActivityEnvironment()
+
+    simulator_version = await activity_environment.run(
+        resolve_simulator_version, ResolveSimulatorVersionInput(simulator_spec=BiosimSimulatorSpec(simulator="copasi")))
+    assert simulator_version == "1.0"
+    lookup_input = GetCachedSimResultsInput(content_hash=content_hash, simulator="copasi",
+                                            simulator_version=simulator_version)
+    assert await activity_environment.run(get_cached_sim_results, lookup_input) is None
+
+    cached_sim_results = CachedSimResults(
+        biosim_run=BiosimSimulationRun(id="run_id", name="name", simulator="copasi", simulator_version="1.0",
+                                       simulator_digest="sha256:1234", status=BiosimSimulationRunStatus.SUCCEEDED),
+        hdf5_file=HDF5File(filename="reports.h5", id="run_id", uri="https://example.com/reports.h5", groups=[]),
+        result_datasets={"simulation.sedml/report": Hdf5DataRef(dataset_name="simulation.sedml/report", shape=[2, 3],
+                                                                s3_path="verify/sim_results/run_id/report.npy")})
+    await activity_environment.run(save_cached_sim_results,
+                                   SaveCachedSimResultsInput(content_hash=content_hash,
+                                                             cached_sim_results=cached_sim_results))
+
+    assert await activity_environment.run(get_cached_sim_results, lookup_input) == cached_sim_results
+    other_version_input = GetCachedSimResultsInput(content_hash=content_hash, simulator="copasi",
+                                                   simulator_version="2.0")
+    assert await activity_environment.run(get_cached_sim_results, other_version_input) is None
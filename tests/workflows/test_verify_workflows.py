@@ -1,20 +1,32 @@
+import asyncio
 import logging
 import uuid
 from pathlib import Path
 
+import numpy as np
 import pytest
-from temporalio.client import Client, WorkflowHandle
+from temporalio.client import Client, WorkflowHandle, WorkflowExecutionStatus, WorkflowFailureError
+from temporalio.exceptions import CancelledError
+from temporalio.service import RPCError
+from temporalio.testing import ActivityEnvironment
 from temporalio.worker import Worker
 
+from biosim_server.io.array_store import load_ndarray, save_ndarray
 from biosim_server.io.file_service_local import FileServiceLocal
 from biosim_server.omex_sim.biosim1.biosim_service_rest import BiosimServiceRest
 from biosim_server.omex_sim.biosim1.models import SourceOmex, BiosimSimulatorSpec, BiosimSimulationRunStatus, \
-    BiosimSimulationRun
+    BiosimSimulationRun, Hdf5DataRef
+from biosim_server.omex_sim.workflows.biosim_activities import sim_results_s3_path
 from biosim_server.omex_sim.workflows.omex_sim_workflow import OmexSimWorkflow, OmexSimWorkflowInput, \
     OmexSimWorkflowOutput, OmexSimWorkflowStatus
+from biosim_server.omex_sim.workflows.result_cache_activities import CachedSimResults, save_cached_sim_results, \
+    SaveCachedSimResultsInput
+from biosim_server.omex_sim.workflows.sim_run_poller_workflow import SimRunPollerWorkflow, TrackedSimRun, \
+    SIM_RUN_POLLER_WORKFLOW_ID
 from biosim_server.omex_verify.workflows.omex_verify_workflow import OmexVerifyWorkflow, OmexVerifyWorkflowInput, \
-    OmexVerifyWorkflowOutput
+    OmexVerifyWorkflowOutput, OmexVerifyWorkflowStatus
 from tests.fixtures.biosim_service_mock import BiosimServiceMock
+from tests.omex_verify.test_comparison import make_hdf5_file
 
 
 @pytest.mark.asyncio
@@ -49,12 +61,21 @@ async def test_sim_workflow(temporal_client: Client, temporal_verify_worker: Wor
                                        simulator_version=sim_spec.version or "latest",
                                        simulator_digest=uuid.uuid4().hex,
                                        status=BiosimSimulationRunStatus.SUCCEEDED),
-        result_s3_path='s3://bucket-name/results/vcell.output'
     )
     if expected_results.biosim_run and workflow_handle_result.biosim_run:
         expected_results.biosim_run.id = workflow_handle_result.biosim_run.id
         expected_results.biosim_run.simulator_version = workflow_handle_result.biosim_run.simulator_version
         expected_results.biosim_run.simulator_digest = workflow_handle_result.biosim_run.simulator_digest
+    assert workflow_handle_result.hdf5_file is not None
+    assert workflow_handle_result.result_datasets is not None and len(workflow_handle_result.result_datasets) > 0
+    assert workflow_handle_result.biosim_run is not None
+    assert workflow_handle_result.result_s3_path == sim_results_s3_path(workflow_handle_result.biosim_run.id)
+    for hdf5_data_ref in workflow_handle_result.result_datasets.values():
+        values = await load_ndarray(file_service_local, hdf5_data_ref.s3_path)
+        assert list(values.shape) == hdf5_data_ref.shape
+    expected_results.hdf5_file = workflow_handle_result.hdf5_file
+    expected_results.result_datasets = workflow_handle_result.result_datasets
+    expected_results.result_s3_path = workflow_handle_result.result_s3_path
     assert workflow_handle_result == expected_results
 
 
@@ -89,4 +110,96 @@ async def test_verify_workflow(temporal_client: Client,
     expected_results.workflow_run_id = workflow_handle_result.workflow_run_id
     expected_results.timestamp = workflow_handle_result.timestamp
     expected_results.workflow_status = workflow_handle_result.workflow_status
+    assert workflow_handle_result.workflow_results is not None
+    assert workflow_handle_result.workflow_results.compare_results is not None
+    assert len(workflow_handle_result.workflow_results.compare_results) == 1
+    expected_results.actual_simulators = workflow_handle_result.actual_simulators
+    expected_results.workflow_results = workflow_handle_result.workflow_results
     assert workflow_handle_result == expected_results
+
+
+@pytest.mark.asyncio
+async def test_verify_workflow_cancel(temporal_client: Client,
+                                      temporal_verify_worker: Worker,
+                                      verify_workflow_input: OmexVerifyWorkflowInput,
+                                      biosim_service_mock: BiosimServiceMock,
+                                      file_service_local: FileServiceLocal) -> None:
+    # the mocked runs stay RUNNING until they are cancelled
+    path_from_root = Path("local_data/BIOMD0000000010_tellurium_Negative_feedback_and_ultrasen.omex")
+    test_omex_file = Path(__file__).parent.parent.parent / path_from_root
+    s3_path = "path/to/model_to_cancel.omex"
+    await file_service_local.upload_file(file_path=test_omex_file, s3_path=s3_path)
+    verify_workflow_input.source_omex = SourceOmex(omex_s3_file=s3_path, name="name")
+
+    workflow_handle = await temporal_client.start_workflow(
+        OmexVerifyWorkflow.run,
+        args=[verify_workflow_input],
+        id=uuid.uuid4().hex,
+        task_queue="verification_tasks",
+    )
+
+    # wait until both child workflows submitted their run and registered it with the poller
+    poller_handle = temporal_client.get_workflow_handle(SIM_RUN_POLLER_WORKFLOW_ID)
+    tracked_runs: list[TrackedSimRun] = []
+    for _ in range(100):
+        try:
+            tracked_runs = await poller_handle.query(SimRunPollerWorkflow.get_tracked_runs)
+        except RPCError:
+            pass  # the poller is not started yet
+        if len(tracked_runs) == len(verify_workflow_input.requested_simulators):
+            break
+        await asyncio.sleep(0.1)
+    assert len(tracked_runs) == len(verify_workflow_input.requested_simulators)
+
+    await workflow_handle.cancel()
+    with pytest.raises(WorkflowFailureError) as exc_info:
+        await workflow_handle.result()
+    assert isinstance(exc_info.value.cause, CancelledError)
+
+    workflow_output = await workflow_handle.query("get_output", result_type=OmexVerifyWorkflowOutput)
+    assert workflow_output.workflow_status == OmexVerifyWorkflowStatus.CANCELLED
+    # the children are cancelled, no longer tracked by the poller, and cancelled their runs
+    for tracked_run in tracked_runs:
+        child_description = await temporal_client.get_workflow_handle(tracked_run.workflow_id).describe()
+        assert child_description.status == WorkflowExecutionStatus.CANCELED
+        assert biosim_service_mock.sim_runs[tracked_run.biosim_run_id].status == BiosimSimulationRunStatus.FAILED
+    assert await poller_handle.query(SimRunPollerWorkflow.get_tracked_runs) == []
+
+
+@pytest.mark.asyncio
+async def test_sim_workflow_cached_observables(temporal_client: Client, temporal_verify_worker: Worker,
+                                               biosim_service_mock: BiosimServiceMock,
+                                               file_service_local: FileServiceLocal) -> None:
+    # complete results of an earlier run of the same archive and simulator version
+    content_hash = uuid.uuid4().hex
+    hdf5_file = make_hdf5_file(labels=["time", "A", "B"], num_times=11)
+    s3_path = f"{sim_results_s3_path('cached_run_id')}/simulation.sedml/report.npy"
+    await save_ndarray(file_service_local, np.arange(33, dtype=np.float64).reshape(3, 11), s3_path)
+    cached_sim_results = CachedSimResults(
+        biosim_run=BiosimSimulationRun(id="cached_run_id", name="name", simulator="copasi", simulator_version="1.0",
+                                       simulator_digest="sha256:1234", status=BiosimSimulationRunStatus.SUCCEEDED),
+        hdf5_file=hdf5_file,
+        result_datasets={"simulation.sedml/report": Hdf5DataRef(dataset_name="simulation.sedml/report",
+                                                                shape=[3, 11], s3_path=s3_path)})
+    await ActivityEnvironment().run(save_cached_sim_results,
+                                    SaveCachedSimResultsInput(content_hash=content_hash,
+                                                              cached_sim_results=cached_sim_results))
+
+    sim_workflow_input = OmexSimWorkflowInput(
+        source_omex=SourceOmex(omex_s3_file="path/to/cached.omex", name="name", content_hash=content_hash),
+        simulator_spec=BiosimSimulatorSpec(simulator="copasi", version="1.0"),
+        observables=["A"])
+    sim_output: OmexSimWorkflowOutput = await temporal_client.execute_workflow(
+        OmexSimWorkflow.run,
+        args=[sim_workflow_input],
+        id=uuid.uuid4().hex,
+        task_queue="verification_tasks",
+    )
+
+    # the cached results are reused, reduced to the requested observable and the time row like fresh results
+    assert sim_output.workflow_status == OmexSimWorkflowStatus.COMPLETED
+    assert sim_output.biosim_run is not None and sim_output.biosim_run.id == "cached_run_id"
+    assert sim_output.dataset_rows == {"simulation.sedml/report": [0, 1]}
+    assert sim_output.hdf5_file is not None
+    assert sim_output.hdf5_file.groups[0].datasets[0].get_labels() == ["time", "A"]
+    assert sim_output.hdf5_file.groups[0].datasets[0].shape == [2, 11]